@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from ftw.pdfgenerator.exceptions import BuildRejected
+from ftw.pdfgenerator.interfaces import IConfig
+from zope.component import getUtility
+import threading
+import time
+
+
+# Seconds a client should wait before retrying a rejected build, when there
+# is no queue timeout configured.
+DEFAULT_RETRY_AFTER = 30
+
+_admission_control = []
+_admission_control_lock = threading.Lock()
+
+
+class AdmissionControl(object):
+    """Limits the amount of builds running at the same time in this
+    process.
+
+    Builds exceeding `max_concurrent` wait in a queue. A build is rejected
+    with `BuildRejected` when there are already `max_queue` builds waiting
+    or when it waited for more than `timeout` seconds. Every limit is
+    disabled with `None`.
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None, timeout=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def admit(self):
+        """Context manager running the build in the block when admitted.
+        """
+        self._acquire()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running -= 1
+                # Notify all waiting builds, since a build which timed out
+                # may consume a single notification.
+                self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            return {'running': self.running,
+                    'queued': self.queued,
+                    'admitted': self.admitted,
+                    'rejected': self.rejected,
+                    'timed_out': self.timed_out,
+                    'total_wait_time': self.total_wait_time,
+                    'max_wait_time': self.max_wait_time}
+
+    def _acquire(self):
+        with self._condition:
+            if not self._is_full():
+                self._admit(0)
+                return
+
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise BuildRejected('The build queue is full.',
+                                    retry_after=self._get_retry_after())
+
+            start = time.time()
+            self.queued += 1
+            try:
+                while self._is_full():
+                    remaining = None
+                    if self.timeout is not None:
+                        remaining = self.timeout - (time.time() - start)
+                        if remaining <= 0:
+                            self.rejected += 1
+                            self.timed_out += 1
+                            raise BuildRejected(
+                                'Timeout while waiting in the build queue.',
+                                retry_after=self._get_retry_after())
+
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self._admit(time.time() - start)
+
+    def _admit(self, wait_time):
+        self.running += 1
+        self.admitted += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def _is_full(self):
+        return (self.max_concurrent is not None and
+                self.running >= self.max_concurrent)
+
+    def _get_retry_after(self):
+        return int(self.timeout or DEFAULT_RETRY_AFTER)
+
+
+def get_admission_control():
+    """Returns the process wide admission control, configured with the
+    `IConfig` utility on first use.
+    """
+    with _admission_control_lock:
+        if not _admission_control:
+            config = getUtility(IConfig)
+            # Third party config utilities may not know about the limits.
+            _admission_control.append(AdmissionControl(
+                    max_concurrent=getattr(config, 'max_concurrent_builds',
+                                           None),
+                    max_queue=getattr(config, 'max_queued_builds', None),
+                    timeout=getattr(config, 'build_queue_timeout', None)))
+        return _admission_control[0]
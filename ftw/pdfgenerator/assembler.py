@@ -1,9 +1,14 @@
 from Products.Archetypes.utils import contentDispositionHeader
+from StringIO import StringIO
+from ftw.pdfgenerator.executor import chain_future
+from ftw.pdfgenerator.executor import completed_future
 from ftw.pdfgenerator.interfaces import IBuilderFactory
 from ftw.pdfgenerator.interfaces import ILaTeXLayout
 from ftw.pdfgenerator.interfaces import IPDFAssembler
+from ftw.pdfgenerator.interfaces import IPDFCache
+from ftw.pdfgenerator.streaming import BuildStreamIterator
 from zope.component import adapts
-from zope.component import getMultiAdapter, getUtility
+from zope.component import getMultiAdapter, getUtility, queryUtility
 from zope.interface import implements, Interface
 
 
@@ -18,12 +23,18 @@ class PDFAssembler(object):
         self._view = None
         self._builder = None
 
-    def build_pdf(self, layout=None, builder=None, request=None, filename=None):
+    def build_pdf(self, layout=None, builder=None, request=None, filename=None,
+                  stream=False):
         self._layout = layout
         self._builder = builder
 
         latex = self.render_latex()
-        data = self.get_builder().build(latex)
+        if stream and request:
+            return self._stream_to_response(
+                request, self._build_pdf_stream(latex), 'pdf',
+                filename=filename)
+
+        data = self._build_pdf(latex)
 
         if not request:
             return data
@@ -40,12 +51,29 @@ class PDFAssembler(object):
         self.get_builder().cleanup()
         return latex
 
-    def build_zip(self, layout=None, builder=None, request=None, filename=None):
+    def build_profile(self, layout=None, builder=None, request=None,
+                      filename=None):
+        self._layout = layout
+        self._builder = builder
+
+        profile = self.get_layout().get_converter().start_profiling()
+        self.render_latex()
+        self.get_builder().cleanup()
+        return profile
+
+    def build_zip(self, layout=None, builder=None, request=None, filename=None,
+                  stream=False):
         self._layout = layout
         self._builder = builder
 
         latex = self.render_latex()
-        data = self.get_builder().build_zip(latex).read()
+        zip_file = self.get_builder().build_zip(latex)
+        if stream and request:
+            return self._stream_to_response(
+                request, BuildStreamIterator(zip_file), 'zip',
+                filename=filename)
+
+        data = zip_file.read()
 
         if not request:
             return data
@@ -53,6 +81,31 @@ class PDFAssembler(object):
         else:
             return self._attach_to_response(request, data, 'zip', filename=filename)
 
+    def build_pdf_async(self, layout=None, builder=None, registry=None):
+        self._layout = layout
+        self._builder = builder
+
+        # The LaTeX is rendered in the current thread, since rendering
+        # needs the context, the request and the security context.
+        latex = self.render_latex()
+        future = self._build_pdf_async(latex)
+
+        if registry is not None:
+            registry.register(future, context=self.context, output='pdf')
+        return future
+
+    def build_zip_async(self, layout=None, builder=None, registry=None):
+        self._layout = layout
+        self._builder = builder
+
+        latex = self.render_latex()
+        future = chain_future(self.get_builder().build_zip_async(latex),
+                              lambda data: data.read())
+
+        if registry is not None:
+            registry.register(future, context=self.context, output='zip')
+        return future
+
     def get_builder(self):
         """Returns the IBuilder instance.
         """
@@ -73,10 +126,87 @@ class PDFAssembler(object):
         """Renders the LaTeX for the configured view and layout.
         """
         layout = self.get_layout()
+        # The resolved links are only cached for the duration of a build.
+        layout.get_converter().link_resolver = None
         content_latex = layout.render_latex_for(self.context)
         return layout.render_latex(content_latex)
 
+    def _build_pdf(self, latex):
+        """Builds the PDF with the builder or returns it from the PDF cache
+        when the LaTeX and the files added to the builder did not change.
+        """
+        cache, key = self._get_cache_key(latex)
+        data = key and cache.get(key)
+        if data is not None:
+            self.get_builder().cleanup()
+            return data
+
+        data = self.get_builder().build(latex)
+        if key:
+            cache.set(key, data)
+        return data
+
+    def _build_pdf_stream(self, latex):
+        """Like `_build_pdf`, but returns the PDF as a stream iterator
+        reading from the build directory instead of loading it into memory.
+        The PDF is only loaded when it is stored in the PDF cache.
+        """
+        cache, key = self._get_cache_key(latex)
+        builder = self.get_builder()
+        # Third party builders may not support streaming.
+        if key or not hasattr(builder, 'build_stream'):
+            data = self._build_pdf(latex)
+            return BuildStreamIterator(StringIO(data), size=len(data))
+
+        return builder.build_stream(latex)
+
+    def _build_pdf_async(self, latex):
+        """Like `_build_pdf`, but builds the PDF in the background and
+        returns a future.
+        """
+        cache, key = self._get_cache_key(latex)
+        data = key and cache.get(key)
+        if data is not None:
+            self.get_builder().cleanup()
+            return completed_future(data)
+
+        future = self.get_builder().build_async(latex)
+        if not key:
+            return future
+
+        def store(data):
+            cache.set(key, data)
+            return data
+
+        return chain_future(future, store)
+
+    def _get_cache_key(self, latex):
+        """Returns the PDF cache and the key of the PDF in the cache or
+        `None` when the cache is not used.
+        """
+        builder = self.get_builder()
+        cache = queryUtility(IPDFCache)
+        if cache is None or not cache.enabled:
+            return None, None
+
+        # Third party builders may not provide the digests of their files.
+        if not hasattr(builder, 'get_file_digests'):
+            return None, None
+
+        return cache, cache.get_key(latex, builder.get_file_digests())
+
     def _attach_to_response(self, request, data, extension, filename=None):
+        self._set_response_headers(request, extension, filename=filename)
+        request.RESPONSE.write(data)
+        return request
+
+    def _stream_to_response(self, request, iterator, extension,
+                            filename=None):
+        self._set_response_headers(request, extension, filename=filename)
+        request.RESPONSE.setHeader('Content-Length', str(len(iterator)))
+        return iterator
+
+    def _set_response_headers(self, request, extension, filename=None):
         if not filename:
             filename = self.context.id
 
@@ -93,6 +223,3 @@ class PDFAssembler(object):
             'Content-disposition',
             contentDispositionHeader(
                 'attachment', 'utf-8', filename=filename))
-
-        response.write(data)
-        return request
@@ -0,0 +1,5 @@
+from ftw.pdfgenerator.benchmark.runner import main
+import sys
+
+
+sys.exit(main())
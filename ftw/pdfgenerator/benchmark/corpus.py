@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import random
+
+
+# The corpora are generated with seeded random number generators, so the
+# same HTML is benchmarked on every run.
+DEFAULT_SEED = 4
+
+WORDS = (
+    'lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing',
+    'elit', 'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore',
+    'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam',
+    'quis', 'nostrud', 'exercitation', 'ullamco', 'laboris', 'nisi',
+    'aliquip', 'ex', 'ea', 'commodo', 'consequat', 'Gem\xc3\xa4ss',
+    'Art.', 'z.B.', '50%', 'e-mail', '"Zitat"', 'Fr. 20.--', 'a & b',
+    )
+
+INLINE_TAGS = ('b', 'i', 'em', 'strong', 'u', 'sup', 'sub')
+
+ENTITIES = (
+    '&amp;', '&lt;', '&gt;', '&nbsp;', '&auml;', '&ouml;', '&uuml;',
+    '&Auml;', '&eacute;', '&egrave;', '&ccedil;', '&szlig;', '&euro;',
+    '&sect;', '&ndash;', '&mdash;', '&laquo;', '&raquo;', '&rsquo;',
+    '&ldquo;', '&rdquo;', '&hellip;', '&deg;', '&copy;', '&#228;',
+    '&#8364;', '&#x201e;', '&#x2013;', '&frac12;', '&times;',
+    )
+
+
+def words(rnd, amount):
+    return ' '.join(rnd.choice(WORDS) for _i in range(amount))
+
+
+def sentence(rnd):
+    """Returns a sentence with some inline formatting.
+    """
+    parts = []
+    for _i in range(rnd.randint(2, 5)):
+        text = words(rnd, rnd.randint(2, 8))
+        if rnd.random() < 0.3:
+            tag = rnd.choice(INLINE_TAGS)
+            text = '<%s>%s</%s>' % (tag, text, tag)
+        parts.append(text)
+    return ' '.join(parts).capitalize() + '.'
+
+
+def long_prose(rnd, paragraphs=200):
+    """Paragraphs of formatted text with some headings and line breaks.
+    """
+    html = []
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            html.append('<h%i>%s</h%i>' % (
+                    index % 3 + 1, words(rnd, 4), index % 3 + 1))
+
+        text = ' '.join(sentence(rnd) for _i in range(rnd.randint(3, 8)))
+        if rnd.random() < 0.1:
+            text += '<br />' + sentence(rnd)
+        html.append('<p>%s</p>' % text)
+
+    return '\n'.join(html)
+
+
+def huge_table(rnd, rows=300, columns=8):
+    """A table with a header row and cells spanning multiple columns and
+    rows.
+    """
+    html = ['<table class="listing">', '<thead><tr>']
+    html.extend('<th>%s</th>' % words(rnd, 2) for _i in range(columns))
+    html.append('</tr></thead><tbody>')
+
+    # Amount of further rows covered by a rowspan, per column.
+    covered = [0] * columns
+    for _row in range(rows):
+        html.append('<tr>')
+        column = 0
+        while column < columns:
+            if covered[column]:
+                covered[column] -= 1
+                column += 1
+                continue
+
+            attributes = ''
+            colspan = 1
+            chance = rnd.random()
+            if chance < 0.05 and column + 1 < columns and \
+                    not covered[column + 1]:
+                colspan = 2
+                attributes = ' colspan="2"'
+
+            elif chance < 0.1:
+                rowspan = rnd.randint(2, 3)
+                covered[column] = rowspan - 1
+                attributes = ' rowspan="%i"' % rowspan
+
+            html.append('<td%s>%s</td>' % (
+                    attributes, words(rnd, rnd.randint(1, 6))))
+            column += colspan
+
+        html.append('</tr>')
+
+    html.append('</tbody></table>')
+    return ''.join(html)
+
+
+def nested_lists(rnd, items=30, depth=6):
+    """Ordered, unordered and definition lists nested `depth` levels
+    deep.
+    """
+
+    def build(level):
+        if level == depth:
+            return words(rnd, 3)
+
+        tag = ('ul', 'ol')[level % 2]
+        html = ['<%s>' % tag]
+        for index in range(rnd.randint(2, 4)):
+            item = sentence(rnd)
+            if index == 0:
+                item += build(level + 1)
+            html.append('<li>%s</li>' % item)
+        html.append('</%s>' % tag)
+        return ''.join(html)
+
+    html = []
+    for index in range(items):
+        html.append(build(0))
+        if index % 5 == 0:
+            html.append('<dl><dt>%s</dt><dd>%s</dd></dl>' % (
+                    words(rnd, 2), sentence(rnd)))
+        html.append('<p>%s</p>' % sentence(rnd))
+
+    return '\n'.join(html)
+
+
+def link_heavy(rnd, paragraphs=100):
+    """Text with absolute, relative and mailto links and plain URLs.
+    """
+    html = []
+    for index in range(paragraphs):
+        links = []
+        for number in range(rnd.randint(3, 8)):
+            kind = (index + number) % 4
+            if kind == 0:
+                href = 'http://www.example.com/%s/page_%i' % (
+                    rnd.choice(WORDS[:20]), number)
+            elif kind == 1:
+                href = './%s/document-%i' % (rnd.choice(WORDS[:20]), number)
+            elif kind == 2:
+                href = 'mailto:info%i@example.com' % number
+            else:
+                links.append('http://www.example.com/?q=%i' % number)
+                continue
+
+            links.append('<a href="%s">%s</a>' % (href, words(rnd, 2)))
+
+        html.append('<p>%s %s.</p>' % (words(rnd, 5), ', '.join(links)))
+
+    return '\n'.join(html)
+
+
+def entity_heavy(rnd, paragraphs=100):
+    """Text with many named and numeric HTML entities.
+    """
+    html = []
+    for _i in range(paragraphs):
+        parts = []
+        for _j in range(rnd.randint(10, 30)):
+            parts.append(rnd.choice(WORDS))
+            parts.append(rnd.choice(ENTITIES))
+        html.append('<p>%s</p>' % ' '.join(parts))
+
+    return '\n'.join(html)
+
+
+CORPUS_GENERATORS = OrderedDict((
+        ('prose', long_prose),
+        ('table', huge_table),
+        ('lists', nested_lists),
+        ('links', link_heavy),
+        ('entities', entity_heavy),
+        ))
+
+
+def get_corpus(names=None, seed=DEFAULT_SEED):
+    """Returns an ordered dict of the corpus name and the generated HTML.
+    All corpora are generated when no `names` are passed.
+    """
+    corpus = OrderedDict()
+    for index, (name, generator) in enumerate(CORPUS_GENERATORS.items()):
+        if names is None or name in names:
+            # Each corpus has its own generator, so a corpus does not change
+            # when another one is changed or left out.
+            corpus[name] = generator(random.Random(seed * 100 + index))
+    return corpus
@@ -0,0 +1,266 @@
+from ftw.pdfgenerator.benchmark.corpus import CORPUS_GENERATORS
+from ftw.pdfgenerator.benchmark.corpus import DEFAULT_SEED
+from ftw.pdfgenerator.benchmark.corpus import get_corpus
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
+from ftw.pdfgenerator.html2latex.parser import get_available_parsers
+from ftw.pdfgenerator.html2latex.parser import get_parser
+import argparse
+import json
+import math
+import multiprocessing
+import resource
+import sys
+import time
+
+
+DEFAULT_REPEAT = 10
+
+# Allowed relative regression of each metric compared to the baseline.
+# The throughput may decrease, the other metrics may increase by this
+# fraction.
+DEFAULT_THRESHOLDS = {
+    'throughput': 0.2,
+    'p50': 0.2,
+    'p95': 0.3,
+    'peak_memory': 0.25,
+    }
+
+# Metrics where a higher value is better.
+HIGHER_IS_BETTER = ('throughput', )
+
+METRICS = (
+    ('size', 'Size (KB)'),
+    ('throughput', 'KB/s'),
+    ('p50', 'p50 (ms)'),
+    ('p95', 'p95 (ms)'),
+    ('peak_memory', 'Peak memory (KB)'),
+    )
+
+
+class StubContext(object):
+    """Context of the benchmarked converter. Relative links are made
+    absolute with its URL.
+    """
+
+    def absolute_url(self):
+        return 'http://nohost/plone/benchmark'
+
+
+class StubLayout(object):
+    """Layout of the benchmarked converter, which ignores the packages used
+    by the subconverters.
+    """
+
+    def use_package(self, *args, **kwargs):
+        pass
+
+    def remove_package(self, *args, **kwargs):
+        pass
+
+    def use_babel(self, *args, **kwargs):
+        pass
+
+
+def get_peak_memory():
+    """Returns the peak resident memory of the process in KB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Darwin reports bytes instead of KB.
+        peak /= 1024
+    return peak
+
+
+def percentile(values, fraction):
+    """Returns the value at `fraction` (0 to 1) of the sorted `values`
+    (nearest rank).
+    """
+    values = sorted(values)
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+def measure(html, repeat=DEFAULT_REPEAT, parser=None):
+    """Converts `html` `repeat` times after converting it once for warming
+    up and returns the metrics as dict. The subconverters use the HTML
+    `parser` (the default parser when `None`).
+
+    The peak memory is the growth of the peak resident memory of the
+    process while converting, which is only meaningful when the process did
+    not convert larger HTML before (see `run_benchmarks`).
+    """
+    memory_before = get_peak_memory()
+    converter = HTML2LatexConverter(StubContext(), None, StubLayout())
+    converter.convert_cache = None
+    converter.html_parser = get_parser(parser)
+    converter.convert(html)
+
+    latencies = []
+    for _i in range(repeat):
+        start = time.time()
+        converter.convert(html)
+        latencies.append(time.time() - start)
+
+    size = len(html) / 1024.0
+    return {'size': round(size, 1),
+            'throughput': round(size * repeat / max(sum(latencies), 1e-9),
+                                1),
+            'p50': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'peak_memory': get_peak_memory() - memory_before}
+
+
+def run_benchmarks(corpus, repeat=DEFAULT_REPEAT, isolate=True,
+                   parser=None):
+    """Measures the conversion of each HTML of the ordered dict `corpus`
+    and returns the metrics by name. With `isolate`, each HTML is measured
+    in a new process, so that the peak memory of the corpora is measured
+    independently.
+    """
+    if not isolate:
+        return dict((name, measure(html, repeat, parser))
+                    for name, html in corpus.items())
+
+    results = {}
+    for name, html in corpus.items():
+        pool = multiprocessing.Pool(processes=1)
+        try:
+            results[name] = pool.apply(measure, (html, repeat, parser))
+        finally:
+            pool.terminate()
+            pool.join()
+    return results
+
+
+def compare_parsers(corpus, parsers, repeat=DEFAULT_REPEAT, isolate=True):
+    """Measures the corpus with each of the HTML `parsers` and returns the
+    metrics by the corpus name and the parser name (e.g. "table:lxml").
+    """
+    results = {}
+    for parser in parsers:
+        for name, result in run_benchmarks(corpus, repeat, isolate,
+                                           parser).items():
+            results['%s:%s' % (name, parser)] = result
+    return results
+
+
+def compare(results, baseline, thresholds=None):
+    """Compares the `results` with the `baseline` results and returns a
+    list of messages describing the regressions exceeding the
+    `thresholds`.
+    """
+    limits = dict(DEFAULT_THRESHOLDS)
+    limits.update(thresholds or {})
+
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+
+        for metric, threshold in sorted(limits.items()):
+            expected = baseline[name].get(metric)
+            value = results[name].get(metric)
+            if not expected or value is None:
+                continue
+
+            change = (value - expected) / float(expected)
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+
+            if change > threshold:
+                regressions.append(
+                    '%s: %s regressed by %i%% (%s, baseline %s)' % (
+                        name, metric, round(change * 100), value, expected))
+
+    return regressions
+
+
+def format_results(results):
+    """Returns the results as lines of a text table.
+    """
+    columns = [('Corpus', sorted(results))]
+    for metric, title in METRICS:
+        columns.append((title, [str(results[name][metric])
+                                for name in sorted(results)]))
+
+    widths = [max([len(title)] + map(len, values))
+              for title, values in columns]
+    rows = [[title for title, _values in columns]]
+    rows.extend(zip(*[values for _title, values in columns]))
+    return ['  '.join(value.ljust(width) for value, width
+                      in zip(row, widths)).rstrip()
+            for row in rows]
+
+
+def parse_threshold(value):
+    metric, _sep, threshold = value.partition('=')
+    if metric not in DEFAULT_THRESHOLDS:
+        raise argparse.ArgumentTypeError('Unknown metric "%s"' % metric)
+
+    try:
+        return metric, float(threshold)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'Invalid threshold "%s"' % threshold)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the HTML to LaTeX converter.')
+    parser.add_argument(
+        '--corpus', action='append', choices=list(CORPUS_GENERATORS),
+        help='Benchmark only this corpus (repeatable).')
+    parser.add_argument(
+        '--repeat', type=int, default=DEFAULT_REPEAT,
+        help='Conversions per corpus (default: %(default)s).')
+    parser.add_argument(
+        '--seed', type=int, default=DEFAULT_SEED,
+        help='Seed for generating the corpora (default: %(default)s).')
+    parser.add_argument(
+        '--baseline', metavar='FILE',
+        help='Compare the results with the baseline in this JSON file.')
+    parser.add_argument(
+        '--save-baseline', metavar='FILE',
+        help='Store the results as baseline in this JSON file.')
+    parser.add_argument(
+        '--threshold', action='append', type=parse_threshold, default=[],
+        metavar='METRIC=FRACTION',
+        help='Allowed regression of a metric, e.g. "p95=0.5" (repeatable).')
+    parser.add_argument(
+        '--no-isolate', dest='isolate', action='store_false',
+        help='Measure all corpora in this process.')
+    parser.add_argument(
+        '--parser', action='append', choices=get_available_parsers(),
+        help='HTML parser of the subconverters (default: the fastest). '
+        'Repeat for comparing parsers.')
+    options = parser.parse_args(argv)
+
+    corpus = get_corpus(options.corpus, seed=options.seed)
+    if options.parser and len(options.parser) > 1:
+        results = compare_parsers(corpus, options.parser,
+                                  repeat=options.repeat,
+                                  isolate=options.isolate)
+    else:
+        results = run_benchmarks(corpus, repeat=options.repeat,
+                                 isolate=options.isolate,
+                                 parser=options.parser and options.parser[0])
+    print '\n'.join(format_results(results))
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as file_:
+            json.dump(results, file_, indent=2, sort_keys=True)
+
+    if not options.baseline:
+        return 0
+
+    with open(options.baseline) as file_:
+        baseline = json.load(file_)
+
+    regressions = compare(results, baseline, dict(options.threshold))
+    if not regressions:
+        print '\nNo regressions compared to %s.' % options.baseline
+        return 0
+
+    print '\nRegressions compared to %s:' % options.baseline
+    print '\n'.join(regressions)
+    return 1
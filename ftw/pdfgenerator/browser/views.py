@@ -1,28 +1,78 @@
+from ftw.pdfgenerator import _
+from ftw.pdfgenerator.admission import get_admission_control
+from ftw.pdfgenerator.exceptions import BuildRejected
 from ftw.pdfgenerator.interfaces import DEBUG_MODE_COOKIE_KEY
+from ftw.pdfgenerator.interfaces import IBuildJobRegistry
 from ftw.pdfgenerator.interfaces import IPDFAssembler
+from ftw.pdfgenerator.jobs import FINISHED
+from ftw.pdfgenerator.streaming import BuildStreamIterator
 from plone import api
 from Products.Five import BrowserView
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
-from zope.component import getMultiAdapter
+from zExceptions import NotFound
+from zope.component import getMultiAdapter, getUtility
+from zope.i18n import translate
+import inspect
+import json
+
+
+def get_user_id():
+    if api.user.is_anonymous():
+        return None
+    return api.user.get_current().getId()
+
+
+def supports_streaming(method):
+    """Returns `True` when the build `method` of an assembler accepts the
+    `stream` argument. Third party assemblers may not support streaming.
+    """
+    try:
+        spec = inspect.getargspec(method)
+    except TypeError:
+        return False
+    return 'stream' in spec.args or spec.keywords is not None
 
 
 class ExportPDFView(BrowserView):
     """Export a PDF with default settings. If the user is a Admin (if he
     has Manage portal permission), a additional form will be shown, where
-    he can selected the desired output format (PDF, LaTeX only or ZIP).
+    he can selected the desired output format (PDF, LaTeX only, ZIP or a
+    profile of the HTML to LaTeX conversion).
     """
 
     index = ViewPageTemplateFile('export_pdf.pt')
+    profile_template = ViewPageTemplateFile('conversion_profile.pt')
 
     def __call__(self):
+        output = 'pdf'
         if self.allow_alternate_output():
-            if self.request.get('submitted', False):
-                output = self.request.get('output')
-                return self.export(output)
+            if not self.request.get('submitted', False):
+                return self.index()
+
+            output = self.request.get('output')
 
-            return self.index()
+        try:
+            if self.request.get('background', False):
+                return self.export_background(output)
 
-        return self.export()
+            return self.export(output)
+
+        except BuildRejected, exc:
+            return self.build_rejected(exc)
+
+    def build_rejected(self, exc):
+        """Responds with "503 Service Unavailable" when the build was not
+        admitted because of too many running builds.
+        """
+        response = self.request.response
+        response.setStatus(503)
+        response.setHeader('Retry-After', str(exc.retry_after))
+        response.setHeader('Content-Type', 'text/plain; charset=utf-8')
+        return translate(
+            _(u'msg_build_rejected',
+              default=u'Too many PDF exports are running at the moment. '
+              u'Please try again later.'),
+            context=self.request).encode('utf-8')
 
     def allow_alternate_output(self):
         """For selecting the output format, the user must have Manage portal
@@ -46,20 +96,135 @@ class ExportPDFView(BrowserView):
                                     IPDFAssembler)
 
         if output == 'pdf':
-            return assembler.build_pdf(**self.get_build_arguments())
+            return assembler.build_pdf(**self.get_streaming_arguments(
+                    assembler.build_pdf))
 
         elif output == 'latex':
             return assembler.build_latex(**self.get_build_arguments())
 
         elif output == 'zip':
-            return assembler.build_zip(**self.get_build_arguments())
+            return assembler.build_zip(**self.get_streaming_arguments(
+                    assembler.build_zip))
+
+        elif output == 'profile':
+            self.profile = assembler.build_profile(
+                **self.get_build_arguments())
+            return self.profile_template()
 
         else:
             raise ValueError('Unkown output "%s"' % output)
 
+    def export_background(self, output='pdf'):
+        """Builds the PDF or ZIP in the background and returns the job id
+        and the URLs for polling the status and downloading the result as
+        JSON.
+        """
+        if output not in ('pdf', 'zip'):
+            raise ValueError('Unkown output "%s"' % output)
+
+        assembler = getMultiAdapter((self.context, self.request),
+                                    IPDFAssembler)
+
+        arguments = self.get_build_arguments()
+        arguments.pop('request', None)
+        filename = arguments.pop('filename', None)
+
+        job_id = getUtility(IBuildJobRegistry).submit(
+            assembler, output, filename=filename, user_id=get_user_id(),
+            **arguments)
+
+        url = self.context.absolute_url()
+        self.request.response.setHeader('Content-Type', 'application/json')
+        return json.dumps({
+                'job': job_id,
+                'status_url': '%s/@@pdf-export-status?job=%s' % (url, job_id),
+                'download_url': '%s/@@pdf-export-download?job=%s' % (
+                    url, job_id)})
+
     def get_build_arguments(self):
         return {'request': self.request}
 
+    def get_streaming_arguments(self, method):
+        """Returns the build arguments for the build `method`, streaming the
+        result when the method supports it.
+        """
+        arguments = self.get_build_arguments()
+        if supports_streaming(method):
+            arguments['stream'] = True
+        return arguments
+
+    def get_profile_rows(self):
+        """Returns the entries of the conversion profile for the profile
+        table, the slowest first, with the time in milliseconds.
+        """
+        rows = []
+        for entry in self.profile.get_rows():
+            row = dict(entry)
+            row['time'] = '%.2f' % (entry['time'] * 1000)
+            rows.append(row)
+        return rows
+
+
+class ExportJobView(BrowserView):
+    """Base class for views of background export jobs. The job is only
+    visible to the user who started it.
+    """
+
+    def get_job(self):
+        job = getUtility(IBuildJobRegistry).get_job(self.request.get('job'))
+        if job is None or job.get('user') != get_user_id():
+            raise NotFound('Unknown job')
+        return job
+
+
+class ExportStatusView(ExportJobView):
+    """Returns the status of a background export job as JSON.
+    """
+
+    def __call__(self):
+        job = self.get_job()
+        status = {'state': job['state'],
+                  'stage': job.get('stage'),
+                  'current': job.get('current'),
+                  'total': job.get('total'),
+                  'error': job.get('error')}
+
+        if job['state'] == FINISHED:
+            status['download_url'] = '%s/@@pdf-export-download?job=%s' % (
+                self.context.absolute_url(), job['id'])
+
+        self.request.response.setHeader('Content-Type', 'application/json')
+        return json.dumps(status)
+
+
+class ExportDownloadView(ExportJobView):
+    """Returns the result of a finished background export job.
+    """
+
+    def __call__(self):
+        job = self.get_job()
+        path = getUtility(IBuildJobRegistry).get_result_path(job['id'])
+        if path is None:
+            raise NotFound('The job is not finished.')
+
+        # The headers are set by the assembler, like when streaming the
+        # result of a build in the foreground.
+        assembler = getMultiAdapter((self.context, self.request),
+                                    IPDFAssembler)
+        return assembler._stream_to_response(
+            self.request, BuildStreamIterator.from_path(path), job['output'],
+            filename=job.get('filename') or self.context.getId())
+
+
+class BuildStatsView(BrowserView):
+    """Returns the metrics of the build admission control of this process
+    (running and queued builds, wait times) as JSON.
+    """
+
+    def __call__(self):
+        self.request.response.setHeader('Content-Type', 'application/json')
+        return json.dumps(get_admission_control().get_stats())
+
 
 class DebugPDFGeneratorView(BrowserView):
     """This view allows to toggle the pdfgenerator debug mode.
@@ -1,47 +1,100 @@
-from StringIO import StringIO
+from ftw.pdfgenerator.admission import get_admission_control
+from ftw.pdfgenerator.exceptions import BuildRejected
 from ftw.pdfgenerator.exceptions import BuildTerminated, PDFBuildFailed
+from ftw.pdfgenerator.executor import get_executor
+from ftw.pdfgenerator.formatcache import FORMAT_EXTENSION
+from ftw.pdfgenerator.formatcache import FormatCache
 from ftw.pdfgenerator.interfaces import IBuilder, IConfig
-from zipfile import ZipFile
+from ftw.pdfgenerator.limits import get_resource_limits
+from ftw.pdfgenerator.rerun import FIRST_PASS, RerunChecker
+from ftw.pdfgenerator.streaming import BuildStreamIterator
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 from zope.component import getUtility
 from zope.interface import implements
+import hashlib
+import logging
 import os
 import shlex
 import shutil
 import subprocess
+import tempfile
 
 
+LOG = logging.getLogger('ftw.pdfgenerator')
+
 RESOURCES_DIR = os.path.abspath(os.path.join(__file__, '..', 'resources'))
 
+# Default maximum size of the format cache in bytes.
+DEFAULT_FORMAT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Files in the build directory which may be loaded by the preamble and
+# therefore invalidate a cached format when changed.
+FORMAT_SUPPORT_FILE_EXTENSIONS = ('.sty', '.cls', '.cfg', '.def', '.tex',
+                                  '.clo', '.fd')
+
+# ZIP bundles up to this size in bytes are kept in memory, larger bundles
+# are written to a temporary file.
+ZIP_SPOOL_SIZE = 4 * 1024 * 1024
+
+# Files which are already compressed and are stored without compression in
+# ZIP bundles.
+COMPRESSED_FILE_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.gif',
+                              '.zip', '.gz')
+
+# The version of the pdflatex engine is only looked up once per process.
+_ENGINE_VERSION = []
+
 
 class Builder(object):
     implements(IBuilder)
 
-    def __init__(self):
+    rerun_checker_class = RerunChecker
+
+    def __init__(self, build_directory=None):
         self.config = getUtility(IConfig)
-        self.build_directory = self.config.get_build_directory()
+        self.build_directory = (build_directory or
+                                self.config.get_build_directory())
         self._terminated = False
-        self._aux_data = None
+        self._rerun_checker = self.rerun_checker_class(self.build_directory)
+        self._limits = get_resource_limits()
         self._rerun_limit = 10
+        self.rerun_reasons = []
+        self.progress_callback = None
+        self._passes = 0
+        self._last_pass_draft = False
+        self._file_digests = {}
+        self._format = None
+        self._format_cache = self._get_format_cache()
 
     def add_file(self, filename, data):
         if self._terminated:
             raise BuildTerminated('The build is already terminated.')
 
         path = os.path.join(self.build_directory, filename)
+        digest = hashlib.sha1()
         with open(path, 'wb') as fio:
             if hasattr(data, 'read'):
-                shutil.copyfileobj(data, fio)
+                for chunk in iter(lambda: data.read(16 * 1024), ''):
+                    digest.update(chunk)
+                    fio.write(chunk)
             else:
+                digest.update(data)
                 fio.write(data)
 
+        self._file_digests[filename] = digest.hexdigest()
+
+    def get_file_digests(self):
+        return ['%s:%s' % item for item in sorted(self._file_digests.items())]
+
     def build(self, latex):
         if self._terminated:
             raise BuildTerminated('The build is already terminated.')
 
         try:
-            pdf_path = self._build_pdf(latex)
+            with get_admission_control().admit():
+                pdf_path = self._build_pdf(latex)
 
-        except PDFBuildFailed:
+        except (PDFBuildFailed, BuildRejected):
             self._cleanup_build()
             raise
 
@@ -52,21 +105,52 @@ class Builder(object):
             self._cleanup_build()
             return data
 
+    def build_stream(self, latex):
+        if self._terminated:
+            raise BuildTerminated('The build is already terminated.')
+
+        try:
+            with get_admission_control().admit():
+                pdf_path = self._build_pdf(latex)
+
+        except (PDFBuildFailed, BuildRejected):
+            self._cleanup_build()
+            raise
+
+        return BuildStreamIterator.from_path(pdf_path, cleanup=self.cleanup)
+
     def build_zip(self, latex):
         if self._terminated:
             raise BuildTerminated('The build is already terminated.')
 
         try:
-            self._build_pdf(latex)
+            with get_admission_control().admit():
+                self._build_pdf(latex)
 
         except PDFBuildFailed:
             pass
-        data = StringIO()
-        zip_file = ZipFile(data, 'w')
+
+        except BuildRejected:
+            self._cleanup_build()
+            raise
+
+        data = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE)
+        zip_file = ZipFile(data, 'w', allowZip64=True)
+        # Third party config utilities may not know about the option.
+        deflate = getattr(self.config, 'zip_deflate', True)
 
         for filename in os.listdir(self.build_directory):
+            if self._format and filename == self._format + FORMAT_EXTENSION:
+                continue
+
+            if deflate and not filename.lower().endswith(
+                    COMPRESSED_FILE_EXTENSIONS):
+                compression = ZIP_DEFLATED
+            else:
+                compression = ZIP_STORED
+
             zip_file.write(os.path.join(self.build_directory, filename),
-                      filename)
+                           filename, compression)
 
         zip_file.close()
         data.seek(0)
@@ -74,6 +158,18 @@ class Builder(object):
         self._cleanup_build()
         return data
 
+    def build_async(self, latex):
+        if self._terminated:
+            raise BuildTerminated('The build is already terminated.')
+
+        return get_executor().submit(self.build, latex)
+
+    def build_zip_async(self, latex):
+        if self._terminated:
+            raise BuildTerminated('The build is already terminated.')
+
+        return get_executor().submit(self.build_zip, latex)
+
     def cleanup(self):
         if not self._terminated:
             self._cleanup_build()
@@ -88,27 +184,155 @@ class Builder(object):
         assert not os.path.exists(latex_path), 'export.tex already exists'
         assert not os.path.exists(pdf_path), 'export.pdf already exists'
 
+        self._report_progress('build')
         latex_file = open(latex_path, 'w')
         if isinstance(latex, unicode):
             latex = latex.encode('utf-8')
         latex_file.write(latex)
         latex_file.close()
 
-        self._run_pdflatex(latex_path)
+        self._format = self._prepare_format(latex)
+        self._run_pdflatex(latex_path, makeindex_follows=True)
         if self._makeindex():
             self._run_pdflatex(latex_path)
 
+        if self._last_pass_draft:
+            # The passes did not go as predicted, the last pass did not
+            # write the PDF.
+            self._execute('%s %s' % (self._get_pdflatex_command(), latex_path))
+            self._last_pass_draft = False
+
         if not os.path.exists(pdf_path):
             raise PDFBuildFailed('PDF missing.')
 
         return pdf_path
 
-    def _run_pdflatex(self, latex_path):
-        self._aux_data = None
-        cmd = 'pdflatex --interaction=nonstopmode %s' % latex_path
+    def _run_pdflatex(self, latex_path, makeindex_follows=False):
+        self._rerun_checker.reset()
         stdout = ''
         while self._rerun_required(stdout):
+            draft = self._another_pass_expected(makeindex_follows)
+            cmd = '%s %s' % (self._get_pdflatex_command(draft=draft),
+                             latex_path)
+            self._passes += 1
+            self._report_progress('pdflatex', self._passes,
+                                  self._passes + int(draft))
             _exitcode, stdout, _stderr = self._execute(cmd)
+            self._last_pass_draft = draft
+
+    def _another_pass_expected(self, makeindex_follows):
+        """Predicts whether another pass will follow the next pass. Those
+        passes run in draft mode, which skips including images and writing
+        the PDF but still writes the auxiliary files.
+        """
+        if not self._rerun_checker.aux_digests:
+            # The auxiliary files are written for the first time, which
+            # always changes them and requires another pass.
+            return True
+
+        if makeindex_follows and os.path.exists(
+                os.path.join(self.build_directory, 'export.idx')):
+            # The index is generated after this loop, followed by another
+            # pass including it.
+            return True
+
+        return False
+
+    def _get_pdflatex_command(self, draft=False):
+        """Returns the pdflatex command without the path to the document.
+        """
+        cmd = 'pdflatex --interaction=nonstopmode'
+        if self._format:
+            cmd += ' -fmt=%s' % self._format
+        if draft:
+            cmd += ' -draftmode'
+        return cmd
+
+    def _get_format_cache(self):
+        # Third party config utilities may not know about the format cache.
+        get_directory = getattr(self.config, 'get_format_cache_directory',
+                                None)
+        directory = get_directory and get_directory()
+        if not directory:
+            return None
+
+        max_size = getattr(self.config, 'format_cache_size',
+                           DEFAULT_FORMAT_CACHE_SIZE)
+        return FormatCache(directory, max_size)
+
+    def _prepare_format(self, latex):
+        """Makes a precompiled format of the preamble of `latex` available
+        in the build directory and returns its name. The format is taken from
+        the format cache or dumped and stored in the cache when missing.
+        Returns `None` when no format can be used.
+        """
+        if self._format_cache is None:
+            return None
+
+        if '\\begin{document}' not in latex:
+            return None
+
+        preamble = latex.split('\\begin{document}', 1)[0]
+        key = self._format_cache.get_key(self._get_engine_version(),
+                                         preamble,
+                                         *self._get_support_file_digests())
+
+        local_path = os.path.join(self.build_directory,
+                                  key + FORMAT_EXTENSION)
+        cached_path = self._format_cache.get(key)
+        if cached_path is not None:
+            # The format may already have been copied into the build
+            # directory for a pdflatex process loading it.
+            if not os.path.exists(local_path):
+                shutil.copyfile(cached_path, local_path)
+            return key
+
+        if self._dump_format(key):
+            self._format_cache.store(key, local_path)
+            return key
+
+        return None
+
+    def _dump_format(self, key):
+        """Dumps the preamble of the export.tex into a format named `key`
+        in the build directory, using the "mylatexformat" package.
+        """
+        exitcode, _stdout, _stderr = self._execute(
+            'pdflatex -ini -interaction=nonstopmode -jobname=%s '
+            '&pdflatex mylatexformat.ltx export.tex' % key)
+
+        log_path = os.path.join(self.build_directory, key + '.log')
+        if os.path.exists(log_path):
+            os.remove(log_path)
+
+        format_path = os.path.join(self.build_directory,
+                                   key + FORMAT_EXTENSION)
+        if exitcode != 0 or not os.path.exists(format_path):
+            if os.path.exists(format_path):
+                os.remove(format_path)
+            return False
+
+        return True
+
+    def _get_engine_version(self):
+        if not _ENGINE_VERSION:
+            _exitcode, stdout, _stderr = self._execute('pdflatex --version')
+            _ENGINE_VERSION.append(stdout.split('\n', 1)[0])
+        return _ENGINE_VERSION[0]
+
+    def _get_support_file_digests(self):
+        digests = []
+        for filename in sorted(os.listdir(self.build_directory)):
+            if filename == 'export.tex':
+                continue
+            if not filename.endswith(FORMAT_SUPPORT_FILE_EXTENSIONS):
+                continue
+
+            path = os.path.join(self.build_directory, filename)
+            with open(path, 'rb') as file_:
+                digests.append('%s:%s' % (
+                        filename, hashlib.sha1(file_.read()).hexdigest()))
+        return digests
 
     def _makeindex(self):
         idx_path = os.path.join(self.build_directory, 'export.idx')
@@ -120,37 +344,33 @@ class Builder(object):
         # For avoiding this, we copy the "umlaut.ist" to the export directory.
         umlaut_ist_path = os.path.join(RESOURCES_DIR, 'umlaut.ist')
         shutil.copyfile(umlaut_ist_path, os.path.join(self.build_directory, 'umlaut.ist'))
+        self._report_progress('makeindex')
         self._execute('makeindex -g -s umlaut.ist export')
         return True
 
+    def _report_progress(self, stage, current=None, total=None):
+        """Reports the progress of the build to the `progress_callback`.
+        The total amount of pdflatex passes is the amount expected so far.
+        """
+        if self.progress_callback is not None:
+            self.progress_callback(stage, current, total)
+
     def _rerun_required(self, stdout):
         if self._rerun_limit == 0:
             raise PDFBuildFailed('Maximum pdf build limit reached.')
 
         self._rerun_limit -= 1
 
-        previous_aux_data = self._aux_data
-
-        self._aux_data = []
-        for filename in os.listdir(self.build_directory):
-            if filename.endswith('.aux'):
-                path = os.path.join(self.build_directory, filename)
-                file_ = open(path)
-                self._aux_data.append(file_.read())
-                file_.close()
-
-        if 'Rerun to get' in stdout:
-            return True
-
-        elif previous_aux_data is None:
-            return True
-
-        elif previous_aux_data != self._aux_data:
-            return True
-
-        else:
+        reason = self._rerun_checker.rerun_required(stdout)
+        if reason is None:
             return False
 
+        if reason != FIRST_PASS:
+            self.rerun_reasons.append(reason)
+            LOG.info('Rerunning pdflatex in %s: %s',
+                     self.build_directory, reason)
+        return True
+
     def _cleanup_build(self):
         self._terminated = True
 
@@ -161,9 +381,9 @@ class Builder(object):
         proc = subprocess.Popen(shlex.split(cmd),
                                 stderr=subprocess.PIPE,
                                 stdout=subprocess.PIPE,
-                                cwd=self.build_directory)
-        output, errors = proc.communicate()
-        return proc.poll(), output, errors
+                                cwd=self.build_directory,
+                                **self._limits.get_popen_arguments())
+        return self._limits.communicate(proc)
 
 
 def builder_factory():
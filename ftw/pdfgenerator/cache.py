@@ -0,0 +1,243 @@
+from collections import OrderedDict
+from ftw.pdfgenerator.interfaces import IConfig
+from ftw.pdfgenerator.interfaces import IPDFCache
+from ftw.pdfgenerator.interfaces import IPDFCacheStorage
+from zope.component import getUtility
+from zope.interface import implements
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+# Defaults used when the config utility does not know about the cache.
+DEFAULT_PDF_CACHE_SIZE = 512 * 1024 * 1024
+DEFAULT_PDF_CACHE_MEMORY_SIZE = 32 * 1024 * 1024
+DEFAULT_PDF_CACHE_TTL = 24 * 60 * 60
+
+PDF_EXTENSION = '.pdf'
+
+
+class MemoryStorage(object):
+    """Size bounded least recently used storage in memory. When a `backend`
+    storage is passed, the memory storage acts as a cache in front of the
+    backend.
+    """
+
+    implements(IPDFCacheStorage)
+
+    def __init__(self, max_size, ttl=None, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and not self._expired(entry[0]):
+                self._entries[key] = entry
+                return entry[1]
+
+            elif entry is not None:
+                self.size -= len(entry[1])
+
+        if self.backend is None:
+            return None
+
+        data = self.backend.get(key)
+        if data is not None:
+            self._store(key, data)
+        return data
+
+    def set(self, key, data):
+        self._store(key, data)
+        if self.backend is not None:
+            self.backend.set(key, data)
+
+    def _store(self, key, data):
+        if len(data) > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+
+            self._entries[key] = (time.time(), data)
+            self.size += len(data)
+
+            while self.size > self.max_size:
+                _key, (_created, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+
+class FilesystemStorage(object):
+    """Size bounded least recently used storage in a directory.
+
+    The modification time of a file is its creation time, used for the
+    TTL, the access time is updated when the file is read and used for
+    evicting the least recently used files.
+    """
+
+    implements(IPDFCacheStorage)
+
+    def __init__(self, directory, max_size, ttl=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key):
+        path = self._get_path(key)
+        try:
+            created = os.stat(path).st_mtime
+            if self.ttl is not None and time.time() - created > self.ttl:
+                os.remove(path)
+                return None
+
+            with open(path, 'rb') as file_:
+                data = file_.read()
+            os.utime(path, (time.time(), created))
+
+        except (IOError, OSError):
+            # missing or removed by a concurrent request
+            return None
+
+        return data
+
+    def set(self, key, data):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # Write to a temporary file first and rename it afterwards, so that
+        # concurrent requests never read a partially written file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file_:
+                file_.write(data)
+            os.rename(tmp_path, self._get_path(key))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Removes expired files and the least recently used files until
+        the storage is smaller than `max_size`.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(PDF_EXTENSION):
+                continue
+
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+                if self.ttl is not None and now - stat.st_mtime > self.ttl:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _atime, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + PDF_EXTENSION)
+
+
+class PDFCache(object):
+    """Content addressed cache of built PDFs.
+
+    The key of a PDF is the hash of the LaTeX and of the files added to the
+    builder. When no storage is passed, the storage is configured with the
+    `IConfig` utility on first use: a memory storage in front of a
+    filesystem storage in the directory returned by
+    `get_pdf_cache_directory`. The cache is disabled when there is no such
+    directory.
+    """
+
+    implements(IPDFCache)
+
+    def __init__(self, storage=None):
+        self._storage = storage
+        self._configured = storage is not None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def storage(self):
+        if not self._configured:
+            self._storage = self._create_storage()
+            self._configured = True
+        return self._storage
+
+    @property
+    def enabled(self):
+        return self.storage is not None
+
+    def get_key(self, latex, file_digests):
+        key = hashlib.sha1()
+        if isinstance(latex, unicode):
+            latex = latex.encode('utf-8')
+        key.update(latex)
+        for digest in file_digests:
+            key.update('\0')
+            key.update(digest)
+        return key.hexdigest()
+
+    def get(self, key):
+        if self.storage is None:
+            return None
+
+        data = self.storage.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        if self.storage is not None:
+            self.storage.set(key, data)
+
+    def _create_storage(self):
+        config = getUtility(IConfig)
+        # Third party config utilities may not know about the pdf cache.
+        get_directory = getattr(config, 'get_pdf_cache_directory', None)
+        directory = get_directory and get_directory()
+        if not directory:
+            return None
+
+        ttl = getattr(config, 'pdf_cache_ttl', DEFAULT_PDF_CACHE_TTL)
+        backend = FilesystemStorage(
+            directory,
+            getattr(config, 'pdf_cache_size', DEFAULT_PDF_CACHE_SIZE),
+            ttl)
+        return MemoryStorage(
+            getattr(config, 'pdf_cache_memory_size',
+                    DEFAULT_PDF_CACHE_MEMORY_SIZE),
+            ttl, backend=backend)
@@ -1,5 +1,6 @@
 from ftw.pdfgenerator.interfaces import IConfig
 from zope.interface import implements
+import os
 import tempfile
 
 
@@ -7,6 +8,33 @@ class DefaultConfig(object):
     implements(IConfig)
 
     remove_build_directory = True
+    zip_deflate = True
+    format_cache_size = 256 * 1024 * 1024
+    build_workers = 4
+    max_concurrent_builds = None
+    max_queued_builds = None
+    build_queue_timeout = None
+    build_timeout = None
+    build_cpu_limit = None
+    build_memory_limit = None
+    job_max_age = 60 * 60
+    builder_pool_size = 2
+    builder_pool_max_age = 300
+    builder_pool_formats = 2
+    pdf_cache_size = 512 * 1024 * 1024
+    pdf_cache_memory_size = 32 * 1024 * 1024
+    pdf_cache_ttl = 24 * 60 * 60
+    convert_cache_size = None
+    html_parser = None
 
     def get_build_directory(self):
         return tempfile.mkdtemp(prefix='ftw.pdfgenerator_')
+
+    def get_format_cache_directory(self):
+        return None
+
+    def get_pdf_cache_directory(self):
+        return None
+
+    def get_job_directory(self):
+        return os.path.join(tempfile.gettempdir(), 'ftw.pdfgenerator-jobs')
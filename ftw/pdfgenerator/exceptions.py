@@ -13,6 +13,23 @@ class PDFBuildFailed(Exception):
     """
 
 
+class BuildLimitExceeded(PDFBuildFailed):
+    """Raised when a TeX process was killed because it exceeded the
+    configured time or resource limits.
+    """
+
+
+class BuildRejected(Exception):
+    """Raised when a build is not admitted because too many builds are
+    running. `retry_after` is the amount of seconds after which the build
+    should be retried.
+    """
+
+    def __init__(self, message, retry_after):
+        super(BuildRejected, self).__init__(message)
+        self.retry_after = retry_after
+
+
 class ConflictingUsePackageOrder(Exception):
     """The package order is conflicting in the `ILaTeXLayout`.
     """
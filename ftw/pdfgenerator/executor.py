@@ -0,0 +1,51 @@
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from ftw.pdfgenerator.interfaces import IConfig
+from zope.component import getUtility
+import threading
+
+
+# Default amount of builds running at the same time in the background.
+DEFAULT_BUILD_WORKERS = 4
+
+_executor = []
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the executor running asynchronous builds. It is created on
+    first use with `IConfig.build_workers` threads. The threads mostly wait
+    for the pdflatex subprocesses.
+    """
+    with _executor_lock:
+        if not _executor:
+            workers = getattr(getUtility(IConfig), 'build_workers',
+                              DEFAULT_BUILD_WORKERS)
+            _executor.append(ThreadPoolExecutor(max_workers=workers))
+        return _executor[0]
+
+
+def completed_future(result):
+    """Returns a future which already has the result `result`.
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def chain_future(future, function):
+    """Returns a new future, resolved with the result of calling `function`
+    with the result of `future`.
+    """
+    chained = Future()
+
+    def callback(done):
+        try:
+            result = function(done.result())
+        except Exception, exc:
+            chained.set_exception(exc)
+        else:
+            chained.set_result(result)
+
+    future.add_done_callback(callback)
+    return chained
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+FORMAT_EXTENSION = '.fmt'
+
+
+class FormatCache(object):
+    """A size bounded on-disk store of precompiled LaTeX formats (".fmt").
+
+    The formats are stored by key in a flat directory. The modification
+    time of a format is updated whenever it is used, so that the least
+    recently used formats are evicted first when the store grows beyond
+    `max_size` bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, *parts):
+        """Returns the cache key for the passed string parts, such as the
+        preamble and the engine version.
+        """
+        key = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, unicode):
+                part = part.encode('utf-8')
+            key.update(part)
+            key.update('\0')
+        return key.hexdigest()
+
+    def get(self, key):
+        """Returns the path to the format stored with `key` or `None` if
+        there is no such format.
+        """
+        path = self._get_path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def store(self, key, path):
+        """Copies the format at `path` into the store and returns the path
+        of the stored format.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # Copy to a temporary file first and rename it afterwards, so that
+        # concurrent builds never load a partially written format.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                with open(path, 'rb') as source:
+                    shutil.copyfileobj(source, target)
+            os.rename(tmp_path, self._get_path(key))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict(keep=key)
+        return self._get_path(key)
+
+    def evict(self, keep=None):
+        """Removes the least recently used formats until the store is
+        smaller than `max_size`. The format with the key `keep` is never
+        removed.
+        """
+        entries = []
+        total = 0
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(FORMAT_EXTENSION):
+                continue
+
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by a concurrent build
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, filename, path))
+            total += stat.st_size
+
+        entries.sort()
+        keep_filename = keep and keep + FORMAT_EXTENSION
+        for _mtime, size, filename, path in entries:
+            if total <= self.max_size:
+                break
+
+            if filename == keep_filename:
+                continue
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + FORMAT_EXTENSION)
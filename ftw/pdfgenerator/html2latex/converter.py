@@ -1,6 +1,17 @@
 from ftw.pdfgenerator import interfaces
 from ftw.pdfgenerator.html2latex import wrapper
+from ftw.pdfgenerator.html2latex.links import LinkResolver
+from ftw.pdfgenerator.html2latex.memoize import ConversionCache
+from ftw.pdfgenerator.html2latex.memoize import memoized_convert
+from ftw.pdfgenerator.html2latex.parser import get_parser
 from ftw.pdfgenerator.html2latex.patterns import DEFAULT_PATTERNS
+from ftw.pdfgenerator.html2latex.profiling import ConversionProfile
+from ftw.pdfgenerator.html2latex.program import MODE_REPLACE_MANY
+from ftw.pdfgenerator.html2latex.program import PLACEHOLDERS
+from ftw.pdfgenerator.html2latex.program import freeze_pattern
+from ftw.pdfgenerator.html2latex.program import get_shared_program
+from ftw.pdfgenerator.html2latex.program import is_plain_text
+from ftw.pdfgenerator.html2latex.program import patterns_identical
 from ftw.pdfgenerator.html2latex.subconverters import footnote
 from ftw.pdfgenerator.html2latex.subconverters import htmlentities
 from ftw.pdfgenerator.html2latex.subconverters import hyperlink
@@ -10,21 +21,30 @@ from ftw.pdfgenerator.html2latex.subconverters import textformatting
 from ftw.pdfgenerator.html2latex.subconverters import url
 from ftw.pdfgenerator.utils import encode_htmlentities
 from ftw.pdfgenerator.utils import xml2htmlentities
-from random import choice
 from zope.component import adapts
+from zope.component import queryUtility
 from zope.interface import implements, Interface
 import re
 import unicodedata
 
 
-PLACEHOLDERS = (
-    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER,
-    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_TOP,
-    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_BOTTOM,
-    )
-
 DEFAULT_PLACEHOLDER = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER
 
+# Locked parts of the HTML are replaced by tokens built of private use
+# characters, which do not appear in regular text and are not matched by the
+# patterns. A token is the start followed by the number of the lock as
+# LOCK_TOKEN_DIGITS characters in base LOCK_TOKEN_BASE. The start begins
+# with a letter, so that patterns matching the start of a word (e.g. opening
+# quotes) match before locked parts, such as links and footnotes.
+LOCK_TOKEN_SENTINEL = u'\ue000'.encode('utf-8')
+LOCK_TOKEN_START = 'L' + LOCK_TOKEN_SENTINEL
+LOCK_TOKEN_FIRST_DIGIT = 0xe100
+LOCK_TOKEN_BASE = 256
+LOCK_TOKEN_DIGITS = 3
+LOCK_TOKEN_EXPRESSION = re.compile(
+    re.escape(LOCK_TOKEN_START) + r'(?:\xee[\x84-\x87][\x80-\xbf]){%i}' % (
+        LOCK_TOKEN_DIGITS))
+
 DEFAULT_SUBCONVERTERS = (
     table.TableConverter,
     listing.ListConverter,
@@ -43,8 +63,39 @@ class BasePatternAware(object):
 
     default_patterns = None
 
-    def __init__(self, patterns):
+    def __init__(self, patterns, program=None):
         self.patterns = patterns
+        self._program = program
+        # The patterns the program was looked up for. A shared program may
+        # be compiled from other, but equal pattern objects.
+        self._program_patterns = program and tuple(patterns)
+        # Programs of the patterns registered later on are derived from the
+        # initial program, see `get_program`.
+        self._base_program = program
+        self._base_patterns = self._program_patterns
+        self._registrations = ()
+        self._registered_patterns = None
+
+    def get_program(self):
+        """Returns the compiled `PatternProgram` of the current patterns.
+        The program is only looked up again when the patterns changed.
+        When they were changed by registering patterns only, the program is
+        derived from the initial program, which is cheaper than looking up
+        the program of all patterns.
+        """
+        if self._program is not None and \
+                patterns_identical(self._program_patterns, self.patterns):
+            return self._program
+
+        if self._base_program is not None and \
+                patterns_identical(self._registered_patterns, self.patterns):
+            self._program = self._base_program.get_derived_program(
+                self._registrations, self.patterns)
+        else:
+            self._program = get_shared_program(self.patterns)
+
+        self._program_patterns = tuple(self.patterns)
+        return self._program
 
     def register_patterns(self, patterns):
         for pattern in patterns:
@@ -76,21 +127,34 @@ class BasePatternAware(object):
             placeholder = modeObject.placeholder
             replace = False
 
-        found = False
+        if self._base_program is not None and not patterns_identical(
+                self._registered_patterns or self._base_patterns,
+                self.patterns):
+            # The patterns were changed otherwise, the registrations do not
+            # describe them anymore.
+            self._base_program = None
+
+        # The pattern list may be shared with other converters or runners.
+        self.patterns = list(self.patterns)
+
+        found = ()
         if replace:
-            for i in range(0, len(self.patterns)):
-                if self.patterns[i] in PLACEHOLDERS:
-                    continue
+            found = [i for i, existing in enumerate(self.patterns)
+                     if existing not in PLACEHOLDERS and
+                     existing[1] == pattern[1]]
 
-                if pattern[1] == self.patterns[i][1]:
-                    # overwrite existing pattern
-                    self.patterns[i] = pattern
-                    found = True
+        for i in found:
+            # overwrite existing pattern
+            self.patterns[i] = pattern
 
         if not found:
             # pattern will be inserted at the configured placeholder
             self.patterns.insert(self.patterns.index(placeholder), pattern)
 
+        self._registrations += ((freeze_pattern(pattern), placeholder,
+                                 replace), )
+        self._registered_patterns = tuple(self.patterns)
+
     def _register_converter(self, converter_class):
         """
         Generates a pattern with a SubConverter class.
@@ -117,29 +181,68 @@ class HTML2LatexConverter(BasePatternAware):
             patterns=self.__class__.default_patterns[:])
         self.register_subconverters(self.get_default_subconverters())
 
+        self.convert_cache = None
+        config = queryUtility(interfaces.IConfig)
+        # Third party config utilities may not know about the cache.
+        cache_size = getattr(config, 'convert_cache_size', None)
+        if cache_size:
+            self.convert_cache = ConversionCache(cache_size)
+
+        self.html_parser = get_parser(getattr(config, 'html_parser', None))
+        self.link_resolver = None
+
+        self.profile = None
+
     def get_default_subconverters(self):
         return DEFAULT_SUBCONVERTERS
 
+    def get_link_resolver(self):
+        """Returns the `LinkResolver` caching the resolved links. The
+        assembler resets it for each build.
+        """
+        if self.link_resolver is None:
+            self.link_resolver = LinkResolver(self.context)
+        return self.link_resolver
+
+    def start_profiling(self):
+        """Records the time spent in each pattern and subconverter of the
+        following conversions. Returns the `ConversionProfile`.
+        """
+        self.profile = ConversionProfile()
+        return self.profile
+
     def convert(self, html, custom_patterns=None, custom_subconverters=None,
                 trim=True):
+        self.get_link_resolver().prefetch(html)
+
+        def convert():
+            runner = HTML2LatexConvertRunner(
+                converter=self,
+                patterns=self.patterns,
+                html=html,
+                trim=trim,
+                program=self.get_program())
 
-        runner = HTML2LatexConvertRunner(
-            converter=self,
-            patterns=self.patterns[:],
-            html=html,
-            trim=trim)
+            if custom_patterns is not None:
+                runner.register_patterns(custom_patterns)
 
-        if custom_patterns is not None:
-            runner.register_patterns(custom_patterns)
+            if custom_subconverters is not None:
+                runner.register_subconverters(custom_subconverters)
 
-        if custom_subconverters is not None:
-            runner.register_subconverters(custom_subconverters)
+            return runner.runner_convert()
 
-        return runner.runner_convert()
+        return memoized_convert(self, convert, html, trim, self.get_program(),
+                                custom_patterns, custom_subconverters)
 
     def convert_plain(self, text, **kwargs):
-        html = encode_htmlentities(text)
-        return self.convert(html, **kwargs)
+        def convert():
+            html = encode_htmlentities(text)
+            return self.convert(html, **kwargs)
+
+        return memoized_convert(
+            self, convert, text, kwargs.get('trim', True), self.get_program(),
+            kwargs.get('custom_patterns'), kwargs.get('custom_subconverters'),
+            plain=True)
 
     def quoted_umlauts(self, text):
         if isinstance(text, str):
@@ -155,15 +258,23 @@ class HTML2LatexConverter(BasePatternAware):
 class HTML2LatexConvertRunner(BasePatternAware):
     implements(interfaces.IHTML2LaTeXConvertRunner)
 
-    def __init__(self, converter, patterns, html, trim=True):
+    def __init__(self, converter, patterns, html, trim=True, program=None,
+                 parsed_nodes=None):
         """
         Creates a instance for converting html to latex.
         Attention: this instance should only be used ONCE for converting,
         because of the lockers and html instance attributes.
         You can use convert() on this instance, it will be proxied to the
         HTML2LatexConverter instance.
+        The compiled `program` of the patterns is shared between runners
+        when passed, as well as the `parsed_nodes` of the subconverters.
         """
-        BasePatternAware.__init__(self, patterns)
+        BasePatternAware.__init__(self, patterns, program)
+        # The DOM nodes parsed by subconverters by their HTML, which nested
+        # subconverters reuse instead of parsing the HTML again.
+        if parsed_nodes is None:
+            parsed_nodes = {}
+        self.parsed_nodes = parsed_nodes
 
         if not interfaces.IHTML2LaTeXConverter.providedBy(converter):
             raise ValueError(
@@ -173,8 +284,10 @@ class HTML2LatexConvertRunner(BasePatternAware):
 
         self.lockers = {}
         self.html = ''
-        self.patterns = patterns
         self._convert_started = False
+        self._lock_counter = 0
+        # Start of the first part changed by the running subconverter.
+        self._edit_start = None
 
         # we use utf8
         if type(html) == unicode:
@@ -187,6 +300,12 @@ class HTML2LatexConvertRunner(BasePatternAware):
         if trim:
             self.html = self.html.strip()
 
+        # Lock private use characters of the HTML looking like lock tokens.
+        if LOCK_TOKEN_SENTINEL in self.html:
+            token = self._create_lock_token()
+            self.lockers[token] = LOCK_TOKEN_SENTINEL
+            self.html = self.html.replace(LOCK_TOKEN_SENTINEL, token)
+
     def lock_chars(self, startPos, endPos):
         """
         Locks a specific part of the html. Other Patterns will not match this
@@ -194,21 +313,8 @@ class HTML2LatexConvertRunner(BasePatternAware):
         they replaced the HTML with latex.
         See replaceAndLock()
         """
-        # generate new id with same length
-        id_chars = 'abcdefghijklmnopqrstuvwxyz0123456789'
-        stop = False
-        id_ = ''
-        length = endPos - startPos
-
-        # use keys with a length of at least 10 chars for making them
-        # unique enought. otherwise the key generation may loop.
-        if length < 10:
-            length = 10
-
-        while not stop:
-            id_ = ''.join([choice(id_chars) for _i in range(length)])
-            if id_ not in self.lockers.keys() and id_ not in self.html:
-                stop = True
+        id_ = self._create_lock_token()
+        self._track_edit(startPos)
 
         # lock html (replace with id)
         self.lockers[id_] = self.html[startPos:endPos]
@@ -222,6 +328,7 @@ class HTML2LatexConvertRunner(BasePatternAware):
         lockChars() or replaceAndLock() if you don't want further patterns
         to match and replace
         """
+        self._track_edit(startPos)
         self.html = self.html[:startPos] + text + self.html[endPos:]
         return self.html
 
@@ -241,15 +348,42 @@ class HTML2LatexConvertRunner(BasePatternAware):
         """
         Unlocks previously locked HTML (see lockChars()). This method is
         automatically called by _convert() after converting HTML to Latex.
+        Locked parts may contain other locks, which are resolved too.
         """
-        html_before = self.html
+        if not self.lockers:
+            return
+
+        resolved = {}
+
+        def resolve(match):
+            id_ = match.group(0)
+            if id_ not in resolved:
+                if id_ not in self.lockers:
+                    return id_
+                # A lock containing itself stays locked.
+                resolved[id_] = id_
+                resolved[id_] = LOCK_TOKEN_EXPRESSION.sub(
+                    resolve, self.lockers[id_])
+            return resolved[id_]
+
+        self.html = LOCK_TOKEN_EXPRESSION.sub(resolve, self.html)
+
+    def _track_edit(self, startPos):
+        if self._edit_start is None or startPos < self._edit_start:
+            self._edit_start = startPos
+
+    def _create_lock_token(self):
+        number = self._lock_counter
+        self._lock_counter += 1
+        if number >= LOCK_TOKEN_BASE ** LOCK_TOKEN_DIGITS:
+            raise RuntimeError('Too many locks.')
 
-        for id_ in self.lockers.keys():
-            value = self.lockers[id_]
-            self.html = self.html.replace(id_, value)
+        digits = []
+        for _i in range(LOCK_TOKEN_DIGITS):
+            number, digit = divmod(number, LOCK_TOKEN_BASE)
+            digits.append(unichr(LOCK_TOKEN_FIRST_DIGIT + digit))
 
-        if html_before != self.html:
-            self._unlock_chars()
+        return LOCK_TOKEN_START + u''.join(reversed(digits)).encode('utf-8')
 
     def convert(self, html, custom_patterns=None, custom_subconverters=None,
                 trim=True):
@@ -258,19 +392,26 @@ class HTML2LatexConvertRunner(BasePatternAware):
         converting HTML parts matched in subconverters.
         """
 
-        runner = HTML2LatexConvertRunner(
-            converter=self.converter,
-            patterns=self.patterns[:],
-            html=html,
-            trim=trim)
+        def convert():
+            runner = HTML2LatexConvertRunner(
+                converter=self.converter,
+                patterns=self.patterns,
+                html=html,
+                trim=trim,
+                program=self.get_program(),
+                parsed_nodes=self.parsed_nodes)
 
-        if custom_patterns is not None:
-            runner.register_patterns(custom_patterns)
+            if custom_patterns is not None:
+                runner.register_patterns(custom_patterns)
 
-        if custom_subconverters is not None:
-            runner.register_subconverters(custom_subconverters)
+            if custom_subconverters is not None:
+                runner.register_subconverters(custom_subconverters)
 
-        return runner.runner_convert()
+            return runner.runner_convert()
+
+        return memoized_convert(self.converter, convert, html, trim,
+                                self.get_program(), custom_patterns,
+                                custom_subconverters)
 
     def runner_convert(self):
         """This method does the actual converting. It should never by called
@@ -283,54 +424,156 @@ class HTML2LatexConvertRunner(BasePatternAware):
         else:
             self._convert_started = True
 
-        for pattern in self.patterns:
-            if pattern in PLACEHOLDERS:
-                continue
+        program = self.get_program()
+        start = 0
+        if is_plain_text(self.html):
+            start = self._run_plain_text_steps(program)
 
-            mode = pattern[0]
-            search = pattern[1]
-            replace = pattern[2]
-            modifiers = ()
+        for index in range(start, len(program.steps)):
+            self._run_program_step(program, index)
 
-            if len(pattern) == 4:
-                modifiers = pattern[3]
+        self._unlock_chars()
+        return self.html
 
-            # replace
-            if mode == interfaces.HTML2LATEX_MODE_REPLACE:
-                self.html = self.html.replace(search, replace)
+    def _run_plain_text_steps(self, program):
+        """Runs the steps which may match plain text, as long as the HTML is
+        plain text. Returns the index of the next step to run for the
+        remaining HTML: the other steps before it cannot change plain text.
+        """
+        for index in program.get_plain_text_steps():
+            self._run_program_step(program, index)
+            if not is_plain_text(self.html):
+                return index + 1
 
-            # regexp replace
-            elif mode == interfaces.HTML2LATEX_MODE_REGEXP:
-                self._replace_regexp(search, replace, modifiers)
+        return len(program.steps)
 
-            # regexp function
-            elif mode == interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION:
-                self._replace_regexp_function(search, replace)
+    def _run_program_step(self, program, index):
+        if not program.may_match(index, self.html):
+            return
 
-        self._unlock_chars()
-        return self.html
+        # Third party converters may not support profiling.
+        profile = getattr(self.converter, 'profile', None)
+        if profile is None:
+            self._run_step(*program.steps[index])
+        else:
+            self._run_step_profiled(profile, *program.steps[index])
+
+    def _run_step(self, mode, search, replace, repeat):
+        """Runs a step of the program on the HTML. Returns the amount of
+        matches, when it is known without extra work.
+        """
+
+        # replace
+        if mode == interfaces.HTML2LATEX_MODE_REPLACE:
+            self.html = self.html.replace(search, replace)
+
+        # multiple replaces in a single pass
+        elif mode == MODE_REPLACE_MANY:
+            self.html, matches = search.subn(replace, self.html)
+            return matches
+
+        # regexp replace
+        elif mode == interfaces.HTML2LATEX_MODE_REGEXP:
+            return self._replace_regexp(search, replace, repeat)
+
+        # regexp function
+        elif mode == interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION:
+            return self._replace_regexp_function(search, replace)
+
+        return None
+
+    def _run_step_profiled(self, profile, mode, search, replace, repeat):
+        """Runs a step like `_run_step` and records it in the
+        `ConversionProfile` `profile`.
+        """
+        bytes_in = len(self.html)
+        matches = 0
+        if mode == interfaces.HTML2LATEX_MODE_REPLACE:
+            matches = self.html.count(search)
+
+        start = profile.timer()
+        counted = self._run_step(mode, search, replace, repeat)
+        duration = profile.timer() - start
+
+        if counted is not None:
+            matches = counted
+        profile.record(mode, search, replace, duration, matches, bytes_in,
+                       len(self.html))
 
     def quoted_umlauts(self, text):
         return self.converter.quoted_umlauts(text)
 
-    def _replace_regexp(self, search, replace, modifiers):
-        xpr = re.compile(search, re.DOTALL)
-        previous_html = ''
-        if interfaces.HTML2LATEX_REPEAT_MODIFIER in modifiers:
+    def _replace_regexp(self, xpr, replace, repeat):
+        """Replaces the matches of `xpr` and returns the amount of
+        replacements.
+        """
+        matches = 0
+        if repeat:
             previous_html = ''
 
             while previous_html != self.html:
                 previous_html = self.html
-                self.html = xpr.sub(replace, self.html)
+                self.html, count = xpr.subn(replace, self.html)
+                matches += count
 
         else:
-            self.html = xpr.sub(replace, self.html)
+            self.html, matches = xpr.subn(replace, self.html)
+
+        return matches
+
+    def _replace_regexp_function(self, xpr, replace_fun):
+        """Calls the subconverter `replace_fun` for each match. After a
+        subconverter changed the HTML, the search continues at the first
+        changed position, so the changed part is searched again but the
+        part before it is not. Returns the amount of calls.
+
+        Subconverters with a `replace_all` function convert all matches at
+        once instead.
+        """
+        replace_all = getattr(replace_fun, 'replace_all', None)
+        if replace_all is not None:
+            self.html, matches = replace_all(xpr, self.html)
+            return matches
 
-    def _replace_regexp_function(self, search, replace_fun):
-        xpr = re.compile(search, re.DOTALL)
+        if getattr(replace_fun, 'rescan_after_replace', False):
+            return self._replace_regexp_function_rescanning(xpr, replace_fun)
+
+        startLimit = 0
+        calls = 0
+
+        while True:
+            match = xpr.search(self.html, startLimit)
+            if not match:
+                break
+
+            calls += 1
+            previous_html = self.html
+            self._edit_start = None
+            obj = replace_fun(self, match, self.html)
+            if callable(obj):
+                obj()
+
+            if self.html is previous_html or self.html == previous_html:
+                startLimit = match.start() + 1
+
+            elif self._edit_start is None:
+                # The HTML was changed without replace() or lock_chars().
+                startLimit = 0
+
+            else:
+                startLimit = self._edit_start
+
+        return calls
+
+    def _replace_regexp_function_rescanning(self, xpr, replace_fun):
+        """Calls the subconverter `replace_fun` for each match and searches
+        again from the start of the HTML after each change. Returns the
+        amount of calls.
+        """
         skipStartPos = []
         startLimit = 0
         search = True
+        calls = 0
 
         while search:
             previous_html = self.html
@@ -338,6 +581,7 @@ class HTML2LatexConvertRunner(BasePatternAware):
 
             if match and match.start() not in skipStartPos:
                 skipStartPos.append(match.start())
+                calls += 1
                 obj = replace_fun(self, match, self.html)
                 if callable(obj):
                     obj()
@@ -351,3 +595,5 @@ class HTML2LatexConvertRunner(BasePatternAware):
             if self.html != previous_html:
                 skipStartPos = []
                 startLimit = 0
+
+        return calls
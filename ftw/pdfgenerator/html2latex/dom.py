@@ -0,0 +1,566 @@
+from BeautifulSoup import BeautifulSoup
+from BeautifulSoup import NavigableString
+from BeautifulSoup import Tag
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConvertRunner
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
+from ftw.pdfgenerator.html2latex.converter import LOCK_TOKEN_SENTINEL
+from ftw.pdfgenerator.html2latex.patterns import DEFAULT_PATTERNS
+from ftw.pdfgenerator.html2latex.patterns import MODE_REPLACE
+from ftw.pdfgenerator.html2latex.subconverters import footnote
+from ftw.pdfgenerator.html2latex.subconverters import hyperlink
+from ftw.pdfgenerator.html2latex.subconverters import listing
+from ftw.pdfgenerator.html2latex.subconverters import table
+from ftw.pdfgenerator.utils import decode_htmlentities
+from ftw.pdfgenerator.utils import xml2htmlentities
+from xml.dom import minidom
+import difflib
+import logging
+
+
+LOG = logging.getLogger('ftw.pdfgenerator')
+
+# The element handlers write the backslashes, braces and line breaks of
+# the LaTeX commands they produce as these private use characters, since
+# the text stage escapes backslashes and braces and replaces the line
+# breaks of the HTML with spaces. Each marker is replaced right after the
+# respective pattern, so that the following patterns see the commands like
+# the output of the regular expressions of the `HTML2LatexConverter`.
+COMMAND_START_MARKER = u'\ue001'.encode('utf-8')
+OPENING_BRACE_MARKER = u'\ue002'.encode('utf-8')
+CLOSING_BRACE_MARKER = u'\ue003'.encode('utf-8')
+NEWLINE_MARKER = u'\ue004'.encode('utf-8')
+
+MARKER_PATTERNS = (
+    (DEFAULT_PATTERNS[0], COMMAND_START_MARKER, '\\'),
+    ((MODE_REPLACE, '{', '\\{'), OPENING_BRACE_MARKER, '{'),
+    ((MODE_REPLACE, '}', '\\}'), CLOSING_BRACE_MARKER, '}'),
+    ((MODE_REPLACE, '\n', ' '), NEWLINE_MARKER, '\n'),
+    )
+
+MARKERS = tuple(marker for _, marker, _ in MARKER_PATTERNS)
+
+
+def _insert_marker_patterns(patterns):
+    patterns = patterns[:]
+    for after, marker, replacement in MARKER_PATTERNS:
+        patterns.insert(patterns.index(after) + 1,
+                        (MODE_REPLACE, marker, replacement))
+    return patterns
+
+
+DOM_PATTERNS = _insert_marker_patterns(DEFAULT_PATTERNS)
+
+
+def latex_command(name):
+    """Returns the start of the LaTeX command `name` written with markers.
+    The command is closed with `CLOSING_BRACE_MARKER`.
+    """
+    return COMMAND_START_MARKER + name + OPENING_BRACE_MARKER
+
+
+HEADING_COMMANDS = {
+    'h1': 'section',
+    'h2': 'subsection',
+    'h3': 'subsubsection',
+    }
+
+# The leading space of these elements (without attributes) is moved before
+# the command, like the patterns do.
+SPACE_MOVING_TAGS = ('b', 'strong', 'em', 'u', 'i')
+
+LISTING_TAGS = tuple(listing.ListConverter.listing_tag_mapping)
+
+TEXTFORMATTING_COMMANDS = {
+    'b': 'textbf',
+    'strong': 'textbf',
+    'em': 'emph',
+    'u': 'emph',
+    'i': 'textit',
+    'sup': 'textsuperscript',
+    }
+
+
+class DOMConvertRunner(HTML2LatexConvertRunner):
+    """Converts a list of parsed nodes. The element handlers of the
+    converter convert the elements they handle to LaTeX, which is either
+    locked or written with markers. The patterns of the runner are then
+    applied to the remaining text and markup (the text stage).
+    """
+
+    def __init__(self, converter, patterns, nodes, trim=True, program=None,
+                 document_runner=None):
+        HTML2LatexConvertRunner.__init__(
+            self, converter, patterns, '', trim=trim, program=program)
+        self.nodes = nodes
+        self.trim = trim
+        # The last character rendered by the element handlers.
+        self.last_character = ''
+        # The runner converting the whole document.
+        self.document_runner = document_runner or self
+
+    def lock_text(self, text):
+        """Locks the LaTeX `text` and returns the lock token, which is
+        replaced by `text` after converting.
+        """
+        token = self._create_lock_token()
+        self.lockers[token] = text
+        return token
+
+    def _create_lock_token(self):
+        # The runners of a document number their locks together, so that
+        # the locks of the document runner are kept by the nested runners.
+        if self.document_runner is not self:
+            return self.document_runner._create_lock_token()
+        return HTML2LatexConvertRunner._create_lock_token(self)
+
+    def convert_nodes(self, nodes, trim=True):
+        """Converts a list of nodes with a separate runner using the same
+        patterns. This is used for parts of the document which are
+        converted on their own, like list items and link labels.
+        """
+        runner = DOMConvertRunner(
+            converter=self.converter,
+            patterns=self.patterns,
+            nodes=nodes,
+            trim=trim,
+            program=self.get_program(),
+            document_runner=self.document_runner)
+        return runner.runner_convert()
+
+    def runner_convert(self):
+        html = xml2htmlentities(
+            self.converter.render_nodes(self, self.nodes))
+        if self.trim:
+            html = html.strip()
+        self.html = html
+        return HTML2LatexConvertRunner.runner_convert(self)
+
+
+class DOMHTML2LatexConverter(HTML2LatexConverter):
+    """Converts HTML to LaTeX by parsing it once and traversing the tree.
+
+    The elements are converted by element handlers (see
+    `element_handlers`), which are methods taking the runner and the
+    element and returning the converted element. Elements without a
+    handler are kept as markup, so that the patterns convert them. The
+    patterns (including custom patterns and subconverters) are applied
+    once to the text of the whole document after the traversal.
+
+    Tables are converted by the table subconverter, which is passed the
+    parsed table instead of parsing its HTML again. When the subconverter
+    for tables, links, lists or footnotes is replaced by a custom
+    subconverter, those elements are kept as markup too, so that the custom
+    subconverter converts them in the text stage.
+
+    In the differential mode (`differential = True`) every conversion is
+    compared with the regular expression based `HTML2LatexConverter` and
+    the differences are logged. Nested elements of the same kind, lists
+    within paragraphs or inline markup and whitespace-only text formatting
+    are converted differently, since the regular expressions do not match
+    the structure of the HTML there (see the README).
+    """
+
+    default_patterns = DOM_PATTERNS
+
+    differential = False
+
+    element_handlers = {
+        'h1': 'render_heading',
+        'h2': 'render_heading',
+        'h3': 'render_heading',
+        'b': 'render_textformatting',
+        'strong': 'render_textformatting',
+        'em': 'render_textformatting',
+        'u': 'render_textformatting',
+        'i': 'render_textformatting',
+        'sup': 'render_textformatting',
+        'span': 'render_span',
+        'a': 'render_hyperlink',
+        'ul': 'render_listing',
+        'ol': 'render_listing',
+        'dl': 'render_listing',
+        'table': 'render_table',
+        'style': 'render_nothing',
+        'script': 'render_nothing',
+        }
+
+    def convert(self, html, custom_patterns=None, custom_subconverters=None,
+                trim=True):
+        latex = self.convert_dom(html, custom_patterns=custom_patterns,
+                                 custom_subconverters=custom_subconverters,
+                                 trim=trim)
+
+        if self.differential:
+            legacy_latex = HTML2LatexConverter.convert(
+                self, html, custom_patterns=custom_patterns,
+                custom_subconverters=custom_subconverters, trim=trim)
+            if legacy_latex != latex:
+                LOG.warning('The DOM converter differs from the regular '
+                            'expression converter:\n%s' % '\n'.join(
+                        self._diff(legacy_latex, latex)))
+
+        return latex
+
+    def convert_dom(self, html, custom_patterns=None,
+                    custom_subconverters=None, trim=True):
+        """Converts the HTML with the DOM converter.
+        """
+        self.get_link_resolver().prefetch(html)
+        runner = DOMConvertRunner(
+            converter=self,
+            patterns=self.patterns,
+            nodes=self.parse(html).contents,
+            trim=trim,
+            program=self.get_program())
+
+        if custom_patterns is not None:
+            runner.register_patterns(custom_patterns)
+
+        if custom_subconverters is not None:
+            runner.register_subconverters(custom_subconverters)
+
+        return runner.runner_convert()
+
+    def compare_with_legacy(self, html, **kwargs):
+        """Converts the HTML with both converters and returns the
+        differences as unified diff lines. The list is empty when both
+        results are equal.
+        """
+        legacy_latex = HTML2LatexConverter.convert(self, html, **kwargs)
+        latex = self.convert_dom(html, **kwargs)
+        return self._diff(legacy_latex, latex)
+
+    def parse(self, html):
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+        return BeautifulSoup(html, fromEncoding='utf-8')
+
+    def render_nodes(self, runner, nodes):
+        parts = []
+        index = 0
+        while index < len(nodes):
+            end = self._get_listing_span_end(runner, nodes, index)
+            if end is None:
+                part = self.render_node(runner, nodes[index])
+                index += 1
+            else:
+                part = self.render_listing_span(runner, nodes[index:end + 1])
+                index = end + 1
+
+            if part:
+                parts.append(part)
+                runner.last_character = part[-1]
+        return ''.join(parts)
+
+    def render_node(self, runner, node):
+        if isinstance(node, Tag):
+            handler = self.element_handlers.get(node.name)
+            if handler is None:
+                return self.render_markup(runner, node)
+            return getattr(self, handler)(runner, node)
+
+        elif type(node) is NavigableString:
+            text = node.encode('utf-8')
+            for character in (LOCK_TOKEN_SENTINEL, ) + MARKERS:
+                if character in text:
+                    text = text.replace(character,
+                                        runner.lock_text(character))
+            return text
+
+        else:
+            # comments, declarations and processing instructions
+            return ''
+
+    def render_markup(self, runner, node):
+        """Keeps the element as markup while converting the children.
+        """
+        name = node.name.encode('utf-8')
+        attributes = ''.join(' %s="%s"' % (key, value)
+                             for key, value in node.attrs).encode('utf-8')
+        if node.isSelfClosing:
+            return '<%s%s />' % (name, attributes)
+
+        return '<%s%s>%s</%s>' % (name, attributes,
+                                  self.render_children(runner, node),
+                                  name)
+
+    def render_children(self, runner, node):
+        # The opening tag precedes the first child in the HTML.
+        runner.last_character = '>'
+        return self.render_nodes(runner, node.contents)
+
+    def render_source(self, runner, node):
+        """Keeps the element as it is, so that the patterns convert it.
+        """
+        return str(node)
+
+    def render_nothing(self, runner, node):
+        return ''
+
+    def render_heading(self, runner, node):
+        return '%s%s%s%s' % (
+            latex_command(HEADING_COMMANDS[node.name]),
+            self.render_children(runner, node),
+            CLOSING_BRACE_MARKER,
+            NEWLINE_MARKER)
+
+    def render_textformatting(self, runner, node, command=None):
+        preceding = runner.last_character
+        content = self.render_children(runner, node)
+        if not content.strip():
+            return content
+
+        prefix = ''
+        if preceding not in ('', ' ', '\n') and content[:1] in (' ', '\n') \
+                and self._starts_with_space(node):
+            # Move the leading space before the command.
+            prefix, content = ' ', content[1:]
+
+        command = command or TEXTFORMATTING_COMMANDS[node.name]
+        # Like the patterns, only bold text prevents the following
+        # patterns from matching right after the command (e.g. removing
+        # a line break after the closing brace).
+        suffix = ''
+        if command == 'textbf':
+            suffix = interfaces.HTML2LATEX_PREVENT_CHARACTER
+
+        return '%s%s%s%s%s' % (
+            prefix,
+            latex_command(command),
+            content,
+            CLOSING_BRACE_MARKER,
+            suffix)
+
+    def render_span(self, runner, node):
+        classes = (node.get('class') or '').split()
+
+        if 'footnote' in classes and node.get('data-footnote') is not None:
+            return self.render_footnote(runner, node)
+
+        if (node.get('style') or '').startswith('font-weight: bold'):
+            return self.render_textformatting(runner, node, command='textbf')
+
+        return self.render_markup(runner, node)
+
+    def render_footnote(self, runner, node):
+        if not self._uses_subconverter(runner, footnote.FootnoteConverter):
+            return self.render_source(runner, node)
+
+        content = runner.convert_nodes(node.contents)
+        footnote_text = runner.convert(node.get('data-footnote'))
+        return runner.lock_text(r'%s\footnote{%s}' % (content, footnote_text))
+
+    def render_hyperlink(self, runner, node):
+        url = node.get('href')
+        converter_class = runner.get_subconverter_by_pattern(
+            hyperlink.HyperlinkConverter.pattern)
+
+        if url is None:
+            return self.render_markup(runner, node)
+
+        elif converter_class is None or \
+                not hasattr(converter_class, 'convert_link'):
+            return self.render_source(runner, node)
+
+        label = runner.convert_nodes(node.contents)
+        subconverter = converter_class(runner, None, runner.html)
+        return runner.lock_text(
+            subconverter.convert_link(url.encode('utf-8'), label))
+
+    def render_listing(self, runner, node):
+        if not self._uses_subconverter(runner, listing.ListConverter):
+            return self.render_source(runner, node)
+        return self.render_listing_span(runner, [node])
+
+    def render_listing_span(self, runner, nodes):
+        """Converts a list and its following siblings up to the last list of
+        the same type like the `ListConverter`, whose pattern matches them
+        as a whole: the lists are converted to environments, the other
+        nodes are converted separately, each on its own line.
+        """
+        latex = []
+        for node in nodes:
+            if self._is_element(node, *LISTING_TAGS):
+                latex.extend(self._convert_listing_environment(runner, node))
+            else:
+                latex.append(runner.convert_nodes([node]))
+
+        if not latex:
+            return ''
+        return runner.lock_text('\n'.join(latex + ['']))
+
+    def render_table(self, runner, node):
+        converter_class = runner.get_subconverter_by_pattern(
+            table.TableConverter.pattern)
+        replacements = self._get_table_replacements(runner)
+
+        if converter_class is None or replacements is None or \
+                not hasattr(converter_class, 'convert_table'):
+            return self.render_source(runner, node)
+
+        # The table subconverter converts the parsed table instead of
+        # parsing its HTML again.
+        dom_table = self._get_minidom_node(minidom.Document(), node,
+                                           replacements)
+        subconverter = converter_class(runner, None, runner.html)
+        # Like the patterns, which convert tables before lists, the table is
+        # unlocked when the whole document is converted.
+        return runner.document_runner.lock_text(
+            subconverter.convert_table(dom_table))
+
+    def _get_table_replacements(self, runner):
+        """Returns the replacements of the patterns preceding the table
+        subconverter, which are applied to the HTML of a table before the
+        subconverter parses it. `None` is returned when other patterns
+        precede the subconverter, since they may change the markup; the
+        table is then converted in the text stage.
+        """
+        replacements = []
+        for pattern in runner.patterns:
+            if not isinstance(pattern, tuple):
+                # placeholders
+                continue
+
+            if pattern[0] == interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION \
+                    and pattern[1] == table.TableConverter.pattern:
+                return replacements
+
+            if pattern[0] != MODE_REPLACE:
+                return None
+
+            if pattern[1] not in MARKERS:
+                replacements.append(pattern[1:3])
+
+        return None
+
+    def _get_minidom_node(self, document, node, replacements):
+        """Returns the BeautifulSoup `node` as minidom node, as if its HTML
+        was parsed by the table subconverter.
+        """
+        if isinstance(node, Tag):
+            element = document.createElement(node.name)
+            for name, value in node.attrs:
+                element.setAttribute(
+                    name, self._decode_text(value, replacements))
+
+            for child in node.contents:
+                child = self._get_minidom_node(document, child, replacements)
+                if child is not None:
+                    element.appendChild(child)
+            return element
+
+        elif type(node) is NavigableString:
+            return document.createTextNode(
+                self._decode_text(node, replacements))
+
+        else:
+            # Comments are removed by the patterns anyway, declarations and
+            # processing instructions are not expected in tables.
+            return None
+
+    def _decode_text(self, text, replacements):
+        text = text.encode('utf-8')
+        for search, replacement in replacements:
+            text = text.replace(search, replacement)
+        return decode_htmlentities(text.decode('utf-8'))
+
+    def _get_listing_span_end(self, runner, nodes, index):
+        """Returns the index of the last sibling of the list `nodes[index]`
+        converted together with it (see `render_listing_span`) or `None`
+        when the node is not a list converted by the `ListConverter`.
+        """
+        node = nodes[index]
+        if not self._is_element(node, *LISTING_TAGS) or \
+                self.element_handlers.get(node.name) != 'render_listing' or \
+                not self._uses_subconverter(runner, listing.ListConverter):
+            return None
+
+        for end in range(len(nodes) - 1, index, -1):
+            if self._is_element(nodes[end], node.name):
+                return end
+        return index
+
+    def _uses_subconverter(self, runner, converter_class):
+        return runner.get_subconverter_by_pattern(
+            converter_class.pattern) is converter_class
+
+    def _convert_listing_environment(self, runner, node, level=0):
+        # Like the `ListConverter`, only lists nested directly in a list
+        # count as nesting levels. The content of the items is converted
+        # separately, starting at level 0 again.
+        has_items = any(self._is_element(elm, 'li', 'dt', 'dd')
+                        for elm in node.contents)
+
+        if has_items and level < listing.LIST_NESTING_LIMIT:
+            latex = self._convert_listing_items(runner, node, level + 1)
+            if not latex:
+                return []
+
+            env = listing.ListConverter.listing_tag_mapping[node.name]
+            return ['', r'\begin{%s}' % env, latex, r'\end{%s}' % env]
+
+        latex = self._convert_listing_items(runner, node, level)
+        return latex and [latex] or []
+
+    def _convert_listing_items(self, runner, node, level):
+        latex = []
+        dt_node = None
+
+        for elm in node.contents:
+            if self._is_element(elm, 'li') and node.name != 'dl':
+                content = self._get_node_content(runner, elm)
+                if content:
+                    latex.append(r'\item %s' % content.strip())
+
+            elif self._is_element(elm, 'dt') and node.name == 'dl':
+                dt_node = elm
+
+            elif self._is_element(elm, 'dd') and node.name == 'dl' and \
+                    dt_node is not None:
+                dt_content = self._get_node_content(runner, dt_node) or ''
+                dd_content = self._get_node_content(runner, elm) or ''
+                latex.append(r'\item[%s] %s' % (dt_content.strip(),
+                                                dd_content.strip()))
+                dt_node = None
+
+            elif self._is_element(elm, *LISTING_TAGS):
+                latex.extend(self._convert_listing_environment(
+                        runner, elm, level))
+
+            else:
+                content = self._get_node_content(runner, elm)
+                if content is not None:
+                    latex.append(content)
+
+        return '\n'.join(latex)
+
+    def _get_node_content(self, runner, elm):
+        if isinstance(elm, Tag):
+            nodes = elm.contents
+        elif type(elm) is NavigableString and elm.strip():
+            nodes = [elm]
+        else:
+            nodes = None
+
+        if not nodes:
+            return None
+        return runner.convert_nodes(nodes)
+
+    def _is_element(self, node, *names):
+        return isinstance(node, Tag) and node.name in names
+
+    def _starts_with_space(self, node):
+        # Like the pattern, only a space right after the opening tag is
+        # moved, but not the space of a nested element.
+        if node.name not in SPACE_MOVING_TAGS or node.attrs \
+                or not node.contents:
+            return False
+        first = node.contents[0]
+        return type(first) is NavigableString and first[:1] in (' ', '\n')
+
+    def _diff(self, legacy_latex, latex):
+        return list(difflib.unified_diff(
+                legacy_latex.splitlines(), latex.splitlines(),
+                'regular expression converter', 'DOM converter',
+                lineterm=''))
@@ -0,0 +1,75 @@
+from Products.CMFCore.utils import getToolByName
+import re
+
+
+# Matches the UID of links to "resolveuid/<UID>" in the HTML.
+RESOLVEUID_EXPRESSION = re.compile(
+    r'href="(?:[^"]*/)?resolve[uU]id/([^/"]+)"')
+
+# Maximum amount of UIDs looked up with a single catalog query.
+UID_BATCH_SIZE = 500
+
+
+class LinkResolver(object):
+    """Resolves the URLs of links for a converter. The URLs of the UIDs and
+    the URL of the context are cached for the lifetime of the resolver,
+    which is a build of the assembler.
+
+    The UIDs of all "resolveuid" links of the HTML are looked up in batches
+    with `prefetch`, so that resolving the links does not query the
+    catalog for every link.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.queries = 0
+        self._urls = {}
+        self._context_url = None
+
+    def get_context_url(self):
+        """Returns the absolute URL of the context, which relative links are
+        relative to.
+        """
+        if self._context_url is None:
+            self._context_url = self.context.absolute_url()
+        return self._context_url
+
+    def prefetch(self, html):
+        """Looks up the URLs of the UIDs of all "resolveuid" links in the
+        `html`, which are not known yet.
+        """
+        if 'resolve' not in html:
+            return
+
+        uids = set(RESOLVEUID_EXPRESSION.findall(html))
+        self.resolve_uids(uid for uid in uids if uid not in self._urls)
+
+    def resolve_uids(self, uids):
+        """Looks up the URLs of the `uids` in batches of `UID_BATCH_SIZE`.
+        """
+        uids = sorted(uids)
+        for start in range(0, len(uids), UID_BATCH_SIZE):
+            self._query(uids[start:start + UID_BATCH_SIZE])
+
+    def get_url(self, uid):
+        """Returns the URL of the object with the `uid` or `None` when there
+        is no such object.
+        """
+        if uid not in self._urls:
+            self._query([uid])
+        return self._urls[uid]
+
+    def _query(self, uids):
+        catalog = getToolByName(self.context, 'portal_catalog')
+        self.queries += 1
+
+        if len(uids) == 1:
+            result = catalog.unrestrictedSearchResults(UID=uids[0])
+            self._urls[uids[0]] = result and result[0].getURL() or None
+            return
+
+        urls = dict.fromkeys(uids)
+        for brain in catalog.unrestrictedSearchResults(UID=uids):
+            if brain.UID in urls:
+                urls[brain.UID] = brain.getURL()
+        self._urls.update(urls)
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import hashlib
+
+
+# Calls on the layout which are recorded while converting and replayed when
+# the conversion is taken from the cache.
+REPLAYED_LAYOUT_METHODS = ('use_package', 'remove_package', 'use_babel')
+
+
+class ConversionCache(object):
+    """Least recently used cache of HTML to LaTeX conversions.
+
+    An entry consists of the LaTeX and the calls to the layout done while
+    converting (e.g. `use_package` calls of subconverters), which are
+    replayed when the entry is used. The cache keeps `size` entries.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries[key] = entry
+        return entry
+
+    def set(self, key, latex, calls):
+        self._entries.pop(key, None)
+        self._entries[key] = (latex, tuple(calls))
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self):
+        return {'size': self.size,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+class LayoutCallRecorder(object):
+    """Proxy of the layout recording the calls to be replayed. Using any
+    other attribute of the layout makes the conversion uncacheable, since
+    it may depend on or change the state of the layout.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.calls = []
+        self.cacheable = True
+
+    def __getattr__(self, name):
+        value = getattr(self.layout, name)
+        if name not in REPLAYED_LAYOUT_METHODS:
+            self.cacheable = False
+            return value
+
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return value(*args, **kwargs)
+        return record
+
+
+def make_key(html, trim, program, custom_patterns=None,
+             custom_subconverters=None, plain=False):
+    """Returns the cache key of converting `html` with the compiled pattern
+    `program` and the custom patterns and subconverters. Returns `None`
+    when the conversion cannot be cached.
+    """
+    if isinstance(html, unicode):
+        html = html.encode('utf-8')
+
+    key = (hashlib.sha1(html).hexdigest(),
+           len(html),
+           bool(trim),
+           plain,
+           program.get_key(),
+           _freeze(custom_patterns),
+           _freeze(custom_subconverters))
+
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def memoized_convert(converter, convert, html, trim, program,
+                     custom_patterns=None, custom_subconverters=None,
+                     plain=False):
+    """Returns the result of `convert()`, which converts `html` with
+    `converter`. The result is cached in the `convert_cache` of the
+    converter, if it has one, and the recorded layout calls are replayed on
+    a cache hit. See `make_key` for the other arguments.
+    """
+    # Third party converters may not support caching.
+    cache = getattr(converter, 'convert_cache', None)
+    if cache is None:
+        return convert()
+
+    key = make_key(html, trim, program, custom_patterns,
+                   custom_subconverters, plain=plain)
+    if key is None:
+        return convert()
+
+    entry = cache.get(key)
+    if entry is not None:
+        latex, calls = entry
+        for name, args, kwargs in calls:
+            getattr(converter.layout, name)(*args, **kwargs)
+        return latex
+
+    recorder = LayoutCallRecorder(converter.layout)
+    converter.layout = recorder
+    try:
+        latex = convert()
+    finally:
+        converter.layout = recorder.layout
+
+    if recorder.cacheable:
+        cache.set(key, latex, recorder.calls)
+    return latex
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
@@ -0,0 +1,115 @@
+from BeautifulSoup import BeautifulSoup
+from collections import OrderedDict
+from ftw.pdfgenerator.utils import html2xmlentities
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+from xml.sax.saxutils import escape
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    LXML_AVAILABLE = False
+else:
+    LXML_AVAILABLE = True
+
+
+class HTMLParser(object):
+    """Parses HTML fragments of the subconverters into minidom trees.
+    Backends differ in how they clean up HTML which is not well-formed
+    XML (see `cleanup`); the trees are always built by minidom.
+    """
+
+    name = None
+
+    def cleanup(self, html, encoding=None):
+        """Returns the HTML as well-formed XML string.
+        """
+        raise NotImplementedError()
+
+    def parse(self, html):
+        """Cleans up the utf-8 encoded `html` and returns the minidom
+        document.
+        """
+        # minidom hates htmlentities, but loves xmlentities -.-
+        html = html2xmlentities(self.cleanup(html, 'utf-8'))
+        return minidom.parseString(html)
+
+    def parse_fragment(self, html):
+        """Returns the minidom nodes of the `html`, which may consist of
+        multiple nodes. The HTML is only cleaned up when it is not
+        well-formed.
+        """
+        html = html2xmlentities('<dummy>%s</dummy>' % html)
+        try:
+            dom = minidom.parseString(html)
+        except ExpatError:
+            dom = minidom.parseString(self.cleanup(html))
+
+        return dom.getElementsByTagName('dummy')[0].childNodes
+
+
+class BeautifulSoupParser(HTMLParser):
+    """Cleans up the HTML with BeautifulSoup 3.
+    """
+
+    name = 'beautifulsoup'
+
+    def cleanup(self, html, encoding=None):
+        return str(BeautifulSoup(html, fromEncoding=encoding))
+
+
+class LxmlParser(HTMLParser):
+    """Cleans up the HTML with the HTML parser of lxml, which is a lot
+    faster than BeautifulSoup and needs less memory. Requires lxml.
+    """
+
+    name = 'lxml'
+
+    def cleanup(self, html, encoding=None):
+        if not isinstance(html, unicode):
+            html = html.decode(encoding or 'utf-8', 'replace')
+
+        xml = []
+        for fragment in lxml_html.fragments_fromstring(html):
+            if isinstance(fragment, basestring):
+                # text before the first element
+                xml.append(escape(fragment))
+            else:
+                xml.append(etree.tostring(fragment, encoding=unicode,
+                                          method='xml'))
+
+        return u''.join(xml).encode('utf-8')
+
+
+# The parser used unless another parser is configured. BeautifulSoup keeps
+# the behaviour of earlier versions.
+DEFAULT_PARSER = BeautifulSoupParser.name
+
+PARSERS = OrderedDict((
+        (LxmlParser.name, LxmlParser),
+        (BeautifulSoupParser.name, BeautifulSoupParser),
+        ))
+
+
+def get_available_parsers():
+    """Returns the names of the parsers which can be used, the fastest
+    first.
+    """
+    names = list(PARSERS)
+    if not LXML_AVAILABLE:
+        names.remove(LxmlParser.name)
+    return names
+
+
+def get_parser(name=None):
+    """Returns the parser `name`. Without `name`, the `DEFAULT_PARSER` is
+    returned.
+    """
+    if name is None:
+        name = DEFAULT_PARSER
+
+    if name not in get_available_parsers():
+        raise ValueError('The HTML parser "%s" is not available.' % name)
+
+    return PARSERS[name]()
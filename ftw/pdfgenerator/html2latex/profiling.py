@@ -0,0 +1,75 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex.program import MODE_REPLACE_MANY
+import time
+
+
+STEP_KINDS = {
+    interfaces.HTML2LATEX_MODE_REPLACE: 'replace',
+    MODE_REPLACE_MANY: 'replace',
+    interfaces.HTML2LATEX_MODE_REGEXP: 'regexp',
+    interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION: 'subconverter',
+    }
+
+
+def get_step_label(mode, search, replace):
+    """Returns the label of a program step in the profile: the dotted name
+    of the subconverter, the regular expression or the replaced string.
+    Merged literal replacements are labeled with their alternation.
+    """
+    if mode == interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION:
+        return '%s.%s' % (getattr(replace, '__module__', ''),
+                          getattr(replace, '__name__', repr(replace)))
+
+    return getattr(search, 'pattern', search)
+
+
+class ConversionProfile(object):
+    """Collects the time spent in each pattern and subconverter of the
+    converter, aggregated over all conversions and nested runners.
+
+    The time of a subconverter includes the time of the nested runners it
+    starts for converting its content.
+    """
+
+    timer = staticmethod(time.time)
+
+    def __init__(self):
+        self.entries = {}
+
+    def record(self, mode, search, replace, duration, matches, bytes_in,
+               bytes_out):
+        """Adds a run of a program step to the profile.
+        """
+        label = get_step_label(mode, search, replace)
+        entry = self.entries.get(label)
+        if entry is None:
+            entry = self.entries[label] = {
+                'pattern': label,
+                'kind': STEP_KINDS.get(mode, mode),
+                'time': 0.0,
+                'calls': 0,
+                'matches': 0,
+                'bytes_in': 0,
+                'bytes_out': 0}
+
+        entry['time'] += duration
+        entry['calls'] += 1
+        entry['matches'] += matches
+        entry['bytes_in'] += bytes_in
+        entry['bytes_out'] += bytes_out
+
+    def get_report(self):
+        """Returns the profile as dict of the pattern label and the counters
+        of the pattern (kind, time, calls, matches, bytes in and out).
+        """
+        return dict((label, dict(entry))
+                    for label, entry in self.entries.items())
+
+    def get_rows(self):
+        """Returns the entries of the profile, the slowest first.
+        """
+        return sorted(self.get_report().values(),
+                      key=lambda entry: (-entry['time'], entry['pattern']))
+
+    def clear(self):
+        self.entries.clear()
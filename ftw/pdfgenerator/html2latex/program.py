@@ -0,0 +1,406 @@
+from ftw.pdfgenerator import interfaces
+from itertools import imap
+import operator
+import re
+import sre_constants
+import sre_parse
+
+
+PLACEHOLDERS = (
+    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER,
+    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_TOP,
+    interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_BOTTOM,
+    )
+
+# Step mode replacing multiple literals in a single pass. The search term
+# of the step is an alternation of the literals and the replacement a
+# function looking up the replacement of the matched literal.
+MODE_REPLACE_MANY = 'replace many'
+
+# The compiled regular expressions and merged replacements are shared by
+# all programs. The caches are cleared when they grow larger than this
+# amount of entries, which only happens with dynamically generated custom
+# patterns.
+MAX_CACHED_EXPRESSIONS = 1000
+
+# Maximum amount of literals derived from a regular expression, which are
+# looked up in the HTML before running the expression.
+MAX_REQUIRED_LITERALS = 3
+
+# HTML consisting of these characters only is plain text, which only few
+# patterns can match. The steps of a program which may match plain text are
+# determined once, the others are skipped for plain text.
+PLAIN_TEXT_CHARACTERS = frozenset(
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ,;()!?')
+PLAIN_TEXT_EXPRESSION = re.compile(r'[a-zA-Z0-9 ,;()!?]*\Z')
+
+_expressions = {}
+_merged_replacements = {}
+_required_literals = {}
+_programs = {}
+
+
+def compile_expression(search):
+    """Returns the compiled regular expression `search`, compiled with
+    `re.DOTALL` as the converter expects.
+    """
+    xpr = _expressions.get(search)
+    if xpr is None:
+        if len(_expressions) >= MAX_CACHED_EXPRESSIONS:
+            _expressions.clear()
+        xpr = _expressions[search] = re.compile(search, re.DOTALL)
+    return xpr
+
+
+def get_shared_program(patterns):
+    """Returns a `PatternProgram` of `patterns`, which is shared with
+    other lists of equal patterns. Runners with custom patterns (e.g. the
+    runners of table cells) create equal pattern lists over and over.
+    """
+    key = freeze_patterns(patterns)
+    try:
+        program = _programs.get(key)
+    except TypeError:
+        # Unhashable patterns are not shared.
+        return PatternProgram(patterns)
+
+    if program is None:
+        if len(_programs) >= MAX_CACHED_EXPRESSIONS:
+            _programs.clear()
+        program = _programs[key] = PatternProgram(patterns)
+    return program
+
+
+def freeze_patterns(patterns):
+    """Returns the patterns as tuple of tuples, which is hashable when
+    the items of the patterns are hashable.
+    """
+    return tuple(freeze_pattern(pattern) for pattern in patterns)
+
+
+def freeze_pattern(pattern):
+    if isinstance(pattern, list):
+        return tuple(pattern)
+    return pattern
+
+
+def patterns_identical(first, second):
+    """Returns `True` when the pattern lists contain the same pattern
+    objects.
+    """
+    if first is None or second is None or len(first) != len(second):
+        return False
+    return all(imap(operator.is_, first, second))
+
+
+def required_literals(search):
+    """Returns the literals of the regular expression `search` which are
+    part of every match, the longest first. The expression cannot match
+    HTML which does not contain all of them.
+    """
+    literals = _required_literals.get(search)
+    if literals is not None:
+        return literals
+
+    literals = ()
+    if not isinstance(search, unicode):
+        try:
+            parsed = sre_parse.parse(search, re.DOTALL)
+        except sre_constants.error:
+            parsed = None
+
+        if parsed is not None and \
+                not parsed.pattern.flags & re.IGNORECASE:
+            literals = _literal_runs(parsed)
+
+    if len(_required_literals) >= MAX_CACHED_EXPRESSIONS:
+        _required_literals.clear()
+    _required_literals[search] = literals
+    return literals
+
+
+def _literal_runs(parsed):
+    runs = set()
+    run = []
+    for op, argument in _flatten(parsed):
+        if op == sre_constants.LITERAL:
+            run.append(chr(argument))
+        elif run:
+            runs.add(''.join(run))
+            run = []
+
+    if run:
+        runs.add(''.join(run))
+
+    runs = sorted(runs, key=lambda run: (-len(run), run))
+    return tuple(runs[:MAX_REQUIRED_LITERALS])
+
+
+def _flatten(parsed):
+    # Groups are part of the sequence, since they do not change what is
+    # matched.
+    for op, argument in parsed:
+        if op == sre_constants.SUBPATTERN:
+            for item in _flatten(argument[1]):
+                yield item
+        else:
+            yield op, argument
+
+
+def literals_overlap(first, second):
+    """Returns `True` when an occurrence of the string `second` may overlap
+    with an occurrence of the string `first`.
+    """
+    if first in second or second in first:
+        return True
+
+    for length in range(1, min(len(first), len(second))):
+        if first.endswith(second[:length]) or \
+                second.endswith(first[:length]):
+            return True
+
+    return False
+
+
+def merge_replacements(replacements):
+    """Merges a run of consecutive literal replacements (tuples of the
+    search and the replacement) into steps. Replacements are merged into a
+    single pass when they cannot interfere with each other: the search
+    terms do not overlap and no search term may match text produced by a
+    previous replacement of the same pass. The order is kept, so the
+    result is the same as replacing one after another.
+    """
+    key = tuple(replacements)
+    steps = _merged_replacements.get(key)
+    if steps is not None:
+        return steps
+
+    groups = []
+    for search, replace in replacements:
+        if groups and search and all(
+                _independent(previous, (search, replace))
+                for previous in groups[-1]):
+            groups[-1].append((search, replace))
+        else:
+            groups.append([(search, replace)])
+
+    steps = tuple(_replacement_step(group) for group in groups)
+    if len(_merged_replacements) >= MAX_CACHED_EXPRESSIONS:
+        _merged_replacements.clear()
+    _merged_replacements[key] = steps
+    return steps
+
+
+def is_plain_text(text):
+    """Returns `True` when `text` consists of `PLAIN_TEXT_CHARACTERS`
+    only.
+    """
+    return PLAIN_TEXT_EXPRESSION.match(text) is not None
+
+
+def _independent(previous, following):
+    if literals_overlap(previous[0], following[0]):
+        return False
+
+    if not previous[1]:
+        # Removing text joins its neighbours, which may form a new
+        # occurrence of a search term longer than one character.
+        return len(following[0]) == 1
+
+    return not literals_overlap(previous[1], following[0])
+
+
+def _replacement_step(group):
+    if len(group) == 1:
+        search, replace = group[0]
+        return (interfaces.HTML2LATEX_MODE_REPLACE, search, replace, False)
+
+    xpr = re.compile('|'.join(re.escape(search) for search, _ in group))
+    lookup = dict(group).__getitem__
+
+    def replace(match):
+        return lookup(match.group(0))
+
+    replace.literals = tuple(search for search, _ in group)
+    return (MODE_REPLACE_MANY, xpr, replace, False)
+
+
+def _plain_literal(literal):
+    if not isinstance(literal, basestring):
+        return True
+    return PLAIN_TEXT_CHARACTERS.issuperset(literal)
+
+
+class PatternProgram(object):
+    """The compiled form of a list of converter patterns.
+
+    The program is built once per pattern list and shared by the converter
+    and all runners using the same patterns, including the runners of the
+    subconverters. Each step is a tuple of the mode, the search term (a
+    compiled expression for the regexp modes), the replacement and whether
+    the step is repeated until nothing changes. Placeholders are removed.
+
+    Runs of consecutive literal replacements are merged into single pass
+    steps (`MODE_REPLACE_MANY`) where possible.
+
+    Regular expression steps are skipped when the HTML does not contain the
+    literals required for a match (see `may_match`). The literals are
+    derived from the expression or declared by subconverters with
+    `trigger_literals`. Plain text only runs the steps which may match plain
+    text (see `get_plain_text_steps`).
+    """
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self._key = None
+        self.steps = self._merge_replacements(
+            self._compile_pattern(pattern)
+            for pattern in self.patterns
+            if pattern not in PLACEHOLDERS)
+        self.literals = tuple(self._get_literals(step)
+                              for step in self.steps)
+        self.checked = [0] * len(self.steps)
+        self.skipped = [0] * len(self.steps)
+        self._plain_text_steps = None
+        self._derived_programs = {}
+
+    def may_match(self, index, html):
+        """Returns `False` when the step `index` cannot match `html`,
+        because a required literal is missing.
+        """
+        requirements = self.literals[index]
+        if not requirements:
+            return True
+
+        self.checked[index] += 1
+        for alternatives in requirements:
+            for literal in alternatives:
+                if literal in html:
+                    break
+            else:
+                self.skipped[index] += 1
+                return False
+
+        return True
+
+    def get_derived_program(self, registrations, patterns):
+        """Returns the program of `patterns`, which are the patterns of this
+        program changed by `registrations` (tuples of the registered pattern,
+        the placeholder and whether existing patterns are replaced).
+        """
+        try:
+            program = self._derived_programs.get(registrations)
+        except TypeError:
+            return get_shared_program(patterns)
+
+        if program is None:
+            if len(self._derived_programs) >= MAX_CACHED_EXPRESSIONS:
+                self._derived_programs.clear()
+            program = self._derived_programs[registrations] = \
+                get_shared_program(patterns)
+        return program
+
+    def get_plain_text_steps(self):
+        """Returns the indexes of the steps which may match plain text (see
+        `is_plain_text`). The other steps cannot change plain text.
+        """
+        if self._plain_text_steps is None:
+            self._plain_text_steps = tuple(
+                index for index in range(len(self.steps))
+                if self._may_match_plain_text(index))
+        return self._plain_text_steps
+
+    def get_skip_stats(self):
+        """Returns how often the steps with required literals were checked
+        and skipped.
+        """
+        stats = []
+        for index, (mode, search, replace, _repeat) in enumerate(self.steps):
+            if not self.literals[index]:
+                continue
+
+            stats.append({'pattern': getattr(search, 'pattern', search),
+                          'mode': mode,
+                          'literals': self.literals[index],
+                          'checked': self.checked[index],
+                          'skipped': self.skipped[index]})
+        return stats
+
+    def compiled_from(self, patterns):
+        """Returns `True` when the program was compiled from exactly the
+        pattern objects in `patterns`.
+        """
+        return patterns_identical(self.patterns, patterns)
+
+    def get_key(self):
+        """Returns a hashable key of the patterns, which is used for caching
+        conversions done with this program.
+        """
+        if self._key is None:
+            self._key = freeze_patterns(self.patterns)
+        return self._key
+
+    def _get_literals(self, step):
+        """Returns the requirements of the step: a tuple of alternatives,
+        of which at least one literal must be in the HTML each.
+        """
+        mode, search, replace, _repeat = step
+        if mode == interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION:
+            triggers = getattr(replace, 'trigger_literals', None)
+            if triggers:
+                return (tuple(triggers), )
+
+        if mode in (interfaces.HTML2LATEX_MODE_REGEXP,
+                    interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION):
+            return tuple((literal, ) for literal in
+                         required_literals(search.pattern))
+
+        return ()
+
+    def _may_match_plain_text(self, index):
+        mode, search, replace, _repeat = self.steps[index]
+        if mode == interfaces.HTML2LATEX_MODE_REPLACE:
+            return _plain_literal(search)
+
+        if mode == MODE_REPLACE_MANY:
+            return any(_plain_literal(literal) for literal in replace.literals)
+
+        # Every group of required literals must have a plain text
+        # alternative. Steps without requirements may always match.
+        for alternatives in self.literals[index]:
+            if not any(_plain_literal(literal) for literal in alternatives):
+                return False
+        return True
+
+    def _merge_replacements(self, steps):
+        merged = []
+        run = []
+        for step in steps:
+            if step[0] == interfaces.HTML2LATEX_MODE_REPLACE:
+                run.append((step[1], step[2]))
+                continue
+
+            if run:
+                merged.extend(merge_replacements(run))
+                run = []
+            merged.append(step)
+
+        if run:
+            merged.extend(merge_replacements(run))
+        return tuple(merged)
+
+    def _compile_pattern(self, pattern):
+        mode = pattern[0]
+        search = pattern[1]
+        replace = pattern[2]
+        modifiers = ()
+
+        if len(pattern) == 4:
+            modifiers = pattern[3]
+
+        if mode in (interfaces.HTML2LATEX_MODE_REGEXP,
+                    interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION):
+            search = compile_expression(search)
+
+        repeat = interfaces.HTML2LATEX_REPEAT_MODIFIER in modifiers
+        return (mode, search, replace, repeat)
@@ -1,4 +1,6 @@
 from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex.parser import get_parser
+from xml.dom import minidom
 from zope.interface import implements
 
 
@@ -9,6 +11,19 @@ class SubConverter(object):
     pattern = None
     placeholder = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER
 
+    # search the whole HTML again after each replacement, which is
+    # necessary when replacing text before the match
+    rescan_after_replace = False
+
+    # the subconverter is only run when one of these strings is in the HTML
+    # (optional, derived from the pattern when not set)
+    trigger_literals = None
+
+    # function converting all matches at once (optional), called with the
+    # compiled pattern and the HTML and returning the converted HTML and
+    # the amount of matches; the subconverter is not instantiated then
+    replace_all = None
+
     def __init__(self, converter, match, html):
         self.converter = converter
         self.match = match
@@ -22,6 +37,41 @@ class SubConverter(object):
     def get_html(self):
         return self.fullhtml[self.match.start():self.match.end()]
 
+    def get_html_parser(self):
+        """Returns the `HTMLParser` of the converter for parsing the
+        matched HTML.
+        """
+        # Third party converters may not provide a parser.
+        parser = getattr(self.converter.converter, 'html_parser', None)
+        return parser or get_parser()
+
+    def get_parsed_node(self):
+        """Returns the DOM node of the matched HTML, when a subconverter
+        converting a parent node already parsed it (see `serialize_nodes`).
+        Otherwise `None` is returned and the HTML needs to be parsed.
+        """
+        # Third party runners may not know about parsed nodes.
+        parsed_nodes = getattr(self.converter, 'parsed_nodes', None)
+        if not parsed_nodes:
+            return None
+        return parsed_nodes.get(self.get_html())
+
+    def serialize_nodes(self, nodes):
+        """Returns the HTML of the minidom `nodes` as unicode for converting
+        it with the runner. The element nodes are registered with the
+        runner, so that nested subconverters matching exactly one of them
+        use the node instead of parsing its HTML again.
+        """
+        parsed_nodes = getattr(self.converter, 'parsed_nodes', None)
+        html = []
+        for node in nodes:
+            xml = node.toxml()
+            if parsed_nodes is not None and \
+                    node.nodeType == minidom.Node.ELEMENT_NODE:
+                parsed_nodes[xml.encode('utf8')] = node
+            html.append(xml)
+        return u''.join(html)
+
     def replace_and_lock(self, latex):
         return self.converter.replace_and_lock(
             self.match.start(),
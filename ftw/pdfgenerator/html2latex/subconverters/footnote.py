@@ -6,6 +6,8 @@ class FootnoteConverter(subconverter.SubConverter):
 
     pattern = (r'<span [^>]*?class="(?P<class>[^"]*?footnote[^"]*?)"[^>]*?>'
                '(?P<content>.*?)</span>')
+    # footnotes without text are not converted
+    trigger_literals = ('data-footnote=', )
 
     def __call__(self):
         if 'footnote' not in self.match.group('class').split():
@@ -1,6 +1,86 @@
 from ftw.pdfgenerator import interfaces
 from ftw.pdfgenerator.html2latex import subconverter
+from ftw.pdfgenerator.utils import ENTITY_CHARACTERS
 from ftw.pdfgenerator.utils import decode_htmlentities
+from ftw.pdfgenerator.utils import decode_htmlentity
+
+
+# The utf-8 encoded characters of the named entities.
+ENTITY_LATEX = dict((name, character.encode('utf8'))
+                    for name, character in ENTITY_CHARACTERS.items())
+
+# Decoded characters which may start a new entity with the following text,
+# e.g. "&#38;" followed by "lt;".
+CHAINING_CHARACTERS = ('&', '\\')
+
+# Maximum length of an entity matched by the pattern.
+MAX_ENTITY_LENGTH = 13
+
+
+def decode_entity(match):
+    """Returns the utf-8 encoded character of the entity `match`. Unknown
+    named entities are returned unchanged.
+    """
+    if match.group(1) == '#':
+        return decode_htmlentity(match).encode('utf8')
+    return ENTITY_LATEX.get(match.group(2), match.group())
+
+
+def decode_entities(xpr, html):
+    """Decodes all entities matched by `xpr` in a single pass and returns
+    the HTML and the amount of matches.
+
+    A decoded "&" or backslash may form a new entity with the text
+    following it, which is decoded too, as when converting the entities
+    one by one.
+    """
+    chained = []
+
+    def substitute(match):
+        latex = decode_entity(match)
+        if latex in CHAINING_CHARACTERS and not chained and _chained_entity(
+                xpr, latex, html, match.end()):
+            chained.append(match)
+        return latex
+
+    result, matches = xpr.subn(substitute, html)
+    if chained:
+        return _decode_chained_entities(xpr, html)
+    return result, matches
+
+
+def _chained_entity(xpr, latex, html, position):
+    return xpr.match(latex + html[position:position + MAX_ENTITY_LENGTH])
+
+
+def _decode_chained_entities(xpr, html):
+    parts = []
+    position = 0
+    matches = 0
+
+    while True:
+        match = xpr.search(html, position)
+        if match is None:
+            break
+
+        matches += 1
+        parts.append(html[position:match.start()])
+        latex = decode_entity(match)
+        position = match.end()
+
+        while latex in CHAINING_CHARACTERS:
+            chained = _chained_entity(xpr, latex, html, position)
+            if chained is None:
+                break
+
+            matches += 1
+            position += chained.end() - len(latex)
+            latex = decode_entity(chained)
+
+        parts.append(latex)
+
+    parts.append(html[position:])
+    return ''.join(parts), matches
 
 
 class HtmlentitiesConverter(subconverter.SubConverter):
@@ -9,6 +89,10 @@ class HtmlentitiesConverter(subconverter.SubConverter):
     pattern = r'\\?&\\?(#?)(\d{1,5}|\w{1,8}|x[\w\d]{1,5});'
     placeholder = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_BOTTOM
 
+    # All entities are decoded in one pass instead of instantiating the
+    # subconverter for each entity.
+    replace_all = staticmethod(decode_entities)
+
     def __call__(self):
         html = self.get_html()
         latex = decode_htmlentities(html).encode('utf8')
@@ -1,5 +1,5 @@
-from Products.CMFCore.utils import getToolByName
 from ftw.pdfgenerator.html2latex import subconverter
+from ftw.pdfgenerator.html2latex.links import LinkResolver
 import os.path
 import re
 
@@ -9,17 +9,23 @@ class HyperlinkConverter(subconverter.SubConverter):
     pattern = r'<a.*?href="(.*?)".*?>(.*?)</a>'
 
     def __call__(self):
-        context = self.get_context()
-
         url, label = self.match.groups()
-        label = (self.converter.convert(label)
+        self.replace_and_lock(
+            self.convert_link(url, self.converter.convert(label)))
+
+    def convert_link(self, url, label):
+        """Returns the LaTeX link to the `url` of the HTML link with the
+        already converted `label`.
+        """
+        resolver = self.get_link_resolver()
+        label = (label
                  .replace('""/', '/')
                  .replace('"=', '-'))
 
         is_relative = '://' not in url and not url.startswith('mailto:')
 
         if is_relative:
-            url = os.path.join(context.absolute_url(), url)
+            url = os.path.join(resolver.get_context_url(), url)
             url = url.replace('/./', '/')
 
         url = self.resolve_uid(url)
@@ -36,7 +42,7 @@ class HyperlinkConverter(subconverter.SubConverter):
 
         self.get_layout().use_package('url', 'hyphens')
         self.get_layout().use_package('hyperref')
-        self.replace_and_lock(self.latex_link(url, label, url_label))
+        return self.latex_link(url, label, url_label)
 
     def latex_link(self, url, label, url_label):
         href = r'\href{%s}{%s}'
@@ -49,12 +55,14 @@ class HyperlinkConverter(subconverter.SubConverter):
 
         parts = url.split('/')
         if parts[-2] == 'resolveuid' or parts[-2] == 'resolveUid':
-            context = self.converter.converter.context
-            catalog = getToolByName(context, 'portal_catalog')
-
-            uid = parts[-1]
-            result = catalog.unrestrictedSearchResults(UID=uid)
-            if result:
-                url = result[0].getURL()
+            url = self.get_link_resolver().get_url(parts[-1]) or url
 
         return url
+
+    def get_link_resolver(self):
+        # Third party converters may not provide a link resolver.
+        get_resolver = getattr(self.converter.converter,
+                               'get_link_resolver', None)
+        if get_resolver is None:
+            return LinkResolver(self.get_context())
+        return get_resolver()
@@ -1,8 +1,5 @@
-from BeautifulSoup import BeautifulSoup
 from ftw.pdfgenerator.html2latex import subconverter
-from ftw.pdfgenerator.utils import html2xmlentities
 from xml.dom import minidom
-from xml.parsers.expat import ExpatError
 
 
 # LaTeX allows a maximum list nesting of 4. Deeper nesting will be flattened
@@ -17,6 +14,7 @@ class ListConverter(subconverter.SubConverter):
     """
 
     pattern = r'<(ul|ol|dl)(.*)</\1>'
+    trigger_literals = ('<ul', '<ol', '<dl')
     listing_tag_mapping = {
         'ul': 'itemize',
         'ol': 'enumerate',
@@ -28,34 +26,32 @@ class ListConverter(subconverter.SubConverter):
         self.nesting_level = 0
 
     def __call__(self):
-        html = self.get_html()
-
-        # minidom hates htmlentities, but loves xmlentities -.-
-        html = '<dummy>%s</dummy>' % html
-        html = html2xmlentities(html)
-
-        # parse DOM
-        try:
-            dom = minidom.parseString(html)
-        except ExpatError, exc:
-            # cleanup html with BeautifulSoup
-            html = str(BeautifulSoup(html))
-            dom = minidom.parseString(html)
-
         latex = []
 
-        for node in dom.getElementsByTagName('dummy')[0].childNodes:
+        for node in self.parse():
             if node.nodeType == minidom.Node.ELEMENT_NODE and \
                     node.tagName.lower() in self.listing_tag_mapping.keys():
 
                 latex.extend(self.convert_listing_environment(node))
 
             else:
-                latex.append(self.converter.convert(node.toxml()))
+                latex.append(self.converter.convert(
+                        self.serialize_nodes([node])))
 
         latex.append('')
         self.replace_and_lock('\n'.join(latex))
 
+    def parse(self):
+        """Returns the DOM nodes of the matched HTML.
+        """
+        node = self.get_parsed_node()
+        if node is not None and \
+                node.tagName.lower() in self.listing_tag_mapping.keys():
+            # The list was parsed by the subconverter of a parent node.
+            return [node]
+
+        return self.get_html_parser().parse_fragment(self.get_html())
+
     def convert_listing_environment(self, node):
         """Converts a <ul>, <ol> or <dl> node to latex.
         """
@@ -159,8 +155,7 @@ class ListConverter(subconverter.SubConverter):
             content_html = elm.toxml().strip()
 
         else:  # tag node
-            content_html = ''.join(
-                [e.toxml() for e in elm.childNodes])
+            content_html = self.serialize_nodes(elm.childNodes)
 
         if len(content_html) == 0:
             return None
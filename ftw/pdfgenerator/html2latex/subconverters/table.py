@@ -1,9 +1,7 @@
-from BeautifulSoup import BeautifulSoup
 from ftw.pdfgenerator import interfaces
 from ftw.pdfgenerator.html2latex import subconverter
 from ftw.pdfgenerator.html2latex import wrapper
 from ftw.pdfgenerator.html2latex.utils import generate_manual_caption
-from ftw.pdfgenerator.utils import html2xmlentities
 from operator import methodcaller
 from xml.dom import minidom
 import re
@@ -18,6 +16,19 @@ PLACEHOLDER_BOTTOM = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_BOTTOM
 PREVENT_CHARACTER = interfaces.HTML2LATEX_PREVENT_CHARACTER
 LONGTABLE_ROWS_THRESHOLD = 15
 
+# Carriage returns are not allowed in table cells with multicolumn.
+# We use \newline instead, which only creates a newline if the cell
+# width is defined, but does not fail otherwise.
+# The patterns are shared by all cells, so that the runners of the cells
+# share the compiled program too.
+CELL_PATTERNS = (
+    (MODE_REGEXP, r'<br[ \W]{0,}>\n*',
+     r'\%snewline ' % PREVENT_CHARACTER),
+
+    (wrapper.CustomPatternAtPlaceholderWrapper(
+            MODE_REPLACE, PLACEHOLDER_BOTTOM), '\n', r'\newline '),
+    )
+
 # Global border options:
 
 BORDER_TABLE_L = 2 ** 0
@@ -58,6 +69,17 @@ def parse_html_style_attribute(value):
     return data
 
 
+def lookup_index(items, item, cached_index):
+    """Returns the index of `item` in the list `items`. The
+    `cached_index` is verified first, so that looking up the rows and
+    columns of large tables over and over does not scan the lists.
+    """
+    if cached_index is not None and cached_index < len(items) and \
+            items[cached_index] is item:
+        return cached_index
+    return items.index(item)
+
+
 class TableConverter(subconverter.SubConverter):
     """The TableConverter converts <table>-Tags to latex.
     """
@@ -73,15 +95,25 @@ class TableConverter(subconverter.SubConverter):
         self.columns = []
         self._css_classes = None
         self._environment = None
+        self._dom_table = None
+        self._table_layout = None
 
     def __call__(self):
         self.parse()
 
-        # render table
-        latex = self.render()
-
         # replace with latex
-        self.replace_and_lock(latex)
+        self.replace_and_lock(self.render_table())
+
+    def convert_table(self, dom_table):
+        """Converts the minidom `dom_table` element, which was parsed by the
+        caller, and returns the LaTeX.
+        """
+        self.dom = self._dom_table = dom_table
+        self.parse_dom()
+        return self.render_table()
+
+    def render_table(self):
+        latex = self.render()
 
         # register packages
         if self.environment == 'longtable':
@@ -91,16 +123,17 @@ class TableConverter(subconverter.SubConverter):
         # The "calc" package allows to use "length+length" inline.
         self.converter.converter.layout.use_package('calc')
 
-    def parse(self):
-        html = self.get_html()
-        # cleanup html with BeautifulSoup
-        html = str(BeautifulSoup(html, fromEncoding='utf-8'))
-        # minidom hates htmlentities, but loves xmlentities -.-
-
-        html = html2xmlentities(html)
+        return latex
 
-        # parse DOM
-        self.dom = minidom.parseString(html)
+    def parse(self):
+        node = self.get_parsed_node()
+        if node is not None and node.tagName.lower() == 'table':
+            # The table was parsed by the subconverter of a parent node.
+            self.dom = self._dom_table = node
+            self.parse_dom()
+            return
+
+        self.dom = self.get_html_parser().parse(self.get_html())
         self.parse_dom()
 
     @property
@@ -117,16 +150,27 @@ class TableConverter(subconverter.SubConverter):
 
         return self._environment
 
+    def get_dom_table(self):
+        if self._dom_table is None:
+            self._dom_table = self.dom.getElementsByTagName('table')[0]
+        return self._dom_table
+
     def get_css_classes(self):
         if self._css_classes is None:
             self._css_classes = []
-            domTable = self.dom.getElementsByTagName('table')[0]
+            domTable = self.get_dom_table()
             classes = domTable.getAttribute('class').strip()
             self._css_classes = classes.split(' ')
         return self._css_classes
 
     def get_table_layout(self):
-        domTable = self.dom.getElementsByTagName('table')[0]
+        # The layout is looked up for every cell.
+        if self._table_layout is None:
+            self._table_layout = self._get_table_layout()
+        return self._table_layout
+
+    def _get_table_layout(self):
+        domTable = self.get_dom_table()
 
         border = domTable.hasAttribute('border')
         if border and int(border) > 0:
@@ -226,8 +270,7 @@ class TableConverter(subconverter.SubConverter):
 
         caption_tag = caption_tags[0]
 
-        content = ''.join([child.toxml() for child
-                           in caption_tag.childNodes])
+        content = self.serialize_nodes(caption_tag.childNodes)
         content = content.encode('utf8')
         latexContent = self.converter.convert(content)
 
@@ -238,7 +281,7 @@ class TableConverter(subconverter.SubConverter):
         return latexContent, insert_at_top
 
     def _get_caption_from_summary(self):
-        domTable = self.dom.getElementsByTagName('table')[0]
+        domTable = self.get_dom_table()
 
         caption = domTable.getAttribute('summary') or None
         if caption is not None:
@@ -369,6 +412,7 @@ class LatexColumn(object):
         self.cells = []
         self._width = _marker
         self._align = _marker
+        self._index = None
 
     def set_dom_col(self, dom_col):
         self.dom_col = dom_col
@@ -432,6 +476,11 @@ class LatexColumn(object):
         else:
             return False
 
+    def get_index(self):
+        self._index = lookup_index(self.table_converter.columns, self,
+                                   self._index)
+        return self._index
+
     def is_last_column(self):
         columns = self.table_converter.columns
         return columns[-1] == self
@@ -456,6 +505,7 @@ class LatexRow(object):
         self.table_converter = table_converter
         self.domTr = domTr
         self.cells = []
+        self._index = None
 
     def register_cell(self, cell):
         self.cells.append(cell)
@@ -466,12 +516,17 @@ class LatexRow(object):
                 return False
         return True
 
+    def get_index(self):
+        self._index = lookup_index(self.table_converter.rows, self,
+                                   self._index)
+        return self._index
+
     def is_first_row(self):
-        return self.table_converter.rows.index(self) == 0
+        return self.get_index() == 0
 
     def get_next_row(self):
         rows = self.table_converter.rows
-        next_row_index = rows.index(self) + 1
+        next_row_index = self.get_index() + 1
         try:
             return rows[next_row_index]
         except IndexError:
@@ -550,7 +605,7 @@ class LatexRow(object):
                 continue
 
             for column in cell.columns:
-                indexes.append(self.table_converter.columns.index(column) + 1)
+                indexes.append(column.get_index() + 1)
 
         return indexes
 
@@ -610,24 +665,12 @@ class LatexCell(object):
         return latex
 
     def render_content(self):
-        content = ''.join([child.toxml() for child
-                           in self.dom_cell.childNodes])
-
-        # Carriage returns are not allowed in table cells with multicolumn.
-        # We use \newline instead, which only creates a newline if the cell
-        # width is defined, but does not fail otherwise.
-        custom_patterns = [
-            (MODE_REGEXP, r'<br[ \W]{0,}>\n*',
-             r'\%snewline ' % PREVENT_CHARACTER),
-
-            (wrapper.CustomPatternAtPlaceholderWrapper(
-                    MODE_REPLACE, PLACEHOLDER_BOTTOM), '\n', r'\newline '),
-
-            ]
+        content = self.table_converter.serialize_nodes(
+            self.dom_cell.childNodes)
 
         content = content.encode('utf8')
         latex = self.converter.convert(content,
-                                       custom_patterns=custom_patterns)
+                                       custom_patterns=CELL_PATTERNS)
 
         if 'grey' in self.get_css_classes():
             self.converter.converter.layout.use_package('xcolor')
@@ -763,30 +806,38 @@ class LatexCell(object):
                 self._align = self.columns[0].get_align()
         return self._align
 
-    def has_left_border(self):
+    def has_left_border(self, check_neighbour=True):
         if self.columns[0].has_left_border():
             return True
 
         if 'border-left' in self.get_css_classes():
             return True
 
+        if not check_neighbour:
+            return False
+
+        # The neighbour does not look back at this cell, since two
+        # neighbours spanning multiple rows would ask each other forever.
         left_cell = self.get_left_cell()
         if left_cell and left_cell.get_rowspan() > 1 and \
-                left_cell.has_right_border():
+                left_cell.has_right_border(check_neighbour=False):
             return True
 
         return False
 
-    def has_right_border(self):
+    def has_right_border(self, check_neighbour=True):
         if self.columns[-1].has_right_border():
             return True
 
         if 'border-right' in self.get_css_classes():
             return True
 
+        if not check_neighbour:
+            return False
+
         right_cell = self.get_right_cell()
         if right_cell and right_cell.get_rowspan() > 1 and \
-                right_cell.has_left_border():
+                right_cell.has_left_border(check_neighbour=False):
             return True
 
         return False
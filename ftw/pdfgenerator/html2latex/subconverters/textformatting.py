@@ -32,6 +32,7 @@ class Textformatting(subconverter.SubConverter):
     """
 
     pattern = r'(\\(textbf|textit|emph){.*})'
+    trigger_literals = ('\\textbf{', '\\textit{', '\\emph{')
     placeholder = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER_BOTTOM
 
     def __call__(self):
@@ -17,7 +17,7 @@ class IPDFAssembler(Interface):
         """The PDF assembler is a multi-adapter adapting context and request.
         """
 
-    def build_pdf(layout=None, builder=None, request=None):
+    def build_pdf(layout=None, builder=None, request=None, stream=False):
         """Builds the LaTeX and converts it to a PDF. The pdf data is
         returned as string. If `request` is passed, it will send it writes
         it to the response using the ID of the current context as filename
@@ -26,6 +26,9 @@ class IPDFAssembler(Interface):
         Arguments:
         layout -- Use a custom layout for this build.
         request -- Write the resulting PDF to the request.
+        stream -- Instead of writing the PDF to the response, set the
+        headers and return an `IStreamIterator` of the PDF, which should be
+        returned by the view. Requires a `request`.
         """
 
     def build_latex(layout=None, builder=None, request=None):
@@ -38,7 +41,7 @@ class IPDFAssembler(Interface):
         `build_pdf`.
         """
 
-    def build_zip(layout=None, builder=None, request=None):
+    def build_zip(layout=None, builder=None, request=None, stream=False):
         """Builds the LaTeX and converts it to a PDF like `build_pdf` does,
         but returns a ZIP bundle of all used files (.tex-files, images,
         resources, the resulting .pdf, etc). If `request` is passed,
@@ -47,6 +50,63 @@ class IPDFAssembler(Interface):
         Arguments:
         layout -- Use a custom layout for this build.
         request -- Write the resulting ZIP to the request.
+        stream -- Return an `IStreamIterator` of the ZIP instead of writing
+        it to the response, like `build_pdf`.
+        """
+
+    def build_pdf_async(layout=None, builder=None, registry=None):
+        """Renders the LaTeX and converts it to a PDF in the background.
+        Returns a future (`concurrent.futures.Future`) of the PDF data.
+
+        Arguments:
+        layout -- Use a custom layout for this build.
+        registry -- An `IBuildJobRegistry`, the future is registered with.
+        """
+
+    def build_zip_async(layout=None, builder=None, registry=None):
+        """Renders the LaTeX and builds the ZIP bundle like `build_zip` in
+        the background. Returns a future of the ZIP data.
+
+        Arguments:
+        layout -- Use a custom layout for this build.
+        registry -- An `IBuildJobRegistry`, the future is registered with.
+        """
+
+    def build_profile(layout=None, builder=None, request=None):
+        """Renders the LaTeX with profiling the HTML to LaTeX converter of
+        the layout and returns the `ConversionProfile`. No PDF is built.
+
+        Arguments:
+        layout -- Use a custom layout for this build.
+        request -- Not relevant here, but the signature should match
+        `build_pdf`.
+        """
+
+
+class IBuildJobRegistry(Interface):
+    """Keeps track of builds running in the background.
+    """
+
+    def register(future, context=None, output=None):
+        """Registers the future of a build of `context` producing `output`
+        ("pdf" or "zip") and returns a job id.
+        """
+
+    def submit(assembler, output='pdf', filename=None, user_id=None,
+               **build_arguments):
+        """Renders the LaTeX with the `IPDFAssembler` and builds the
+        `output` ("pdf" or "zip") in the background. Returns the job id.
+        """
+
+    def get_job(job_id):
+        """Returns the status of the job as dict or `None` when there is no
+        such job. The status contains the `state` ("queued", "running",
+        "finished" or "failed"), the `stage` of the build and the `current`
+        and `total` pdflatex pass.
+        """
+
+    def get_result_path(job_id):
+        """Returns the path to the result of a finished job or `None`.
         """
 
 
@@ -58,12 +118,98 @@ class IConfig(Interface):
         'Boolean attribute. If `True`, the build directory will be removed '
         'after finishing the build.')
 
+    zip_deflate = Attribute(
+        'Boolean attribute. If `True`, the files of ZIP bundles are '
+        'deflated, except already compressed files such as PDFs and '
+        'images.')
+
     def get_build_directory():
         """Returns the path to a directory, where the PDF should be built.
         This method should not return the same path twice. The directory
         should exist and be writeable.
         """
 
+    format_cache_size = Attribute(
+        'Maximum size of the format cache in bytes. When exceeded, the least '
+        'recently used formats are removed.')
+
+    def get_format_cache_directory():
+        """Returns the path to a directory, where precompiled LaTeX formats
+        of the preambles are cached across builds. The directory is created
+        when it does not exist. Returns `None` when the cache is disabled.
+        """
+
+    build_workers = Attribute(
+        'Amount of threads running asynchronous builds (`build_async`).')
+
+    max_concurrent_builds = Attribute(
+        'Maximum amount of builds running at the same time in this process. '
+        'Further builds wait in a queue. `None` for no limit.')
+
+    max_queued_builds = Attribute(
+        'Maximum amount of builds waiting in the queue. Further builds are '
+        'rejected. `None` for no limit.')
+
+    build_queue_timeout = Attribute(
+        'Seconds after which a build waiting in the queue is rejected. '
+        '`None` for waiting forever.')
+
+    build_timeout = Attribute(
+        'Seconds after which a TeX process (a single pdflatex pass or '
+        'makeindex) is killed. `None` for no timeout.')
+
+    build_cpu_limit = Attribute(
+        'CPU time limit of TeX processes in seconds (RLIMIT_CPU). `None` '
+        'for no limit.')
+
+    build_memory_limit = Attribute(
+        'Address space limit of TeX processes in bytes (RLIMIT_AS). `None` '
+        'for no limit.')
+
+    job_max_age = Attribute(
+        'Seconds after which background export jobs and their results are '
+        'removed.')
+
+    def get_job_directory():
+        """Returns the path to a directory, where the status and the
+        results of background export jobs are stored. When using multiple
+        ZEO clients, the directory should be shared.
+        """
+
+    builder_pool_size = Attribute(
+        'Amount of idle, warm pdflatex processes kept by the '
+        '`ftw.pdfgenerator.pool.BuilderPool` builder factory.')
+
+    builder_pool_max_age = Attribute(
+        'Seconds after which an idle, warm pdflatex process of the '
+        '`ftw.pdfgenerator.pool.BuilderPool` is replaced.')
+
+    builder_pool_formats = Attribute(
+        'Amount of precompiled formats most recently used, for which the '
+        '`ftw.pdfgenerator.pool.BuilderPool` keeps warm pdflatex processes.')
+
+    pdf_cache_size = Attribute(
+        'Maximum size of the PDF cache directory in bytes.')
+
+    pdf_cache_memory_size = Attribute(
+        'Maximum size of the PDFs cached in memory in bytes.')
+
+    pdf_cache_ttl = Attribute(
+        'Seconds after which a cached PDF expires. `None` for no expiry.')
+
+    def get_pdf_cache_directory():
+        """Returns the path to a directory, where built PDFs are cached.
+        Returns `None` when the PDF cache is disabled.
+        """
+
+    convert_cache_size = Attribute(
+        'Amount of HTML to LaTeX conversions cached by each converter. '
+        '`None` disables the cache.')
+
+    html_parser = Attribute(
+        'Name of the HTML parser of the table and list subconverters '
+        '("lxml" or "beautifulsoup"). `None` selects "beautifulsoup".')
+
 
 class IBuilderFactory(Interface):
     """Factory creating a new IBuilder.
@@ -74,17 +220,44 @@ class IBuilder(Interface):
     """Converts LaTeX to PDF using `pdflatex`.
     """
 
+    progress_callback = Attribute(
+        'Optional callable, called with the `stage` ("build", "pdflatex" '
+        'or "makeindex"), the `current` and the expected `total` pdflatex '
+        'pass while building.')
+
     def add_file(filename, data):
         """Adds a file to the build directory.
         """
 
+    def get_file_digests():
+        """Returns a sorted list of strings identifying the name and the
+        content of every file added with `add_file`.
+        """
+
     def build(latex):
         """Builds and returns the PDF.
         """
 
+    def build_stream(latex):
+        """Builds the PDF and returns an `IStreamIterator` reading the PDF
+        from the build directory. The build directory is removed when the
+        iterator is consumed or closed.
+        """
+
     def build_zip(latex):
         """Builds the PDF and returns the a ZIP bundle, containing the build
-        directory.
+        directory. The bundle is returned as file object, which is written
+        to a temporary file when it is large.
+        """
+
+    def build_async(latex):
+        """Builds the PDF in the background and returns a future
+        (`concurrent.futures.Future`) of the PDF data.
+        """
+
+    def build_zip_async(latex):
+        """Builds the ZIP bundle like `build_zip` in the background and
+        returns a future of the ZIP stream.
         """
 
     def cleanup():
@@ -93,6 +266,45 @@ class IBuilder(Interface):
         """
 
 
+class IPDFCache(Interface):
+    """Caches built PDFs by the hash of the LaTeX and the files added to
+    the builder. `IPDFAssembler.build_pdf` returns cached PDFs without
+    running the builder.
+    """
+
+    enabled = Attribute('`True` when the cache stores PDFs.')
+
+    hits = Attribute('Amount of cache hits.')
+
+    misses = Attribute('Amount of cache misses.')
+
+    def get_key(latex, file_digests):
+        """Returns the cache key for the LaTeX and the file digests of the
+        builder (see `IBuilder.get_file_digests`).
+        """
+
+    def get(key):
+        """Returns the cached PDF data or `None`.
+        """
+
+    def set(key, data):
+        """Stores the PDF data.
+        """
+
+
+class IPDFCacheStorage(Interface):
+    """Storage backend of the PDF cache.
+    """
+
+    def get(key):
+        """Returns the stored data or `None`.
+        """
+
+    def set(key, data):
+        """Stores the data.
+        """
+
+
 class ILaTeXLayout(Interface):
     """A LaTeX layout defines the head of the LaTeX file and puts the
     parts of the LaTeX code together. It manages the also the packages.
@@ -288,6 +500,18 @@ class IHTML2LaTeXConverter(Interface):
 
     default_patterns = Attribute('List of default patterns.')
 
+    convert_cache = Attribute(
+        'The `ConversionCache` of the converter or `None` when caching is '
+        'disabled.')
+
+    profile = Attribute(
+        'The `ConversionProfile` of the converter or `None` when profiling '
+        'is not started.')
+
+    link_resolver = Attribute(
+        'The `LinkResolver` caching the resolved links of the current build '
+        'or `None` when no link was resolved yet.')
+
     def __init__(context, request, layout):
         """
         """
@@ -308,6 +532,22 @@ class IHTML2LaTeXConverter(Interface):
         """Returns the currently active subconverter for the passed pattern.
         """
 
+    def get_program():
+        """Returns the compiled program of the current patterns, which is
+        shared with the runners.
+        """
+
+    def get_link_resolver():
+        """Returns the `LinkResolver` of the current build, which looks up
+        the URLs of "resolveuid" links in batches and caches them.
+        """
+
+    def start_profiling():
+        """Records the time, calls, matches and bytes in and out of each
+        pattern and subconverter in the following conversions. Returns the
+        `ConversionProfile`.
+        """
+
     def convert(html, custom_patterns=None, custom_subconverters=None,
                 trim=True):
         """Converts HTML to LaTeX.
@@ -343,7 +583,12 @@ class IHTML2LaTeXConvertRunner(Interface):
     current HTML / LaTeX code.
     """
 
-    def __init__(converter, patterns, html, trim=True):
+    parsed_nodes = Attribute(
+        'Dict of the DOM nodes parsed by subconverters by their HTML, shared '
+        'with the nested runners.')
+
+    def __init__(converter, patterns, html, trim=True, program=None,
+                 parsed_nodes=None):
         """
         """
 
@@ -399,6 +644,20 @@ class ISubConverter(Interface):
     placeholder = Attribute(
         'The subconverter will be registered at the point of the '
         'placeholder in the patterns list.')
+    rescan_after_replace = Attribute(
+        'If `True`, the HTML is searched from the start again after the '
+        'subconverter changed it. Otherwise the search continues at the '
+        'first position changed by the subconverter.')
+    trigger_literals = Attribute(
+        'Optional tuple of strings. The subconverter is only run when at '
+        'least one of them is in the HTML. When not set, the required '
+        'literals are derived from the pattern.')
+    replace_all = Attribute(
+        'Optional function converting all matches in a single pass. It is '
+        'called with the compiled pattern and the HTML and returns the '
+        'converted HTML and the amount of matches. The subconverter is not '
+        'instantiated for each match then. Subclasses changing `__call__` '
+        'of a subconverter with `replace_all` should reset it to `None`.')
 
     def __init__(converter, match, html):
         """
@@ -416,6 +675,21 @@ class ISubConverter(Interface):
         """Return the matched html.
         """
 
+    def get_html_parser():
+        """Returns the HTML parser backend of the converter for parsing
+        the matched html into a minidom tree.
+        """
+
+    def get_parsed_node():
+        """Returns the DOM node of the matched html, when a subconverter
+        converting a parent node already parsed it. Returns `None` otherwise.
+        """
+
+    def serialize_nodes(nodes):
+        """Returns the html of the minidom `nodes` as unicode and registers
+        the element nodes for nested subconverters (see `get_parsed_node`).
+        """
+
     def replace_and_lock(latex):
         """Sends the `latex` back to the main converter and locks it so that
         no subsequent patterns will match / replace.
@@ -0,0 +1,223 @@
+from ftw.pdfgenerator.interfaces import IBuildJobRegistry
+from ftw.pdfgenerator.interfaces import IConfig
+from functools import partial
+from zope.component import getUtility
+from zope.interface import implements
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+
+# Default seconds after which finished jobs and their results are removed.
+DEFAULT_JOB_MAX_AGE = 60 * 60
+
+JOB_ID_EXPRESSION = re.compile(r'^[0-9a-f]{32}$')
+
+STATUS_FILENAME = 'status.json'
+RESULT_FILENAME = 'result'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class FilesystemJobStore(object):
+    """Stores the status and the result of background build jobs in a
+    directory. Every job has its own subdirectory containing the status as
+    JSON and the result file.
+
+    Since the status is only kept on the filesystem, the status can be read
+    by every ZEO client sharing the directory.
+    """
+
+    def __init__(self, directory, max_age=DEFAULT_JOB_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.lock = threading.RLock()
+
+    def create(self, **status):
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._get_path(job_id))
+        status.update({'id': job_id,
+                       'state': QUEUED,
+                       'created': time.time()})
+        self._write_status(job_id, status)
+        return job_id
+
+    def get(self, job_id):
+        """Returns the status of the job or `None` when the job does not
+        exist or is expired.
+        """
+        if not JOB_ID_EXPRESSION.match(job_id or ''):
+            return None
+
+        status = self._read_status(job_id)
+        if status is None or self._expired(status['created']):
+            return None
+        return status
+
+    def update(self, job_id, **data):
+        with self.lock:
+            status = self.get(job_id)
+            if status is None:
+                return
+            status.update(data)
+            self._write_status(job_id, status)
+
+    def set_result(self, job_id, data):
+        path = self._get_path(job_id, RESULT_FILENAME)
+        with open(path + '.tmp', 'wb') as file_:
+            file_.write(data)
+        os.rename(path + '.tmp', path)
+        self.update(job_id, state=FINISHED, stage='done', size=len(data))
+
+    def get_result_path(self, job_id):
+        status = self.get(job_id)
+        if status is None or status['state'] != FINISHED:
+            return None
+        return self._get_path(job_id, RESULT_FILENAME)
+
+    def expire(self):
+        """Removes all expired jobs.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        for job_id in os.listdir(self.directory):
+            if not JOB_ID_EXPRESSION.match(job_id):
+                continue
+
+            status = self._read_status(job_id)
+            if status is not None:
+                created = status['created']
+            else:
+                # The status is not yet written or broken.
+                try:
+                    created = os.stat(self._get_path(job_id)).st_mtime
+                except OSError:
+                    continue
+
+            if self._expired(created):
+                shutil.rmtree(self._get_path(job_id), ignore_errors=True)
+
+    def _expired(self, created):
+        return time.time() - created > self.max_age
+
+    def _read_status(self, job_id):
+        try:
+            with open(self._get_path(job_id, STATUS_FILENAME)) as file_:
+                return json.load(file_)
+        except (IOError, ValueError):
+            return None
+
+    def _write_status(self, job_id, status):
+        status['updated'] = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self._get_path(job_id),
+                                        suffix='.tmp')
+        with os.fdopen(fd, 'w') as file_:
+            json.dump(status, file_)
+        os.rename(tmp_path, self._get_path(job_id, STATUS_FILENAME))
+
+    def _get_path(self, job_id, *names):
+        return os.path.join(self.directory, job_id, *names)
+
+
+class BuildJobQueue(object):
+    """Runs builds in the background and keeps track of them in a
+    `FilesystemJobStore`.
+
+    The builds run in the executor of the asynchronous build API, which
+    bounds the amount of builds running at the same time with
+    `IConfig.build_workers`. Jobs are queued until a worker starts
+    building.
+    """
+
+    implements(IBuildJobRegistry)
+
+    def __init__(self, store=None):
+        self._store = store
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        with self._lock:
+            if self._store is None:
+                config = getUtility(IConfig)
+                self._store = FilesystemJobStore(
+                    config.get_job_directory(),
+                    getattr(config, 'job_max_age', DEFAULT_JOB_MAX_AGE))
+            return self._store
+
+    def submit(self, assembler, output='pdf', filename=None, user_id=None,
+               **build_arguments):
+        self.store.expire()
+        job_id = self.store.create(output=output, filename=filename,
+                                   user=user_id, stage='render')
+
+        # The builder is passed on, since the assembler would otherwise
+        # build with a new builder not reporting the progress.
+        builder = build_arguments.get('builder')
+        if builder is None:
+            builder = build_arguments['builder'] = assembler.get_builder()
+
+        progress_callback = partial(self.report_progress, job_id)
+        # Third party builders may not report their progress.
+        if hasattr(builder, 'progress_callback'):
+            builder.progress_callback = progress_callback
+
+        try:
+            # The assembler renders the views and converts their HTML to
+            # LaTeX before the build is queued.
+            progress_callback('convert')
+            if output == 'pdf':
+                future = assembler.build_pdf_async(**build_arguments)
+            elif output == 'zip':
+                future = assembler.build_zip_async(**build_arguments)
+            else:
+                raise ValueError('Unkown output "%s"' % output)
+
+        except Exception, exc:
+            self.store.update(job_id, state=FAILED, error=str(exc))
+            raise
+
+        self._watch(job_id, future)
+        return job_id
+
+    def register(self, future, context=None, output=None):
+        self.store.expire()
+        job_id = self.store.create(output=output, stage='build')
+        self._watch(job_id, future)
+        return job_id
+
+    def report_progress(self, job_id, stage, current=None, total=None):
+        self.store.update(job_id, state=RUNNING, stage=stage,
+                          current=current, total=total)
+
+    def get_job(self, job_id):
+        return self.store.get(job_id)
+
+    def get_result_path(self, job_id):
+        return self.store.get_result_path(job_id)
+
+    def _watch(self, job_id, future):
+        with self.store.lock:
+            # The build may already have been started by a worker.
+            status = self.store.get(job_id)
+            if status['state'] == QUEUED or status['stage'] == 'convert':
+                self.store.update(job_id, state=QUEUED, stage='queued')
+
+        def done(future):
+            try:
+                data = future.result()
+            except Exception, exc:
+                self.store.update(job_id, state=FAILED, error=str(exc))
+            else:
+                self.store.set_result(job_id, data)
+
+        future.add_done_callback(done)
@@ -0,0 +1,131 @@
+from ftw.pdfgenerator.exceptions import BuildLimitExceeded
+from ftw.pdfgenerator.interfaces import IConfig
+from zope.component import getUtility
+import os
+import re
+import resource
+import signal
+import threading
+
+
+# Messages of processes failing to allocate memory.
+MEMORY_EXHAUSTED_EXPRESSION = re.compile(
+    r'out of memory|memory exhausted|cannot allocate memory|'
+    r'capacity exceeded|MemoryError', re.IGNORECASE)
+
+# Signals of processes crashing when failing to allocate memory.
+MEMORY_EXHAUSTED_SIGNALS = (signal.SIGSEGV, signal.SIGABRT, signal.SIGKILL)
+
+
+class ResourceLimits(object):
+    """Limits the resources of the TeX subprocesses.
+
+    `timeout` is the wall-clock time in seconds a process may run,
+    `cpu_time` the CPU time in seconds (RLIMIT_CPU) and `memory` the
+    address space in bytes (RLIMIT_AS). The processes are started in a new
+    process group, which is killed as a whole when the timeout is hit.
+    Every limit is disabled with `None`.
+    """
+
+    def __init__(self, timeout=None, cpu_time=None, memory=None):
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+
+    @property
+    def enabled(self):
+        return any(limit is not None for limit in
+                   (self.timeout, self.cpu_time, self.memory))
+
+    def get_popen_arguments(self):
+        """Returns the additional keyword arguments for `subprocess.Popen`.
+        """
+        if not self.enabled:
+            return {}
+        return {'preexec_fn': self._preexec}
+
+    def communicate(self, proc, input=None):
+        """Communicates with the process like `Popen.communicate` while
+        enforcing the limits. Returns the exitcode, stdout and stderr.
+        """
+        timer = None
+        timed_out = []
+        if self.timeout is not None:
+            def kill():
+                timed_out.append(True)
+                self.kill(proc)
+
+            timer = threading.Timer(self.timeout, kill)
+            timer.start()
+
+        try:
+            output, errors = proc.communicate(input)
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if timed_out:
+            raise BuildLimitExceeded(
+                'The TeX process was killed after %s seconds.' % self.timeout)
+
+        if self.cpu_time is not None and proc.returncode in (
+                -signal.SIGXCPU, -signal.SIGKILL):
+            raise BuildLimitExceeded(
+                'The TeX process exceeded the CPU time limit of %s seconds.'
+                % self.cpu_time)
+
+        if self.memory is not None and self._memory_exhausted(
+                proc.returncode, output, errors):
+            raise BuildLimitExceeded(
+                'The TeX process exceeded the memory limit of %s bytes.'
+                % self.memory)
+
+        return proc.returncode, output, errors
+
+    def kill(self, proc):
+        """Kills the process group of the process.
+        """
+        try:
+            if self.enabled:
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            # already terminated
+            pass
+
+    def _memory_exhausted(self, returncode, output, errors):
+        """Returns `True` when the process failed because it could not
+        allocate memory. Processes hitting RLIMIT_AS are not killed by a
+        signal of the limit, they fail to allocate memory.
+        """
+        if not returncode:
+            return False
+
+        if -returncode in MEMORY_EXHAUSTED_SIGNALS:
+            return True
+
+        return any(MEMORY_EXHAUSTED_EXPRESSION.search(text or '')
+                   for text in (output, errors))
+
+    def _preexec(self):
+        # Runs in the child process before executing the command.
+        os.setsid()
+        if self.cpu_time is not None:
+            # The soft limit sends SIGXCPU, the hard limit SIGKILL.
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (self.cpu_time, self.cpu_time + 1))
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (self.memory, self.memory))
+
+
+def get_resource_limits():
+    """Returns the resource limits configured with the `IConfig` utility.
+    """
+    config = getUtility(IConfig)
+    # Third party config utilities may not know about the limits.
+    return ResourceLimits(
+        timeout=getattr(config, 'build_timeout', None),
+        cpu_time=getattr(config, 'build_cpu_limit', None),
+        memory=getattr(config, 'build_memory_limit', None))
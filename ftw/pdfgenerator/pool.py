@@ -0,0 +1,332 @@
+from collections import OrderedDict
+from ftw.pdfgenerator.builder import Builder
+from ftw.pdfgenerator.formatcache import FORMAT_EXTENSION
+from ftw.pdfgenerator.interfaces import IBuilderFactory, IConfig
+from ftw.pdfgenerator.limits import ResourceLimits
+from ftw.pdfgenerator.limits import get_resource_limits
+from zope.component import getUtility
+from zope.interface import implements
+import atexit
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+
+# Default amount of idle warm processes kept by the pool.
+DEFAULT_POOL_SIZE = 2
+
+# Default maximum age of an idle warm process in seconds.
+DEFAULT_MAX_AGE = 300
+
+# Default amount of precompiled formats warm processes are kept for.
+DEFAULT_MAX_FORMATS = 2
+
+PDFLATEX_COMMAND = 'pdflatex --interaction=nonstopmode'
+
+# TeX loads the format before it executes the first line. The first line
+# therefore waits for the job (the "\input" of the document) on stdin and
+# switches to nonstop mode before running it.
+WAIT_FOR_JOB = (r'\read16 to\ftwpdfgeneratorjob'
+                r' \nonstopmode\ftwpdfgeneratorjob')
+
+DRAFT_MODE_OPTION = '-draftmode'
+
+
+class WarmProcess(object):
+    """A pdflatex process which has already loaded its format and waits for
+    the path of the document on stdin.
+
+    A warm process replaces exactly one execution of `command` followed by
+    the path of the document, since TeX terminates when the document is
+    finished.
+    """
+
+    def __init__(self, command, cwd, limits=None):
+        self.command = command
+        self.cwd = cwd
+        self.limits = limits or ResourceLimits()
+        self.created = time.time()
+        self.proc = subprocess.Popen(self._get_arguments(),
+                                     stdin=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     cwd=cwd,
+                                     **self.limits.get_popen_arguments())
+
+    def accepts(self, cmd):
+        """Returns `True` if the process can run the command `cmd`, which is
+        the command of the process followed by the path of the document.
+        Draft mode is enabled in the job, so the command may also contain
+        the draft mode option.
+        """
+        arguments = shlex.split(cmd)
+        options = [arg for arg in arguments[:-1] if arg != DRAFT_MODE_OPTION]
+        return len(arguments) > 1 and options == shlex.split(self.command)
+
+    def is_healthy(self, max_age=None):
+        if self.proc.poll() is not None:
+            return False
+        if max_age is not None and time.time() - self.created > max_age:
+            return False
+        return True
+
+    def run(self, cmd):
+        """Runs the document of the command `cmd` and returns the exitcode,
+        stdout and stderr like `Builder._execute`.
+        """
+        arguments = shlex.split(cmd)
+        document = arguments[-1]
+        if os.path.dirname(document) == self.cwd:
+            document = os.path.basename(document)
+
+        job = r'\input %s' % document
+        if DRAFT_MODE_OPTION in arguments:
+            job = r'\pdfdraftmode=1 ' + job
+
+        return self.limits.communicate(self.proc, job + '\n')
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.limits.kill(self.proc)
+            self.proc.wait()
+
+    def _get_arguments(self):
+        # The interaction mode is switched after reading the job, since
+        # TeX cannot read from the terminal in nonstop mode.
+        arguments = [arg for arg in shlex.split(self.command)
+                     if arg != '--interaction=nonstopmode']
+        return arguments + [WAIT_FOR_JOB]
+
+
+class PooledBuilder(Builder):
+    """A builder running the pdflatex passes in warm processes.
+
+    The first pass uses the process checked out from the pool which accepts
+    it, the other checked out processes are killed. While a pass is running
+    in draft mode, the process for the next pass is started speculatively,
+    so that the next pass does not need to wait for the format to be loaded.
+    The final pass is not expected to be followed by another pass and does
+    not start a process.
+    """
+
+    process_class = WarmProcess
+
+    # The pool the builder was created by, which starts its warm processes
+    # with the precompiled formats used by the builders.
+    pool = None
+
+    def __init__(self, processes):
+        super(PooledBuilder, self).__init__(
+            build_directory=processes[0].cwd)
+        self._processes = list(processes)
+
+    def _execute(self, cmd):
+        command = self._get_pdflatex_command()
+        accepting = [process for process in self._processes
+                     if process.accepts(cmd)]
+        if not accepting and not cmd.startswith(command + ' '):
+            # Other commands do not consume the warm processes.
+            return super(PooledBuilder, self)._execute(cmd)
+
+        self._kill_processes(exclude=accepting[:1])
+        if self._another_pass_follows(cmd):
+            self._processes.append(self.process_class(command,
+                                                      self.build_directory,
+                                                      self._limits))
+
+        if accepting:
+            return accepting[0].run(cmd)
+        return super(PooledBuilder, self)._execute(cmd)
+
+    def _another_pass_follows(self, cmd):
+        # Passes are run in draft mode when another pass is expected.
+        return DRAFT_MODE_OPTION in shlex.split(cmd)
+
+    def _prepare_format(self, latex):
+        key = super(PooledBuilder, self)._prepare_format(latex)
+        if key is not None and self.pool is not None:
+            path = self._format_cache.get(key)
+            if path is not None:
+                self.pool.use_format(key, path)
+        return key
+
+    def _kill_processes(self, exclude=()):
+        for process in self._processes:
+            if process not in exclude:
+                process.kill()
+        self._processes = []
+
+    def _cleanup_build(self):
+        self._kill_processes()
+        super(PooledBuilder, self)._cleanup_build()
+
+
+class BuilderPool(object):
+    """Builder factory keeping a pool of pdflatex processes, which have
+    loaded the format and wait for a document.
+
+    The pool keeps `size` fresh build directories, each with warm processes
+    waiting in it. A build directory and its processes are handed over to
+    exactly one builder. The pool is refilled whenever a builder is
+    created. Processes which died or are idle for more than `max_age`
+    seconds are recycled, so that changes of the TeX installation are
+    picked up.
+
+    When the builders use precompiled formats of the format cache, a
+    process is started for each of the `max_formats` formats most recently
+    used, so that the first pass of the next builder is accepted by one of
+    them even when layouts with different preambles are used alternately.
+    Processes of formats no longer used are replaced.
+
+    The size, the maximum age and the amount of formats are taken from the
+    `IConfig` utility unless passed explicitly.
+    """
+
+    implements(IBuilderFactory)
+
+    builder_class = PooledBuilder
+    process_class = WarmProcess
+
+    def __init__(self, size=None, max_age=None, max_formats=None):
+        self._size = size
+        self._max_age = max_age
+        self._max_formats = max_formats
+        # Lists of the warm processes of a build directory.
+        self._processes = []
+        # The paths of the formats by key, the most recently used last.
+        self._formats = OrderedDict()
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @property
+    def size(self):
+        if self._size is not None:
+            return self._size
+        return getattr(getUtility(IConfig), 'builder_pool_size',
+                       DEFAULT_POOL_SIZE)
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(getUtility(IConfig), 'builder_pool_max_age',
+                       DEFAULT_MAX_AGE)
+
+    @property
+    def max_formats(self):
+        if self._max_formats is not None:
+            return self._max_formats
+        return getattr(getUtility(IConfig), 'builder_pool_formats',
+                       DEFAULT_MAX_FORMATS)
+
+    def __call__(self):
+        with self._lock:
+            processes = self._checkout()
+            self._fill()
+
+        builder = self.builder_class(processes)
+        builder.process_class = self.process_class
+        builder.pool = self
+        return builder
+
+    def use_format(self, key, path):
+        """Marks the precompiled format `key` as used. The idle build
+        directories get a process with the format, which is copied from
+        `path`, and the processes of formats exceeding `max_formats` are
+        killed.
+        """
+        with self._lock:
+            if key in self._formats:
+                self._formats[key] = self._formats.pop(key)
+                return
+
+            self._formats[key] = path
+            while len(self._formats) > max(self.max_formats, 1):
+                self._formats.popitem(last=False)
+
+            commands = self._get_commands()
+            for processes in self._processes:
+                cwd = processes[0].cwd
+                for process in processes[:]:
+                    if process.command not in commands:
+                        processes.remove(process)
+                        process.kill()
+
+                if self._copy_format(key, cwd):
+                    processes.append(self._start(
+                            self._get_format_command(key), cwd))
+                if not processes:
+                    processes.append(self._start(PDFLATEX_COMMAND, cwd))
+
+    def shutdown(self):
+        """Kills all idle processes and removes their build directories.
+        """
+        with self._lock:
+            while self._processes:
+                self._discard(self._processes.pop())
+
+    def _checkout(self):
+        while self._processes:
+            processes = self._processes.pop(0)
+            if self._is_healthy(processes):
+                return processes
+            self._discard(processes)
+
+        return self._spawn()
+
+    def _fill(self):
+        for processes in self._processes[:]:
+            if not self._is_healthy(processes):
+                self._processes.remove(processes)
+                self._discard(processes)
+
+        while len(self._processes) < self.size:
+            self._processes.append(self._spawn())
+
+    def _is_healthy(self, processes):
+        return processes and all(process.is_healthy(self.max_age)
+                                 for process in processes)
+
+    def _spawn(self):
+        build_directory = getUtility(IConfig).get_build_directory()
+        processes = []
+        for key in list(self._formats):
+            if self._copy_format(key, build_directory):
+                processes.append(self._start(self._get_format_command(key),
+                                             build_directory))
+
+        if not processes:
+            processes.append(self._start(PDFLATEX_COMMAND, build_directory))
+        return processes
+
+    def _start(self, command, build_directory):
+        return self.process_class(command, build_directory,
+                                  get_resource_limits())
+
+    def _get_commands(self):
+        if not self._formats:
+            return [PDFLATEX_COMMAND]
+        return [self._get_format_command(key) for key in self._formats]
+
+    def _get_format_command(self, key):
+        return '%s -fmt=%s' % (PDFLATEX_COMMAND, key)
+
+    def _copy_format(self, key, build_directory):
+        try:
+            shutil.copyfile(self._formats[key],
+                            os.path.join(build_directory,
+                                         key + FORMAT_EXTENSION))
+        except (IOError, OSError):
+            # The format was evicted from the format cache.
+            del self._formats[key]
+            return False
+        return True
+
+    def _discard(self, processes):
+        for process in processes:
+            process.kill()
+        if processes:
+            shutil.rmtree(processes[0].cwd, ignore_errors=True)
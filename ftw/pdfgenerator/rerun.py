@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+
+
+# Reason reported for the first pass of a series of passes.
+FIRST_PASS = 'first pass'
+
+# TeX wraps the lines of the log file after this amount of characters.
+LOG_LINE_LENGTH = 79
+
+# Warnings in the log, which require another pdflatex pass. Each pattern is
+# mapped to the reason reported for the rerun.
+RERUN_WARNINGS = (
+    (re.compile(r'LaTeX Warning: Label\(s\) may have changed'),
+     'labels may have changed'),
+
+    (re.compile(r'LaTeX Warning: Citation\(s\) may have changed'),
+     'citations may have changed'),
+
+    (re.compile(r'Package longtable Warning: Table widths have changed'),
+     'longtable widths have changed'),
+
+    (re.compile(r'Package rerunfilecheck Warning: File `([^\']*)\' '
+                r'has changed'),
+     'file %s has changed'),
+
+    (re.compile(r'(?:Package|Class) (\S+) Warning: .*Rerun'),
+     'package %s requested a rerun'),
+    )
+
+
+class RerunChecker(object):
+    """Decides whether another pdflatex pass is required after a pass.
+
+    A pass is required when the auxiliary files changed in the last pass
+    or when LaTeX or a package warned in the log that a rerun is needed.
+    The auxiliary files are compared by their hashes, which are computed
+    while streaming the files.
+    """
+
+    def __init__(self, build_directory, jobname='export'):
+        self.build_directory = build_directory
+        self.log_path = os.path.join(build_directory, jobname + '.log')
+        self.aux_digests = None
+
+    def reset(self):
+        """Starts a new series of passes.
+        """
+        self.aux_digests = None
+
+    def rerun_required(self, stdout=''):
+        """Returns the reason why another pass is required or `None` when
+        nothing relevant changed.
+        """
+        previous_aux_digests = self.aux_digests
+        self.aux_digests = self._get_aux_digests()
+
+        if previous_aux_digests is None:
+            return FIRST_PASS
+
+        reason = self._get_log_reason()
+        if reason is not None:
+            return reason
+
+        if 'Rerun to get' in stdout:
+            return 'rerun requested on stdout'
+
+        changed = sorted(
+            name for name in set(previous_aux_digests) | set(self.aux_digests)
+            if previous_aux_digests.get(name) != self.aux_digests.get(name))
+        if changed:
+            return '%s changed' % ', '.join(changed)
+
+        return None
+
+    def _get_aux_digests(self):
+        digests = {}
+        for filename in os.listdir(self.build_directory):
+            if not filename.endswith('.aux'):
+                continue
+
+            digest = hashlib.sha1()
+            with open(os.path.join(self.build_directory, filename),
+                      'rb') as file_:
+                for chunk in iter(lambda: file_.read(16 * 1024), ''):
+                    digest.update(chunk)
+            digests[filename] = digest.hexdigest()
+
+        return digests
+
+    def _get_log_reason(self):
+        if not os.path.exists(self.log_path):
+            return None
+
+        with open(self.log_path) as file_:
+            for line in self._unwrap_log_lines(file_):
+                for pattern, reason in RERUN_WARNINGS:
+                    match = pattern.search(line)
+                    if match is None:
+                        continue
+                    if '%s' in reason:
+                        return reason % match.group(1)
+                    return reason
+
+        return None
+
+    def _unwrap_log_lines(self, lines):
+        """Joins the lines wrapped by TeX.
+        """
+        buffered = ''
+        for line in lines:
+            line = line.rstrip('\r\n')
+            buffered += line
+            if len(line) != LOG_LINE_LENGTH:
+                yield buffered
+                buffered = ''
+
+        if buffered:
+            yield buffered
@@ -0,0 +1,64 @@
+from ZPublisher.Iterators import IStreamIterator
+from zope.interface import implements
+import os
+
+
+# Size of the chunks written to the response.
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+class BuildStreamIterator(object):
+    """Streams an open file in chunks to the response.
+
+    The publisher consumes the iterator after the request is finished,
+    so the result of a build does not need to be loaded into memory.
+    `cleanup` is called once the file is consumed or the iterator is
+    closed, which is used for removing the build directory only after the
+    file was sent.
+    """
+
+    implements(IStreamIterator)
+
+    def __init__(self, file_, size=None, cleanup=None,
+                 streamsize=STREAM_CHUNK_SIZE):
+        self.file = file_
+        self.streamsize = streamsize
+        self._cleanup = cleanup
+
+        if size is None:
+            file_.seek(0, os.SEEK_END)
+            size = file_.tell()
+            file_.seek(0)
+        self.size = size
+
+    @classmethod
+    def from_path(cls, path, cleanup=None, streamsize=STREAM_CHUNK_SIZE):
+        return cls(open(path, 'rb'), size=os.path.getsize(path),
+                   cleanup=cleanup, streamsize=streamsize)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self.file.read(self.streamsize)
+        if not data:
+            self.close()
+            raise StopIteration
+        return data
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+        cleanup, self._cleanup = self._cleanup, None
+        if cleanup is not None:
+            cleanup()
+
+    def __del__(self):
+        # The publisher may not close iterators it did not consume, for
+        # instance when the client disconnected.
+        self.close()
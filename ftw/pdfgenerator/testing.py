@@ -67,10 +67,22 @@ class PredefinedBuildDirectoryLayer(Layer):
 
         self.config = Mock()
         self.config.get_build_directory.return_value = self.builddir
+        self.config.build_workers = 2
+        self.config.zip_deflate = True
+        self.config.max_concurrent_builds = None
+        self.config.max_queued_builds = None
+        self.config.build_queue_timeout = None
+        self.config.build_timeout = None
+        self.config.build_cpu_limit = None
+        self.config.build_memory_limit = None
+        self.config.convert_cache_size = None
+        self.config.html_parser = None
         provideUtility(provides=IConfig, component=self.config)
 
     def testSetUp(self):
         self.config.remove_build_directory = True
+        self.config.get_format_cache_directory.return_value = None
+        self.config.get_pdf_cache_directory.return_value = None
         os.mkdir(self.builddir)
 
     def testTearDown(self):
@@ -0,0 +1,67 @@
+from ftw.pdfgenerator.admission import AdmissionControl
+from ftw.pdfgenerator.exceptions import BuildRejected
+from unittest import TestCase
+import threading
+import time
+
+
+class TestAdmissionControl(TestCase):
+
+    def test_unlimited_by_default(self):
+        control = AdmissionControl()
+        with control.admit():
+            with control.admit():
+                self.assertEqual(2, control.get_stats()['running'])
+
+        self.assertEqual(0, control.get_stats()['running'])
+        self.assertEqual(2, control.get_stats()['admitted'])
+
+    def test_rejects_when_queue_is_full(self):
+        control = AdmissionControl(max_concurrent=1, max_queue=0)
+        with control.admit():
+            with self.assertRaises(BuildRejected) as cm:
+                with control.admit():
+                    pass
+
+        self.assertEqual('The build queue is full.', str(cm.exception))
+        self.assertEqual(30, cm.exception.retry_after)
+        self.assertEqual(1, control.get_stats()['rejected'])
+
+    def test_rejects_after_queue_timeout(self):
+        control = AdmissionControl(max_concurrent=1, timeout=0.1)
+        with control.admit():
+            with self.assertRaises(BuildRejected) as cm:
+                with control.admit():
+                    pass
+
+        self.assertEqual('Timeout while waiting in the build queue.',
+                         str(cm.exception))
+        stats = control.get_stats()
+        self.assertEqual((1, 1, 0), (stats['rejected'], stats['timed_out'],
+                                     stats['queued']))
+
+    def test_queued_build_runs_when_slot_is_released(self):
+        control = AdmissionControl(max_concurrent=1, timeout=10)
+        started = threading.Event()
+        finished = []
+
+        def queued_build():
+            started.set()
+            with control.admit():
+                finished.append(True)
+
+        with control.admit():
+            thread = threading.Thread(target=queued_build)
+            thread.start()
+            started.wait()
+            while control.get_stats()['queued'] == 0:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            self.assertEqual([], finished)
+
+        thread.join(10)
+        self.assertEqual([True], finished)
+        stats = control.get_stats()
+        self.assertEqual((2, 0, 0), (stats['admitted'], stats['running'],
+                                     stats['queued']))
+        self.assertGreater(stats['max_wait_time'], 0)
@@ -1,7 +1,11 @@
 from ftw.pdfgenerator import interfaces
 from ftw.pdfgenerator.assembler import PDFAssembler
+from ftw.pdfgenerator.cache import MemoryStorage, PDFCache
+from ftw.pdfgenerator.executor import completed_future
+from ftw.pdfgenerator.streaming import BuildStreamIterator
 from ftw.pdfgenerator.testing import PDFGENERATOR_ZCML_LAYER
 from ftw.testing import MockTestCase
+from StringIO import StringIO
 from zope.component import getMultiAdapter
 from zope.interface import Interface
 from zope.interface.verify import verifyClass
@@ -48,6 +52,32 @@ class TestPDFAssembler(MockTestCase):
         self.assertEqual(latex, 'full latex')
         builder.cleanup.assert_called_once()
 
+    def test_resolved_links_are_reset_for_each_build(self):
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+        converter = layout.get_converter.return_value
+        converter.link_resolver = object()
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        obj.build_latex(layout=layout, builder=self.mock())
+        self.assertEqual(None, converter.link_resolver)
+
+    def test_build_profile_profiles_the_converter(self):
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+        profile = layout.get_converter.return_value.start_profiling()
+
+        builder = self.mock()
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        self.assertEqual(obj.build_profile(layout=layout, builder=builder),
+                         profile)
+        layout.render_latex.assert_called_once_with('content latex')
+        builder.cleanup.assert_called_once()
+        self.assertFalse(builder.build.called)
+
     def test_use_filename_when_given(self):
         context = self.mock()
         layout = self.mock()
@@ -137,6 +167,60 @@ class TestPDFAssembler(MockTestCase):
         self.assertEqual(obj.build_pdf(layout=layout, builder=builder),
                          'the pdf')
 
+    def test_build_pdf_streams_to_response(self):
+        context = self.mock()
+        context.id = 'theid'
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        stream = BuildStreamIterator(StringIO('the pdf'))
+        builder = self.mock()
+        builder.build_stream.return_value = stream
+
+        request = self.mock()
+        response = self.mock()
+        request.RESPONSE = response
+
+        obj = getMultiAdapter((context, request), interfaces.IPDFAssembler)
+        self.assertEqual(obj.build_pdf(layout=layout, builder=builder,
+                                       request=request, stream=True),
+                         stream)
+        builder.build_stream.assert_called_once_with('full latex')
+        self.assertFalse(builder.build.called)
+        self.assertFalse(response.write.called)
+        response.setHeader.assert_any_call(
+            'Content-Type', 'application/pdf; charset=utf-8')
+        response.setHeader.assert_any_call(
+            'Content-disposition', 'attachment; filename="theid.pdf"')
+        response.setHeader.assert_any_call('Content-Length', '7')
+
+    def test_build_pdf_streams_cached_pdf(self):
+        cache = PDFCache(MemoryStorage(1024))
+        self.mock_utility(cache, interfaces.IPDFCache)
+
+        context = self.mock()
+        context.id = 'theid'
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build.return_value = 'the pdf'
+        builder.get_file_digests.return_value = []
+
+        request = self.mock()
+        request.RESPONSE = self.mock()
+
+        obj = getMultiAdapter((context, request), interfaces.IPDFAssembler)
+        stream = obj.build_pdf(layout=layout, builder=builder,
+                               request=request, stream=True)
+        self.assertEqual('the pdf', ''.join(stream))
+        self.assertFalse(builder.build_stream.called)
+        self.assertEqual('the pdf', cache.get(cache.get_key('full latex', [])))
+
     def test_build_zip_parameters(self):
         context = self.mock()
         context.id = 'theid'
@@ -159,6 +243,31 @@ class TestPDFAssembler(MockTestCase):
         response.setHeader.assert_called()
         response.write.assert_called_with('the zip')
 
+    def test_build_zip_streams_to_response(self):
+        context = self.mock()
+        context.id = 'theid'
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build_zip.return_value = StringIO('the zip')
+
+        request = self.mock()
+        response = self.mock()
+        request.RESPONSE = response
+
+        obj = getMultiAdapter((context, request), interfaces.IPDFAssembler)
+        stream = obj.build_zip(layout=layout, builder=builder,
+                               request=request, stream=True)
+        self.assertTrue(isinstance(stream, BuildStreamIterator))
+        self.assertEqual('the zip', ''.join(stream))
+        self.assertFalse(response.write.called)
+        response.setHeader.assert_any_call(
+            'Content-disposition', 'attachment; filename="theid.zip"')
+        response.setHeader.assert_any_call('Content-Length', '7')
+
     def test_build_zip_with_filename_parameter(self):
         context = self.mock()
         context.id = 'theid'
@@ -220,3 +329,120 @@ class TestPDFAssembler(MockTestCase):
         obj = getMultiAdapter((context, request), interfaces.IPDFAssembler)
         obj._builder = builder
         self.assertEqual(obj.get_layout(), layout)
+
+    def test_build_pdf_stores_pdf_in_cache(self):
+        cache = PDFCache(MemoryStorage(1024))
+        self.mock_utility(cache, interfaces.IPDFCache)
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build.return_value = 'the pdf'
+        builder.get_file_digests.return_value = ['image.jpg:1234']
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        self.assertEqual(obj.build_pdf(layout=layout, builder=builder),
+                         'the pdf')
+
+        builder.build.assert_called_once_with('full latex')
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        self.assertEqual('the pdf', cache.get(
+                cache.get_key('full latex', ['image.jpg:1234'])))
+
+    def test_build_pdf_returns_cached_pdf_without_building(self):
+        cache = PDFCache(MemoryStorage(1024))
+        cache.set(cache.get_key('full latex', ['image.jpg:1234']), 'cached')
+        self.mock_utility(cache, interfaces.IPDFCache)
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.get_file_digests.return_value = ['image.jpg:1234']
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        self.assertEqual(obj.build_pdf(layout=layout, builder=builder),
+                         'cached')
+
+        self.assertFalse(builder.build.called)
+        builder.cleanup.assert_called_once_with()
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+    def test_build_pdf_rebuilds_when_files_changed(self):
+        cache = PDFCache(MemoryStorage(1024))
+        cache.set(cache.get_key('full latex', ['image.jpg:1234']), 'cached')
+        self.mock_utility(cache, interfaces.IPDFCache)
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build.return_value = 'the pdf'
+        builder.get_file_digests.return_value = ['image.jpg:5678']
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        self.assertEqual(obj.build_pdf(layout=layout, builder=builder),
+                         'the pdf')
+
+    def test_build_pdf_async_returns_future(self):
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build_async.return_value = completed_future('the pdf')
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        future = obj.build_pdf_async(layout=layout, builder=builder)
+        self.assertEqual('the pdf', future.result())
+        builder.build_async.assert_called_once_with('full latex')
+
+    def test_build_pdf_async_registers_future(self):
+        context = object()
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build_async.return_value = completed_future('the pdf')
+        registry = self.mock()
+
+        obj = getMultiAdapter((context, object()), interfaces.IPDFAssembler)
+        future = obj.build_pdf_async(layout=layout, builder=builder,
+                                     registry=registry)
+        registry.register.assert_called_once_with(
+            future, context=context, output='pdf')
+
+    def test_build_pdf_async_stores_pdf_in_cache(self):
+        cache = PDFCache(MemoryStorage(1024))
+        self.mock_utility(cache, interfaces.IPDFCache)
+
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build_async.return_value = completed_future('the pdf')
+        builder.get_file_digests.return_value = []
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        self.assertEqual('the pdf', obj.build_pdf_async(
+                layout=layout, builder=builder).result())
+        self.assertEqual('the pdf', cache.get(cache.get_key('full latex', [])))
+
+    def test_build_zip_async_returns_future_of_data(self):
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+
+        builder = self.mock()
+        builder.build_zip_async.return_value = completed_future(
+            StringIO('the zip'))
+
+        obj = getMultiAdapter((object(), object()), interfaces.IPDFAssembler)
+        future = obj.build_zip_async(layout=layout, builder=builder)
+        self.assertEqual('the zip', future.result())
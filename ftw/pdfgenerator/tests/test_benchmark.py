@@ -0,0 +1,114 @@
+from StringIO import StringIO
+from ftw.pdfgenerator.benchmark import corpus
+from ftw.pdfgenerator.benchmark import runner
+from mock import patch
+from unittest import TestCase
+import json
+import os
+import shutil
+import tempfile
+
+
+RESULT = {'size': 10.0, 'throughput': 100.0, 'p50': 10.0, 'p95': 20.0,
+          'peak_memory': 1000}
+
+
+class TestCorpus(TestCase):
+
+    def test_corpus_is_reproducible(self):
+        self.assertEqual(corpus.get_corpus(), corpus.get_corpus())
+        self.assertNotEqual(corpus.get_corpus(seed=1), corpus.get_corpus())
+
+    def test_corpora_are_independent(self):
+        self.assertEqual(corpus.get_corpus(['links'])['links'],
+                         corpus.get_corpus()['links'])
+
+    def test_table_has_spanning_cells(self):
+        html = corpus.get_corpus(['table'])['table']
+        self.assertIn('colspan="2"', html)
+        self.assertIn('rowspan=', html)
+
+
+class TestRunner(TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(runner.percentile(values, 0.5), 50)
+        self.assertEqual(runner.percentile(values, 0.95), 95)
+        self.assertEqual(runner.percentile([3], 0.95), 3)
+
+    def test_measure(self):
+        result = runner.measure('<p>Foo <b>bar</b> &amp; '
+                                '<a href="baz">baz</a></p>', repeat=3)
+        self.assertEqual(sorted(result), sorted(RESULT))
+        self.assertGreater(result['throughput'], 0)
+        self.assertLessEqual(result['p50'], result['p95'])
+
+    def test_compare_parsers(self):
+        results = runner.compare_parsers(
+            {'table': '<table><tr><td><ul><li>foo</li></ul></td></tr>'
+             '</table>'},
+            ['beautifulsoup'], repeat=1, isolate=False)
+        self.assertEqual(['table:beautifulsoup'], results.keys())
+
+    def test_no_regressions(self):
+        self.assertEqual(runner.compare({'a': RESULT}, {'a': RESULT}), [])
+
+    def test_regressions_exceeding_thresholds(self):
+        result = dict(RESULT, throughput=70.0, p50=11.0, p95=30.0)
+        self.assertEqual(
+            runner.compare({'a': result}, {'a': RESULT}),
+            ['a: p95 regressed by 50% (30.0, baseline 20.0)',
+             'a: throughput regressed by 30% (70.0, baseline 100.0)'])
+
+    def test_thresholds_are_configurable(self):
+        result = dict(RESULT, p50=11.0)
+        self.assertEqual(
+            runner.compare({'a': result}, {'a': RESULT}, {'p50': 0.05}),
+            ['a: p50 regressed by 10% (11.0, baseline 10.0)'])
+
+    def test_corpora_missing_in_baseline_are_ignored(self):
+        self.assertEqual(runner.compare({'a': RESULT}, {}), [])
+
+    def test_format_results(self):
+        self.assertEqual(
+            runner.format_results({'prose': RESULT}),
+            ['Corpus  Size (KB)  KB/s   p50 (ms)  p95 (ms)  Peak memory (KB)',
+             'prose   10.0       100.0  10.0      20.0      1000'])
+
+
+class TestMain(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.baseline = os.path.join(self.tempdir, 'baseline.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def main(self, *args):
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            exit_code = runner.main(
+                ['--corpus', 'entities', '--repeat', '1', '--no-isolate']
+                + list(args))
+        return exit_code, stdout.getvalue()
+
+    def test_baseline_is_saved_and_compared(self):
+        self.assertEqual(self.main('--save-baseline', self.baseline)[0], 0)
+        with open(self.baseline) as file_:
+            self.assertEqual(json.load(file_).keys(), ['entities'])
+
+        exit_code, output = self.main(
+            '--baseline', self.baseline,
+            '--threshold', 'throughput=1', '--threshold', 'p50=100',
+            '--threshold', 'p95=100', '--threshold', 'peak_memory=100')
+        self.assertEqual(exit_code, 0)
+        self.assertIn('No regressions', output)
+
+    def test_regressions_fail(self):
+        with open(self.baseline, 'w') as file_:
+            json.dump({'entities': dict(RESULT, throughput=1e9)}, file_)
+
+        exit_code, output = self.main('--baseline', self.baseline)
+        self.assertEqual(exit_code, 1)
+        self.assertIn('entities: throughput regressed', output)
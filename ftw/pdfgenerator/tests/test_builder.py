@@ -2,17 +2,23 @@
 # W0212: Access to a protected member of a client class
 # W0201: Attribute defined outside __init__
 
+from ftw.pdfgenerator.admission import AdmissionControl
 from ftw.pdfgenerator.builder import Builder
+from ftw.pdfgenerator.exceptions import BuildLimitExceeded
+from ftw.pdfgenerator.exceptions import BuildRejected
 from ftw.pdfgenerator.exceptions import BuildTerminated, PDFBuildFailed
 from ftw.pdfgenerator.interfaces import IBuilder, IBuilderFactory
 from ftw.pdfgenerator.testing import PREDEFINED_BUILD_DIRECTORY_LAYER
 from ftw.testing import MockTestCase
 from mock import patch
 from StringIO import StringIO
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+from ZPublisher.Iterators import IStreamIterator
 from zope.component import getUtility
 from zope.interface.verify import verifyClass
 import os
+import shutil
+import tempfile
 
 
 class TestBuilder(MockTestCase):
@@ -325,3 +331,344 @@ class TestBuilder(MockTestCase):
         self.assertTrue(os.path.exists(builder.build_directory))
         builder.cleanup()
         self.assertFalse(os.path.exists(builder.build_directory))
+
+    def _enable_format_cache(self):
+        cachedir = tempfile.mkdtemp('test-format-cache')
+        self.layer.config.get_format_cache_directory.return_value = cachedir
+        self.layer.config.format_cache_size = 1024
+        self.addCleanup(shutil.rmtree, cachedir)
+        return cachedir
+
+    def _pdflatex_mock(self, commands):
+        aux_path = os.path.join(self.builddir, 'export.aux')
+        pdf_path = os.path.join(self.builddir, 'export.pdf')
+
+        def pdflatex_call_mock(cmd):
+            commands.append(cmd)
+            if ' -ini ' in cmd:
+                jobname = cmd.split('-jobname=')[1].split(' ')[0]
+                with open(os.path.join(self.builddir, jobname + '.fmt'),
+                          'w+') as fmt:
+                    fmt.write('the format')
+                return (0, 'the log', '')
+
+            with open(aux_path, 'w+') as aux:
+                aux.write('first run')
+            with open(pdf_path, 'w+') as pdf:
+                pdf.write('the pdf')
+            return (0, 'the log', '')
+
+        return pdflatex_call_mock
+
+    def test_format_cache_disabled_by_default(self):
+        builder = getUtility(IBuilderFactory)()
+        self.assertEqual(None, builder._format_cache)
+
+    def test_build_pdf_dumps_format_into_cache(self):
+        cachedir = self._enable_format_cache()
+        builder = getUtility(IBuilderFactory)()
+        commands = []
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            with patch.object(builder, '_get_engine_version') as mocked_version:
+                mocked_execute.side_effect = self._pdflatex_mock(commands)
+                mocked_version.return_value = 'pdfTeX 3.14'
+                builder._build_pdf(
+                    u'\\documentclass{article}\n\\begin{document}\nHi\n'
+                    u'\\end{document}')
+
+        self.assertEqual(3, len(commands))
+        self.assertIn(' -ini ', commands[0])
+        self.assertIn(' -fmt=%s ' % builder._format, commands[1])
+        self.assertEqual([builder._format + '.fmt'], os.listdir(cachedir))
+
+    def test_build_pdf_loads_format_from_cache(self):
+        self._enable_format_cache()
+        latex = u'\\documentclass{article}\n\\begin{document}\n%s\n' \
+            u'\\end{document}'
+
+        with patch.object(Builder, '_get_engine_version') as mocked_version:
+            mocked_version.return_value = 'pdfTeX 3.14'
+
+            builder = getUtility(IBuilderFactory)()
+            with patch.object(builder, '_execute') as mocked_execute:
+                mocked_execute.side_effect = self._pdflatex_mock([])
+                builder._build_pdf(latex % u'first')
+            builder.cleanup()
+
+            os.mkdir(self.builddir)
+            commands = []
+            builder = getUtility(IBuilderFactory)()
+            with patch.object(builder, '_execute') as mocked_execute:
+                mocked_execute.side_effect = self._pdflatex_mock(commands)
+                builder._build_pdf(latex % u'second')
+
+        self.assertEqual(2, len(commands))
+        self.assertNotIn(' -ini ', commands[0])
+        self.assertIn(' -fmt=%s ' % builder._format, commands[0])
+        self.assertTrue(os.path.exists(
+                os.path.join(self.builddir, builder._format + '.fmt')))
+
+    def test_changed_preamble_uses_other_format(self):
+        self._enable_format_cache()
+        builder = getUtility(IBuilderFactory)()
+
+        with patch.object(builder, '_get_engine_version') as mocked_version:
+            mocked_version.return_value = 'pdfTeX 3.14'
+            key_one = builder._format_cache.get_key(
+                builder._get_engine_version(), 'preamble one')
+            key_two = builder._format_cache.get_key(
+                builder._get_engine_version(), 'preamble two')
+
+        self.assertNotEqual(key_one, key_two)
+
+    def test_build_pdf_falls_back_when_dumping_format_fails(self):
+        cachedir = self._enable_format_cache()
+        builder = getUtility(IBuilderFactory)()
+        commands = []
+        pdflatex_call_mock = self._pdflatex_mock(commands)
+
+        def exec_mock(cmd):
+            if ' -ini ' in cmd:
+                commands.append(cmd)
+                return (1, 'the log', '')
+            return pdflatex_call_mock(cmd)
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            with patch.object(builder, '_get_engine_version') as mocked_version:
+                mocked_execute.side_effect = exec_mock
+                mocked_version.return_value = 'pdfTeX 3.14'
+                builder._build_pdf(
+                    u'\\documentclass{article}\n\\begin{document}\nHi\n'
+                    u'\\end{document}')
+
+        self.assertEqual(None, builder._format)
+        self.assertEqual(3, len(commands))
+        self.assertNotIn('-fmt=', commands[1])
+        self.assertEqual([], os.listdir(cachedir))
+
+    def test_file_digests_identify_added_files(self):
+        builder = getUtility(IBuilderFactory)()
+        self.assertEqual([], builder.get_file_digests())
+
+        builder.add_file('b.txt', StringIO('Foo'))
+        builder.add_file('a.txt', 'Foo')
+        digests = builder.get_file_digests()
+        self.assertEqual(2, len(digests))
+        self.assertTrue(digests[0].startswith('a.txt:'))
+        self.assertEqual(digests[0][6:], digests[1][6:])
+
+        builder.add_file('a.txt', 'Bar')
+        self.assertNotEqual(digests[0], builder.get_file_digests()[0])
+
+    def test_first_pass_runs_in_draft_mode(self):
+        builder = getUtility(IBuilderFactory)()
+        commands = []
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = self._pdflatex_mock(commands)
+            builder._build_pdf(u'LaTeX')
+
+        self.assertEqual(2, len(commands))
+        self.assertIn(' -draftmode ', commands[0])
+        self.assertNotIn(' -draftmode ', commands[1])
+
+    def test_passes_before_makeindex_run_in_draft_mode(self):
+        builder = getUtility(IBuilderFactory)()
+        commands = []
+        pdflatex_call_mock = self._pdflatex_mock(commands)
+
+        def exec_mock(cmd):
+            if cmd.startswith('makeindex'):
+                return (0, '', '')
+            with open(os.path.join(self.builddir, 'export.idx'), 'w+') as idx:
+                idx.write('\\indexentry{Test}{2}')
+            return pdflatex_call_mock(cmd)
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = exec_mock
+            builder._build_pdf(u'LaTeX')
+
+        self.assertEqual(3, len(commands))
+        self.assertIn(' -draftmode ', commands[0])
+        self.assertIn(' -draftmode ', commands[1])
+        self.assertNotIn(' -draftmode ', commands[2])
+
+    def test_final_pass_runs_when_last_pass_was_draft(self):
+        builder = getUtility(IBuilderFactory)()
+        pdf_path = os.path.join(self.builddir, 'export.pdf')
+        commands = []
+
+        def exec_mock(cmd):
+            # no aux file is written, so the first pass is the last one
+            commands.append(cmd)
+            if ' -draftmode ' not in cmd:
+                with open(pdf_path, 'w+') as pdf:
+                    pdf.write('the pdf')
+            return (0, 'the log', '')
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = exec_mock
+            self.assertEqual(pdf_path, builder._build_pdf(u'LaTeX'))
+
+        self.assertEqual(2, len(commands))
+        self.assertIn(' -draftmode ', commands[0])
+        self.assertNotIn(' -draftmode ', commands[1])
+
+    def test_rerun_reasons_are_recorded(self):
+        builder = getUtility(IBuilderFactory)()
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = self._pdflatex_mock([])
+            builder._build_pdf(u'LaTeX')
+
+        self.assertEqual(['export.aux changed'], builder.rerun_reasons)
+
+    def test_build_async_returns_future_of_pdf(self):
+        builder = getUtility(IBuilderFactory)()
+        fake_pdf_path = os.path.join(self.builddir, 'export.pdf')
+        with open(fake_pdf_path, 'w') as fake_pdf:
+            fake_pdf.write('the pdf')
+
+        with patch.object(builder, '_build_pdf') as mocked_build_pdf:
+            mocked_build_pdf.return_value = fake_pdf_path
+            future = builder.build_async('LaTeX')
+            self.assertEqual('the pdf', future.result(timeout=10))
+
+        mocked_build_pdf.assert_called_once_with('LaTeX')
+        self.assertFalse(os.path.exists(self.builddir))
+
+    def test_build_zip_async_returns_future_of_zip(self):
+        builder = getUtility(IBuilderFactory)()
+
+        with patch.object(builder, '_build_pdf'):
+            future = builder.build_zip_async('LaTeX')
+            zipfile = ZipFile(future.result(timeout=10), 'r')
+
+        self.assertEqual([], zipfile.namelist())
+
+    def test_build_async_raises_when_terminated(self):
+        builder = getUtility(IBuilderFactory)()
+        builder.cleanup()
+
+        with self.assertRaises(BuildTerminated):
+            builder.build_async('LaTeX')
+
+    def test_build_async_future_raises_build_errors(self):
+        builder = getUtility(IBuilderFactory)()
+
+        with patch.object(builder, '_build_pdf') as mocked_build_pdf:
+            mocked_build_pdf.side_effect = PDFBuildFailed('PDF missing.')
+            future = builder.build_async('LaTeX')
+            with self.assertRaises(PDFBuildFailed):
+                future.result(timeout=10)
+
+    def test_progress_is_reported_to_callback(self):
+        builder = getUtility(IBuilderFactory)()
+        progress = []
+        builder.progress_callback = lambda *args: progress.append(args)
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = self._pdflatex_mock([])
+            builder._build_pdf(u'LaTeX')
+
+        self.assertEqual([('build', None, None),
+                          ('pdflatex', 1, 2),
+                          ('pdflatex', 2, 2)],
+                         progress)
+
+    def test_rejected_build_removes_directory(self):
+        builder = getUtility(IBuilderFactory)()
+
+        with patch('ftw.pdfgenerator.builder.get_admission_control') as \
+                mocked_admission_control:
+            mocked_admission_control.return_value = AdmissionControl(
+                max_concurrent=0, max_queue=0)
+
+            with self.assertRaises(BuildRejected):
+                builder.build('LaTeX')
+            self.assertFalse(os.path.exists(self.builddir))
+
+            os.mkdir(self.builddir)
+            builder = getUtility(IBuilderFactory)()
+            with self.assertRaises(BuildRejected):
+                builder.build_zip('LaTeX')
+            self.assertFalse(os.path.exists(self.builddir))
+
+    def test_execute_enforces_configured_timeout(self):
+        self.layer.config.build_timeout = 0.2
+        try:
+            builder = getUtility(IBuilderFactory)()
+        finally:
+            self.layer.config.build_timeout = None
+
+        with self.assertRaises(BuildLimitExceeded):
+            builder._execute('sleep 10')
+
+    def test_execute_without_limits(self):
+        builder = getUtility(IBuilderFactory)()
+        self.assertEqual((0, 'foo\n', ''), builder._execute('echo foo'))
+
+    def test_build_stream_removes_directory_when_consumed(self):
+        builder = getUtility(IBuilderFactory)()
+
+        def build_pdf(latex):
+            path = os.path.join(self.builddir, 'export.pdf')
+            with open(path, 'wb') as file_:
+                file_.write('the pdf')
+            return path
+
+        with patch.object(builder, '_build_pdf') as mocked_build_pdf:
+            mocked_build_pdf.side_effect = build_pdf
+            stream = builder.build_stream('LaTeX')
+
+        self.assertTrue(IStreamIterator.providedBy(stream))
+        self.assertEqual(7, len(stream))
+        self.assertTrue(os.path.exists(self.builddir))
+
+        self.assertEqual('the pdf', ''.join(stream))
+        self.assertFalse(os.path.exists(self.builddir))
+
+    def test_build_stream_removes_directory_on_failure(self):
+        builder = getUtility(IBuilderFactory)()
+
+        with patch.object(builder, '_build_pdf') as mocked_build_pdf:
+            mocked_build_pdf.side_effect = PDFBuildFailed('PDF missing.')
+            with self.assertRaises(PDFBuildFailed):
+                builder.build_stream('LaTeX')
+
+        self.assertFalse(os.path.exists(self.builddir))
+
+    def test_build_zip_stores_compressed_files_without_compression(self):
+        builder = getUtility(IBuilderFactory)()
+
+        def execute_mock(cmd):
+            with open(os.path.join(self.builddir, 'export.pdf'), 'w') as pdf:
+                pdf.write('Rendered PDF')
+            return 0, '', ''
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = execute_mock
+            builder.add_file('image.JPG', 'JPEG data')
+            zipobj = ZipFile(builder.build_zip('LaTeX Code'))
+
+        compression = dict((info.filename, info.compress_type)
+                           for info in zipobj.infolist())
+        self.assertEqual({'export.tex': ZIP_DEFLATED,
+                          'export.pdf': ZIP_STORED,
+                          'image.JPG': ZIP_STORED},
+                         compression)
+        self.assertEqual('JPEG data', zipobj.read('image.JPG'))
+
+    def test_build_zip_without_deflating(self):
+        self.layer.config.zip_deflate = False
+        self.addCleanup(setattr, self.layer.config, 'zip_deflate', True)
+        builder = getUtility(IBuilderFactory)()
+        builder.add_file('export.sty', 'LaTeX sty file content')
+
+        with patch.object(builder, '_execute') as mocked_execute:
+            mocked_execute.return_value = (1, '', '')
+            zipobj = ZipFile(builder.build_zip('LaTeX Code'))
+
+        self.assertEqual([ZIP_STORED, ZIP_STORED],
+                         [info.compress_type for info in zipobj.infolist()])
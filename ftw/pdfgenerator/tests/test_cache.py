@@ -0,0 +1,131 @@
+# pylint: disable=W0212
+# W0212: Access to a protected member of a client class
+
+from ftw.pdfgenerator.cache import FilesystemStorage
+from ftw.pdfgenerator.cache import MemoryStorage
+from ftw.pdfgenerator.cache import PDFCache
+from ftw.pdfgenerator.interfaces import IPDFCache, IPDFCacheStorage
+from ftw.pdfgenerator.testing import PDFGENERATOR_ZCML_LAYER
+from unittest import TestCase
+from zope.component import getUtility
+from zope.interface.verify import verifyClass
+import os
+import shutil
+import tempfile
+import time
+
+
+class TestMemoryStorage(TestCase):
+
+    def test_implements_interface(self):
+        verifyClass(IPDFCacheStorage, MemoryStorage)
+
+    def test_get_and_set(self):
+        storage = MemoryStorage(100)
+        self.assertEqual(None, storage.get('foo'))
+        storage.set('foo', 'the pdf')
+        self.assertEqual('the pdf', storage.get('foo'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        storage = MemoryStorage(25)
+        storage.set('one', 'x' * 10)
+        storage.set('two', 'x' * 10)
+        storage.get('one')
+        storage.set('three', 'x' * 10)
+
+        self.assertEqual(['one', 'three'], sorted(storage._entries))
+        self.assertEqual(20, storage.size)
+
+    def test_too_large_entries_are_not_stored(self):
+        storage = MemoryStorage(5)
+        storage.set('foo', 'x' * 10)
+        self.assertEqual(None, storage.get('foo'))
+
+    def test_expired_entries_are_removed(self):
+        storage = MemoryStorage(100, ttl=60)
+        storage.set('foo', 'the pdf')
+        storage._entries['foo'] = (time.time() - 120, 'the pdf')
+
+        self.assertEqual(None, storage.get('foo'))
+        self.assertEqual(0, storage.size)
+
+    def test_memory_storage_in_front_of_backend(self):
+        backend = MemoryStorage(100)
+        storage = MemoryStorage(100, backend=backend)
+        storage.set('foo', 'the pdf')
+        self.assertEqual('the pdf', backend.get('foo'))
+
+        backend.set('bar', 'other pdf')
+        self.assertEqual('other pdf', storage.get('bar'))
+        self.assertIn('bar', storage._entries)
+
+
+class TestFilesystemStorage(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp('test-pdf-cache')
+        self.directory = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_implements_interface(self):
+        verifyClass(IPDFCacheStorage, FilesystemStorage)
+
+    def test_get_and_set(self):
+        storage = FilesystemStorage(self.directory, 100)
+        self.assertEqual(None, storage.get('foo'))
+        storage.set('foo', 'the pdf')
+        self.assertEqual('the pdf', storage.get('foo'))
+        self.assertEqual(['foo.pdf'], os.listdir(self.directory))
+
+    def test_least_recently_used_files_are_evicted(self):
+        storage = FilesystemStorage(self.directory, 25)
+        storage.set('one', 'x' * 10)
+        storage.set('two', 'x' * 10)
+        now = time.time()
+        os.utime(os.path.join(self.directory, 'one.pdf'), (now - 10, now))
+        os.utime(os.path.join(self.directory, 'two.pdf'), (now - 20, now))
+        storage.set('three', 'x' * 10)
+
+        self.assertEqual(['one.pdf', 'three.pdf'],
+                         sorted(os.listdir(self.directory)))
+
+    def test_expired_files_are_removed(self):
+        storage = FilesystemStorage(self.directory, 100, ttl=60)
+        storage.set('foo', 'the pdf')
+        path = os.path.join(self.directory, 'foo.pdf')
+        os.utime(path, (time.time() - 120, time.time() - 120))
+
+        self.assertEqual(None, storage.get('foo'))
+        self.assertFalse(os.path.exists(path))
+
+
+class TestPDFCache(TestCase):
+
+    layer = PDFGENERATOR_ZCML_LAYER
+
+    def test_implements_interface(self):
+        verifyClass(IPDFCache, PDFCache)
+
+    def test_utility_is_disabled_by_default(self):
+        self.assertFalse(getUtility(IPDFCache).enabled)
+        self.assertFalse(PDFCache().enabled)
+
+    def test_key_depends_on_latex_and_files(self):
+        cache = PDFCache(MemoryStorage(100))
+        key = cache.get_key('latex', ['a.jpg:1'])
+        self.assertEqual(key, cache.get_key(u'latex', ['a.jpg:1']))
+        self.assertNotEqual(key, cache.get_key('latex', ['a.jpg:2']))
+        self.assertNotEqual(key, cache.get_key('latex', []))
+        self.assertNotEqual(key, cache.get_key('latex2', ['a.jpg:1']))
+
+    def test_hits_and_misses_are_counted(self):
+        cache = PDFCache(MemoryStorage(100))
+        cache.get('foo')
+        cache.set('foo', 'the pdf')
+        cache.get('foo')
+        cache.get('foo')
+
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
@@ -21,6 +21,9 @@ class TestDefaultConfigurationUtility(TestCase):
     def test_remove_build_directory_true_by_default(self):
         self.assertTrue(DefaultConfig().remove_build_directory)
 
+    def test_zip_deflate_true_by_default(self):
+        self.assertTrue(DefaultConfig().zip_deflate)
+
     def test_build_directory_existing(self):
         path = DefaultConfig().get_build_directory()
         self.assertTrue(os.path.exists(path))
@@ -40,6 +43,15 @@ class TestDefaultConfigurationUtility(TestCase):
         os.rmdir(path_one)
         os.rmdir(path_two)
 
+    def test_format_cache_disabled_by_default(self):
+        self.assertEqual(None, DefaultConfig().get_format_cache_directory())
+
+    def test_convert_cache_disabled_by_default(self):
+        self.assertEqual(None, DefaultConfig().convert_cache_size)
+
+    def test_fastest_html_parser_by_default(self):
+        self.assertEqual(None, DefaultConfig().html_parser)
+
     def test_config_utility_is_registered_and_default_utility(self):
         self.assertIsNotNone(queryUtility(IConfig))
 
@@ -1,11 +1,49 @@
 from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.assembler import PDFAssembler
+from ftw.pdfgenerator.browser.views import ExportDownloadView
 from ftw.pdfgenerator.browser.views import ExportPDFView
+from ftw.pdfgenerator.browser.views import ExportStatusView
+from ftw.pdfgenerator.exceptions import BuildRejected
+from ftw.pdfgenerator.html2latex.profiling import ConversionProfile
 from ftw.pdfgenerator.testing import PDFGENERATOR_ZCML_LAYER
 from ftw.testing import MockTestCase
 from mock import patch
+from zExceptions import NotFound
+from ZPublisher.Iterators import IStreamIterator
 from zope.component import getMultiAdapter
 from zope.interface import Interface, directlyProvides
 from zope.publisher.interfaces.browser import IDefaultBrowserLayer
+import json
+import os
+import shutil
+import tempfile
+
+
+class StreamingAssembler(object):
+
+    def __init__(self, context, request):
+        pass
+
+    def build_pdf(self, **kwargs):
+        return 'pdf', kwargs
+
+    def build_zip(self, layout=None, builder=None, request=None,
+                  filename=None, stream=False):
+        return 'zip', {'stream': stream, 'request': request}
+
+
+class LegacyAssembler(object):
+
+    def __init__(self, context, request):
+        pass
+
+    def build_pdf(self, layout=None, builder=None, request=None,
+                  filename=None):
+        return 'pdf', request
+
+    def build_zip(self, layout=None, builder=None, request=None,
+                  filename=None):
+        return 'zip', request
 
 
 class TestAsPDFView(MockTestCase):
@@ -50,6 +88,27 @@ class TestAsPDFView(MockTestCase):
 
         aspdf = ExportPDFView(context, request)
         self.assertEqual(aspdf.export(output='pdf'), request)
+        assembler.build_pdf.assert_called_with(request=request)
+
+    def test_export_streams_pdf_when_supported(self):
+        request = object()
+        self.mock_adapter(StreamingAssembler, interfaces.IPDFAssembler,
+                          (Interface, Interface))
+
+        aspdf = ExportPDFView(object(), request)
+        self.assertEqual(('pdf', {'stream': True, 'request': request}),
+                         aspdf.export(output='pdf'))
+        self.assertEqual(('zip', {'stream': True, 'request': request}),
+                         aspdf.export(output='zip'))
+
+    def test_export_with_assembler_not_supporting_streaming(self):
+        request = object()
+        self.mock_adapter(LegacyAssembler, interfaces.IPDFAssembler,
+                          (Interface, Interface))
+
+        aspdf = ExportPDFView(object(), request)
+        self.assertEqual(('pdf', request), aspdf.export(output='pdf'))
+        self.assertEqual(('zip', request), aspdf.export(output='zip'))
 
     def test_export_as_latex(self):
         context = object()
@@ -76,6 +135,32 @@ class TestAsPDFView(MockTestCase):
 
         aspdf = ExportPDFView(context, request)
         self.assertEqual(aspdf.export(output='zip'), request)
+        assembler.build_zip.assert_called_with(request=request)
+
+    def test_export_profile(self):
+        context = object()
+        request = object()
+
+        assembler = self.mock()
+        self.mock_adapter(assembler, interfaces.IPDFAssembler,
+                          (Interface, Interface))
+        assembler.return_value = assembler
+
+        profile = ConversionProfile()
+        profile.record(interfaces.HTML2LATEX_MODE_REGEXP, '<b>', '', 0.0025,
+                       2, 100, 80)
+        assembler.build_profile.return_value = profile
+
+        aspdf = ExportPDFView(context, request)
+        with patch.object(ExportPDFView, 'profile_template') as template:
+            self.assertEqual(aspdf.export(output='profile'),
+                             template.return_value)
+
+        assembler.build_profile.assert_called_with(request=request)
+        self.assertEqual(aspdf.get_profile_rows(),
+                         [{'pattern': '<b>', 'kind': 'regexp',
+                           'time': '2.50', 'calls': 1, 'matches': 2,
+                           'bytes_in': 100, 'bytes_out': 80}])
 
     def test_export_with_unkown_output(self):
         context = object()
@@ -171,3 +256,176 @@ class TestAsPDFView(MockTestCase):
             )
             aspdf = ExportPDFView(context, request)
             self.assertEqual(aspdf(), 'latex code')
+
+    @patch('plone.api.user.is_anonymous')
+    def test_call_exports_in_background_if_requested(self, is_anonymous):
+        is_anonymous.return_value = False
+        context, request = self.mock_allow_alternate_output(False)
+        request_params = {'background': '1'}
+
+        with patch(
+            'ftw.pdfgenerator.tests.test_export.ExportPDFView'
+            '.export_background'
+        ) as mocked_export:
+            mocked_export.return_value = 'the job'
+            request.get.side_effect = (
+                lambda name, default=None: request_params.get(name, default)
+            )
+            aspdf = ExportPDFView(context, request)
+            self.assertEqual(aspdf(), 'the job')
+            mocked_export.assert_called_once_with('pdf')
+
+    @patch('plone.api.user.is_anonymous')
+    def test_export_background(self, is_anonymous):
+        is_anonymous.return_value = True
+        context = self.mock()
+        context.absolute_url.return_value = 'http://nohost/plone/folder'
+        request = self.mock()
+
+        assembler = self.mock()
+        self.mock_adapter(assembler, interfaces.IPDFAssembler,
+                          (Interface, Interface))
+        assembler.return_value = assembler
+
+        registry = self.mock()
+        registry.submit.return_value = 'abc'
+        self.mock_utility(registry, interfaces.IBuildJobRegistry)
+
+        aspdf = ExportPDFView(context, request)
+        self.assertEqual(
+            {'job': 'abc',
+             'status_url': 'http://nohost/plone/folder'
+             '/@@pdf-export-status?job=abc',
+             'download_url': 'http://nohost/plone/folder'
+             '/@@pdf-export-download?job=abc'},
+            json.loads(aspdf.export_background('zip')))
+
+        registry.submit.assert_called_once_with(
+            assembler, 'zip', filename=None, user_id=None)
+
+    def test_export_background_with_unkown_output(self):
+        aspdf = ExportPDFView(object(), object())
+        with self.assertRaises(ValueError) as cm:
+            aspdf.export_background('latex')
+
+        self.assertEqual(str(cm.exception), 'Unkown output "latex"')
+
+
+class TestExportJobViews(MockTestCase):
+
+    layer = PDFGENERATOR_ZCML_LAYER
+
+    def setUp(self):
+        super(TestExportJobViews, self).setUp()
+        self.context = self.mock()
+        self.context.absolute_url.return_value = 'http://nohost/plone/folder'
+        self.context.getId.return_value = 'folder'
+        self.request = self.mock()
+        self.request.get.return_value = 'abc'
+        self.registry = self.mock()
+        self.mock_utility(self.registry, interfaces.IBuildJobRegistry)
+
+        patcher = patch('plone.api.user.is_anonymous')
+        patcher.start().return_value = True
+        self.addCleanup(patcher.stop)
+
+    def test_components_registered(self):
+        request = self.create_dummy()
+        directlyProvides(request, IDefaultBrowserLayer)
+        self.assertTrue(isinstance(
+                getMultiAdapter((object(), request),
+                                name='pdf-export-status'),
+                ExportStatusView))
+        self.assertTrue(isinstance(
+                getMultiAdapter((object(), request),
+                                name='pdf-export-download'),
+                ExportDownloadView))
+
+    def test_status(self):
+        self.registry.get_job.return_value = {
+            'id': 'abc', 'user': None, 'state': 'running',
+            'stage': 'pdflatex', 'current': 1, 'total': 2}
+
+        self.assertEqual(
+            {'state': 'running', 'stage': 'pdflatex', 'current': 1,
+             'total': 2, 'error': None},
+            json.loads(ExportStatusView(self.context, self.request)()))
+        self.registry.get_job.assert_called_once_with('abc')
+
+    def test_status_of_finished_job_contains_download_url(self):
+        self.registry.get_job.return_value = {
+            'id': 'abc', 'user': None, 'state': 'finished'}
+
+        status = json.loads(ExportStatusView(self.context, self.request)())
+        self.assertEqual(
+            'http://nohost/plone/folder/@@pdf-export-download?job=abc',
+            status['download_url'])
+
+    def test_unknown_job_is_not_found(self):
+        self.registry.get_job.return_value = None
+        with self.assertRaises(NotFound):
+            ExportStatusView(self.context, self.request)()
+
+    def test_job_of_other_user_is_not_found(self):
+        self.registry.get_job.return_value = {
+            'id': 'abc', 'user': 'hugo', 'state': 'finished'}
+        with self.assertRaises(NotFound):
+            ExportDownloadView(self.context, self.request)()
+
+    def test_download(self):
+        tempdir = tempfile.mkdtemp('test-jobs')
+        self.addCleanup(shutil.rmtree, tempdir)
+        path = os.path.join(tempdir, 'result')
+        with open(path, 'w') as file_:
+            file_.write('the pdf')
+
+        self.registry.get_job.return_value = {
+            'id': 'abc', 'user': None, 'state': 'finished', 'output': 'pdf',
+            'filename': None}
+        self.registry.get_result_path.return_value = path
+        self.mock_adapter(PDFAssembler, interfaces.IPDFAssembler,
+                          (Interface, Interface))
+
+        iterator = ExportDownloadView(self.context, self.request)()
+        self.assertTrue(IStreamIterator.providedBy(iterator))
+        self.assertEqual('the pdf', ''.join(iterator))
+        self.request.RESPONSE.setHeader.assert_any_call(
+            'Content-Type', 'application/pdf; charset=utf-8')
+        self.request.RESPONSE.setHeader.assert_any_call(
+            'Content-disposition', 'attachment; filename="folder.pdf"')
+        self.request.RESPONSE.setHeader.assert_any_call(
+            'Content-Length', '7')
+
+    def test_download_of_unfinished_job_is_not_found(self):
+        self.registry.get_job.return_value = {
+            'id': 'abc', 'user': None, 'state': 'running'}
+        self.registry.get_result_path.return_value = None
+
+        with self.assertRaises(NotFound):
+            ExportDownloadView(self.context, self.request)()
+
+
+class TestExportAdmission(MockTestCase):
+
+    layer = PDFGENERATOR_ZCML_LAYER
+
+    @patch('plone.api.user.is_anonymous')
+    def test_rejected_build_responds_with_503(self, is_anonymous):
+        is_anonymous.return_value = False
+        request = self.mock()
+        context = self.mock()
+        user = context.portal_membership.getAuthenticatedMember.return_value
+        user.has_permission.return_value = False
+        request.cookies.get.return_value = 'False'
+        request.get.side_effect = lambda name, default=None: default
+
+        with patch(
+            'ftw.pdfgenerator.tests.test_export.ExportPDFView.export'
+        ) as mocked_export:
+            mocked_export.side_effect = BuildRejected(
+                'The build queue is full.', retry_after=20)
+            aspdf = ExportPDFView(context, request)
+            self.assertIn('Please try again later.', aspdf())
+
+        request.response.setStatus.assert_called_once_with(503)
+        request.response.setHeader.assert_any_call('Retry-After', '20')
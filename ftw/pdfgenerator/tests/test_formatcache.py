@@ -0,0 +1,60 @@
+from ftw.pdfgenerator.formatcache import FormatCache
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+
+class TestFormatCache(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp('test-format-cache')
+        self.directory = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def create_format(self, data):
+        path = os.path.join(self.tempdir, 'export.fmt')
+        with open(path, 'wb') as file_:
+            file_.write(data)
+        return path
+
+    def test_key_depends_on_all_parts(self):
+        cache = FormatCache(self.directory, 1024)
+        self.assertEqual(cache.get_key('pdfTeX 3.14', 'preamble'),
+                         cache.get_key('pdfTeX 3.14', u'preamble'))
+        self.assertNotEqual(cache.get_key('pdfTeX 3.14', 'preamble'),
+                            cache.get_key('pdfTeX 3.15', 'preamble'))
+        self.assertNotEqual(cache.get_key('ab', 'c'),
+                            cache.get_key('a', 'bc'))
+
+    def test_get_returns_None_when_missing(self):
+        cache = FormatCache(self.directory, 1024)
+        self.assertEqual(None, cache.get('foo'))
+
+    def test_store_creates_directory_and_copies_format(self):
+        cache = FormatCache(self.directory, 1024)
+        path = cache.store('foo', self.create_format('the format'))
+
+        self.assertEqual(path, cache.get('foo'))
+        self.assertEqual(['foo.fmt'], os.listdir(self.directory))
+        with open(path) as file_:
+            self.assertEqual('the format', file_.read())
+
+    def test_least_recently_used_formats_are_evicted(self):
+        cache = FormatCache(self.directory, 25)
+        cache.store('one', self.create_format('x' * 10))
+        cache.store('two', self.create_format('x' * 10))
+        os.utime(os.path.join(self.directory, 'one.fmt'), (2000, 2000))
+        os.utime(os.path.join(self.directory, 'two.fmt'), (1000, 1000))
+
+        cache.store('three', self.create_format('x' * 10))
+
+        self.assertEqual(['one.fmt', 'three.fmt'],
+                         sorted(os.listdir(self.directory)))
+
+    def test_stored_format_is_never_evicted(self):
+        cache = FormatCache(self.directory, 5)
+        cache.store('big', self.create_format('x' * 10))
+        self.assertEqual(['big.fmt'], os.listdir(self.directory))
@@ -297,3 +297,116 @@ class TestHTML2LaTeXConvertRunner(MockTestCase):
             runner.quoted_umlauts(
                 '\xc3\x9cber h\xc3\xb6fliche B\xc3\xbcrger'
                 ' aus Rh\xc3\xb4ne-Alpes'))
+
+    def test_lock_chars_uses_short_tokens(self):
+        obj = converter.HTML2LatexConverter(
+            object(), object(), object())
+        runner = converter.HTML2LatexConvertRunner(obj, [], 'foo bar baz')
+
+        id_ = runner.lock_chars(4, 7)
+        self.assertEqual(len(converter.LOCK_TOKEN_START) + 9, len(id_))
+        self.assertEqual('foo %s baz' % id_, runner.html)
+        self.assertNotEqual(id_, runner.lock_chars(0, 3))
+
+    def test_unlock_nested_locks(self):
+        obj = converter.HTML2LatexConverter(
+            object(), object(), object())
+        runner = converter.HTML2LatexConvertRunner(obj, [], 'a b c')
+
+        inner = runner.replace_and_lock(2, 3, 'B')
+        runner.replace_and_lock(0, len(runner.html),
+                                '[%s]' % runner.html)
+        runner._unlock_chars()
+        self.assertEqual('[a B c]', runner.html)
+        self.assertNotIn(inner, runner.html)
+
+    def test_unlock_many_locks(self):
+        obj = converter.HTML2LatexConverter(
+            object(), object(), object())
+        runner = converter.HTML2LatexConvertRunner(obj, [], 'x ' * 3000)
+
+        for index in range(3000):
+            position = runner.html.index('x')
+            runner.replace_and_lock(position, position + 1, str(index))
+
+        runner._unlock_chars()
+        self.assertEqual(' '.join(map(str, range(3000))), runner.html)
+
+    def test_private_use_characters_in_html_are_kept(self):
+        obj = converter.HTML2LatexConverter(
+            object(), object(), object())
+        lookalike = converter.LOCK_TOKEN_START + (
+            unichr(converter.LOCK_TOKEN_FIRST_DIGIT) * 3).encode('utf-8')
+        html = 'a %s b %s' % (converter.LOCK_TOKEN_START, lookalike)
+        runner = converter.HTML2LatexConvertRunner(obj, [], html)
+
+        runner.replace_and_lock(0, 1, 'A')
+        runner._unlock_chars()
+        self.assertEqual('A' + html[1:], runner.html)
+
+
+class TestSubconverterScanning(TestCase):
+
+    def convert(self, subconverter_class, html):
+        obj = converter.HTML2LatexConverter(object(), object(), object())
+        obj.patterns = [DEFAULT_PLACEHOLDER]
+        obj.register_subconverters([subconverter_class])
+        return obj.convert(html)
+
+    def test_search_continues_at_the_replaced_part(self):
+        calls = []
+
+        class Link(subconverter.SubConverter):
+            pattern = r'<a>(.*?)</a>'
+
+            def __call__(self):
+                calls.append((self.match.start(), self.match.group(1)))
+                self.replace_and_lock('[%s]' % self.match.group(1))
+
+        self.assertEqual('[1] [2] [3]',
+                         self.convert(Link, '<a>1</a> <a>2</a> <a>3</a>'))
+        self.assertEqual(['1', '2', '3'], [text for _start, text in calls])
+        # The third link is found after the two tokens of the locked links.
+        token_length = len(converter.LOCK_TOKEN_START) + 9
+        self.assertEqual(2 * (token_length + 1), calls[2][0])
+
+    def test_replaced_text_is_searched_again(self):
+        class Format(subconverter.SubConverter):
+            pattern = r'<(b|i)>(.*?)</\1>'
+
+            def __call__(self):
+                if self.match.group(1) == 'b':
+                    self.replace('<i>%s</i>' % self.match.group(2))
+                else:
+                    self.replace('/%s/' % self.match.group(2))
+
+        self.assertEqual('/x/ /y/',
+                         self.convert(Format, '<b>x</b> <b>y</b>'))
+
+    def test_unchanged_matches_are_skipped(self):
+        calls = []
+
+        class Noop(subconverter.SubConverter):
+            pattern = r'x'
+
+            def __call__(self):
+                calls.append(self.match.start())
+
+        self.assertEqual('x x', self.convert(Noop, 'x x'))
+        self.assertEqual([0, 2], calls)
+
+    def test_rescan_after_replace(self):
+        calls = []
+
+        class Counter(subconverter.SubConverter):
+            pattern = r'<c/>|x'
+            rescan_after_replace = True
+
+            def __call__(self):
+                calls.append(self.match.group(0))
+                if self.match.group(0) == '<c/>':
+                    self.replace('C')
+
+        self.assertEqual('x C', self.convert(Counter, 'x <c/>'))
+        # The "x" is visited again after the replacement.
+        self.assertEqual(['x', '<c/>', 'x'], calls)
@@ -0,0 +1,217 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.benchmark import corpus
+from ftw.pdfgenerator.html2latex import dom
+from ftw.pdfgenerator.html2latex import subconverter
+from ftw.pdfgenerator.html2latex.subconverters import listing
+from ftw.pdfgenerator.html2latex.subconverters import table
+from ftw.testing import MockTestCase
+from mock import patch
+from zope.interface.verify import verifyClass
+
+
+MODE_REPLACE = interfaces.HTML2LATEX_MODE_REPLACE
+
+# HTML snippets which are converted equally by the DOM converter and the
+# regular expression converter.
+CORPUS = (
+    'Plain text',
+    '<p>Foo <b>bar</b> baz</p><p>Second &amp; 50% "quoted" text</p>',
+    '<p>Foo</p>\n<p>Bar</p>',
+    '<h1>Title</h1><p>Text</p>',
+    '<h1>Title</h1>',
+    '<h2 class="x">Sub</h2><h3>Subsub</h3>',
+    '<h1>a {b}</h1><ul><li>x<br/>y</li></ul><p>e-mail</p><h2>T</h2>',
+    '<em>e</em> <u>u</u> <strong>s</strong> <sup>2</sup> <i>i</i>',
+    '<p>x <b> y</b> {z} \\ <!-- comment --> &auml; &#228; \xc3\xa4</p>',
+    '<p>x<b> y</b></p>',
+    '"<b>quoted</b>"',
+    '<p>a<br/><b>b<br/><br/>c</b></p>',
+    '<span style="font-weight: bold">bold</span> http://www.google.ch',
+    'Line<br />break<br/><br/>paragraph',
+    '<ul><li>One</li><li>Two <i>it</i></li></ul>',
+    '<ol><li>a<ul><li>b</li></ul></li></ol><p>after</p>',
+    '<ol>\n<li>First</li>\n<li>Second</li>\n</ol>',
+    '<dl><dt>Term</dt><dd>Definition</dd></dl>',
+    '<ul><li>O:\\foo\\bar</li></ul>',
+    '<p>A <a href="http://x.ch/a_b">link</a> here</p>',
+    '<a href="./foo/bar">relative</a>',
+    '<a href="mailto:info@4teamwork.ch">mail</a>',
+    '<p>x<span class="footnote" data-footnote="note">fn</span> y</p>',
+    '<table><tr><td>a</td><td>b</td></tr></table>',
+    '<table class="grid"><tr><th colspan="2">{a} &amp; &auml;\\b</th></tr>'
+    '<tr><td>x<br/><b>y</b></td><td><ul><li>z</li></ul></td></tr></table>',
+    '<ul><li>x<table><tr><td>in list</td></tr></table></li></ul>',
+    '<table><tr><td><table><tr><td>nested</td></tr></table></td></tr></table>',
+    '<p class="callout">c</p><h5 class="glossar">g</h5>'
+    '<span class="paragraphHeading">ph</span>',
+    '<style>p { color: red; }</style><p>styled</p>',
+    'Fr. 20.-- e.g. z.B. Art. 5, 12. Mai',
+    '<ul><li>a<ul><li>b</li></ul></li></ul><p>x</p><ul><li>c</li></ul>',
+    '<ul><li>a</li><ul><li>b</li></ul></ul><ol><li>c</li></ol>',
+    '<p>a <em>b</em><br/>c <i>d</i><br />e</p>',
+    '<sup>2</sup><sub>3</sub> x<sup>2</sup> <sub>3</sub>',
+    'x<u><b> y</b></u> <em> z</em>',
+    )
+
+# Seeds of the generated benchmark corpora compared with the regular
+# expression converter.
+CORPUS_SEEDS = (corpus.DEFAULT_SEED, 1, 2)
+
+FOOTNOTE_WITH_SPAN = ('<span class="footnote" data-footnote="n">'
+                      'a <span>b</span> c</span>')
+
+
+class TestDOMConverter(MockTestCase):
+
+    def setUp(self):
+        super(TestDOMConverter, self).setUp()
+
+        self.context = self.mock()
+        self.context.absolute_url.return_value = 'http://nohost/plone'
+        self.layout = self.mock()
+
+        self.converter = dom.DOMHTML2LatexConverter(
+            context=self.context,
+            request=object(),
+            layout=self.layout)
+
+    def convert(self, html, **kwargs):
+        return self.converter.convert(html, **kwargs)
+
+    def test_implements_interface(self):
+        verifyClass(interfaces.IHTML2LaTeXConverter,
+                    dom.DOMHTML2LatexConverter)
+
+    def test_corpus_is_converted_like_legacy_converter(self):
+        differences = {}
+        for html in CORPUS:
+            diff = self.converter.compare_with_legacy(html)
+            if diff:
+                differences[html] = '\n'.join(diff)
+
+        self.assertEqual(differences, {})
+
+    def test_benchmark_corpus_is_converted_like_legacy_converter(self):
+        differences = {}
+        for seed in CORPUS_SEEDS:
+            for name, html in corpus.get_corpus(seed=seed).items():
+                diff = self.converter.compare_with_legacy(html)
+                if diff:
+                    differences[(name, seed)] = '\n'.join(diff)
+
+        self.assertEqual(differences, {})
+
+    def test_compare_with_legacy_returns_unified_diff(self):
+        # The regular expression stops at the first closing tag.
+        self.assertEqual(
+            self.converter.compare_with_legacy(FOOTNOTE_WITH_SPAN),
+            ['--- regular expression converter',
+             '+++ DOM converter',
+             '@@ -1 +1 @@',
+             '-a b\\footnote{n} c',
+             '+a b c\\footnote{n}'])
+
+    def test_differential_mode_logs_differences(self):
+        self.converter.differential = True
+
+        with patch.object(dom.LOG, 'warning') as warning:
+            self.assertEqual(self.convert('<b>a</b>'), '\\textbf{a}')
+            self.assertFalse(warning.called)
+
+            self.assertEqual(self.convert(FOOTNOTE_WITH_SPAN),
+                             'a b c\\footnote{n}')
+            self.assertEqual(warning.call_count, 1)
+
+    def test_nested_elements(self):
+        self.assertEqual(
+            self.convert('<h2>The <b>bold <i>and</i> the</b> italic</h2>'),
+            '\\subsection{The \\textbf{bold \\textit{and} the} italic}')
+
+    def test_text_is_escaped(self):
+        self.assertEqual(self.convert('<b>{a} \\ 100% $</b>'),
+                         '\\textbf{\\{a\\} \\textbackslash  100\\% \\$}')
+
+    def test_markers_in_text_are_kept(self):
+        html = u'<p>\ue000 \ue001 \ue002 \ue003 \ue004</p>'
+        self.assertEqual(self.convert(html),
+                         html[3:-4].encode('utf-8'))
+
+    def test_empty_formatting_is_removed(self):
+        self.assertEqual(self.convert('a<b> </b>b<i></i>'), 'a b')
+
+    def test_custom_patterns_are_applied_to_text(self):
+        self.assertEqual(
+            self.convert('<h1>Hello World</h1>',
+                         custom_patterns=[(MODE_REPLACE, 'World', 'Moon')]),
+            '\\section{Hello Moon}')
+
+    def test_registered_patterns_are_applied_to_text(self):
+        self.converter.register_patterns([(MODE_REPLACE, 'World', 'Moon')])
+        self.assertEqual(self.convert('<ul><li>World</li></ul>'),
+                         '\n\\begin{itemize}\n\\item Moon\n\\end{itemize}\n')
+
+    def test_custom_subconverter_converts_its_elements(self):
+        class CustomListConverter(subconverter.SubConverter):
+            pattern = listing.ListConverter.pattern
+
+            def __call__(self):
+                self.replace_and_lock('LIST')
+
+        self.assertEqual(
+            self.convert('<p>a</p><ul><li>b</li></ul>',
+                         custom_subconverters=[CustomListConverter]),
+            'a\n\nLIST')
+
+    def test_tables_are_not_parsed_again(self):
+        with patch.object(table.TableConverter, 'parse') as parse:
+            latex = self.convert('<table><tr><td>a</td></tr></table>')
+
+        self.assertFalse(parse.called)
+        self.assertIn('\\multicolumn{1}{l}{a} \\\\', latex)
+
+    def test_custom_table_subconverter_converts_tables(self):
+        class CustomTableConverter(subconverter.SubConverter):
+            pattern = table.TableConverter.pattern
+
+            def __call__(self):
+                self.replace_and_lock('TABLE')
+
+        self.assertEqual(
+            self.convert('<table><tr><td>a</td></tr></table>',
+                         custom_subconverters=[CustomTableConverter]),
+            'TABLE')
+
+    def test_lists_are_flattened_at_nesting_limit(self):
+        # Like the list subconverter, only lists directly nested in a list
+        # are counted.
+        html = '<ul><li>x</li></ul>'
+        for _i in range(listing.LIST_NESTING_LIMIT):
+            html = '<ul><li>x</li>%s</ul>' % html
+
+        latex = self.convert(html)
+        self.assertEqual(latex.count('\\begin{itemize}'),
+                         listing.LIST_NESTING_LIMIT)
+        self.assertEqual(latex.count('\\item'),
+                         listing.LIST_NESTING_LIMIT + 1)
+
+    def test_links(self):
+        self.assertEqual(
+            self.convert('<a href="foo"><b>Foo</b> &amp; bar</a>'),
+            '\\href{http://nohost/plone/foo}{\\textbf{Foo} \\& bar'
+            '\\footnote{\\href{http://nohost/plone/foo}'
+            '{\\url{http://nohost/plone/foo}}}}')
+
+        self.layout.use_package.assert_any_call('hyperref')
+
+    def test_anchors_without_href_are_removed(self):
+        self.assertEqual(self.convert('<a name="top">Top</a>'), 'Top')
+
+    def test_footnotes(self):
+        self.assertEqual(
+            self.convert('<span class="footnote" data-footnote="a &amp; b">'
+                         '<i>text</i></span>'),
+            '\\textit{text}\\footnote{a \\& b}')
+
+    def test_script_is_removed(self):
+        self.assertEqual(self.convert('a<script>alert("b");</script>c'),
+                         'ac')
@@ -33,6 +33,13 @@ class TestFootnoteConverter(MockTestCase):
                                   'footnote': 'thefn'}
         self.assertEqual(self.convert(html), latex)
 
+    def test_quoted_fn(self):
+        html = ('Say "<span class="footnote" data-footnote="thefn">'
+                'complicated</span>" now')
+        latex = LATEX_FOOTNOTE % {'text': 'complicated',
+                                  'footnote': 'thefn'}
+        self.assertEqual(self.convert(html), 'Say "`%s"\' now' % latex)
+
     def test_fn_with_icon(self):
         html = ('<span class="footnote" data-footnote="thefn">complicated'
                 '<i class="some-icon"></i></span>')
@@ -1,5 +1,8 @@
 from ftw.pdfgenerator.html2latex.subconverters import htmlentities
 from ftw.pdfgenerator.tests.base import SubconverterTestBase
+from mock import patch
+from unittest import TestCase
+import re
 
 
 class TestHtmlentitiesConverter(SubconverterTestBase):
@@ -23,3 +26,38 @@ class TestHtmlentitiesConverter(SubconverterTestBase):
         # "&" should also be escaped by a later pattern.
         self.assertEqual(self.convert('m&#38;m'),
                          r'm\&m')
+
+    def test_unknown_entities_are_kept(self):
+        self.assertEqual(self.convert('a &foo; b'), r'a \&foo; b')
+
+    def test_decoded_ampersand_may_start_an_entity(self):
+        self.assertEqual(self.convert('&#38;lt; &#x26;#38;gt; &#38;foo;'),
+                         r'< > \&foo;')
+
+    def test_entities_are_decoded_in_a_single_pass(self):
+        with patch.object(htmlentities.HtmlentitiesConverter,
+                          '__init__') as init:
+            self.assertEqual(self.convert('&alpha; &#946; &#x3b3;'),
+                             '\xce\xb1 \xce\xb2 \xce\xb3')
+
+        self.assertFalse(init.called)
+
+
+class TestDecodeEntities(TestCase):
+
+    def setUp(self):
+        self.xpr = re.compile(htmlentities.HtmlentitiesConverter.pattern)
+
+    def test_decodes_entities(self):
+        self.assertEqual(
+            ('\xc3\xa4 < \xe2\x82\xac', 3),
+            htmlentities.decode_entities(self.xpr, '&auml; &#60; &#x20AC;'))
+
+    def test_unknown_entities_are_not_changed(self):
+        self.assertEqual(('a &foo; b', 1),
+                         htmlentities.decode_entities(self.xpr, 'a &foo; b'))
+
+    def test_chained_entities(self):
+        self.assertEqual(
+            ('< &x', 3),
+            htmlentities.decode_entities(self.xpr, '\\&#38;lt; \\&#38;x'))
@@ -43,6 +43,13 @@ class TestHyperlinkConverter(MockTestCase):
                               'url_label': 'http://www.google.com/'}
         self.assertEqual(self.convert(html), latex)
 
+
+    def test_converts_quoted_urls(self):
+        html = 'Say "<a href="http://www.google.com/">guugel</a>" now'
+        latex = LATEX_HREF % {'label': 'guugel',
+                              'url': 'http://www.google.com/',
+                              'url_label': 'http://www.google.com/'}
+        self.assertEqual(self.convert(html), 'Say "`%s"\' now' % latex)
     def test_relative_urls(self):
         html = '<a href="./foo/bar">baz</a>'
         latex = LATEX_HREF % {
@@ -219,6 +226,32 @@ class TestHyperlinkConverter(MockTestCase):
                               'url_label': 'http://nohost/theobj'}
         self.assertEqual(self.convert(html), latex)
 
+    def test_resolveuid_links_are_resolved_in_one_query(self):
+        brains = []
+        for uid in ('UID1', 'UID2'):
+            brain = self.mock()
+            brain.UID = uid
+            brain.getURL.return_value = 'http://nohost/' + uid.lower()
+            brains.append(brain)
+
+        self.portal_catalog.unrestrictedSearchResults.return_value = brains
+
+        html = ('<a href="./resolveuid/UID1">One</a> '
+                '<a href="resolveuid/UID2">Two</a> '
+                '<ul><li><a href="./resolveuid/UID1">One</a></li></ul>')
+        latex = self.convert(html)
+
+        self.assertIn(r'\href{http://nohost/uid1}{One', latex)
+        self.assertIn(r'\href{http://nohost/uid2}{Two', latex)
+        self.assertEqual(
+            [call(UID=['UID1', 'UID2'])],
+            self.portal_catalog.unrestrictedSearchResults.call_args_list)
+
+    def test_context_url_is_computed_once(self):
+        self.convert('<a href="foo">foo</a> <a href="bar">bar</a>')
+        self.convert('<a href="baz">baz</a>')
+        self.assertEqual(1, self.context.absolute_url.call_count)
+
     def test_links_in_listing_items(self):
         # There should not be a non-escaped ampersand (&) within listing
         # items - even when in a href.
@@ -0,0 +1,68 @@
+from ftw.pdfgenerator.html2latex import links
+from ftw.pdfgenerator.html2latex.links import LinkResolver
+from ftw.testing import MockTestCase
+from mock import call
+from mock import patch
+
+
+class TestLinkResolver(MockTestCase):
+
+    def setUp(self):
+        super(TestLinkResolver, self).setUp()
+        self.context = self.mock()
+        self.portal_catalog = self.mock()
+        self.mock_tool(self.portal_catalog, 'portal_catalog')
+        self.resolver = LinkResolver(self.context)
+
+    def mock_brains(self, *uids):
+        brains = []
+        for uid in uids:
+            brain = self.mock()
+            brain.UID = uid
+            brain.getURL.return_value = 'http://nohost/' + uid
+            brains.append(brain)
+        self.portal_catalog.unrestrictedSearchResults.return_value = brains
+
+    def test_prefetch_finds_resolveuid_links(self):
+        self.mock_brains('a', 'b')
+        self.resolver.prefetch(
+            '<a href="./resolveuid/a">A</a> <a href="resolveUid/b">B</a> '
+            '<a href="http://host/resolveuid/a">A</a> '
+            '<a href="./noresolveuid/c">C</a>')
+
+        self.assertEqual(
+            [call(UID=['a', 'b'])],
+            self.portal_catalog.unrestrictedSearchResults.call_args_list)
+        self.assertEqual('http://nohost/a', self.resolver.get_url('a'))
+        self.assertEqual('http://nohost/b', self.resolver.get_url('b'))
+        self.assertEqual(1, self.resolver.queries)
+
+    def test_known_uids_are_not_queried_again(self):
+        self.mock_brains('a')
+        self.resolver.get_url('a')
+        self.resolver.prefetch('<a href="./resolveuid/a">A</a>')
+        self.resolver.get_url('a')
+        self.assertEqual(1, self.resolver.queries)
+
+    def test_missing_objects_are_cached(self):
+        self.mock_brains('a')
+        self.resolver.resolve_uids(['a', 'b'])
+        self.assertEqual(None, self.resolver.get_url('b'))
+        self.assertEqual(1, self.resolver.queries)
+
+    def test_uids_are_queried_in_batches(self):
+        self.mock_brains()
+        with patch.object(links, 'UID_BATCH_SIZE', 2):
+            self.resolver.resolve_uids(['e', 'd', 'c', 'b', 'a'])
+
+        self.assertEqual(
+            [call(UID=['a', 'b']), call(UID=['c', 'd']), call(UID='e')],
+            self.portal_catalog.unrestrictedSearchResults.call_args_list)
+
+    def test_context_url_is_cached(self):
+        self.context.absolute_url.return_value = 'http://nohost/plone'
+        self.assertEqual('http://nohost/plone',
+                         self.resolver.get_context_url())
+        self.assertEqual('http://nohost/plone',
+                         self.resolver.get_context_url())
+        self.assertEqual(1, self.context.absolute_url.call_count)
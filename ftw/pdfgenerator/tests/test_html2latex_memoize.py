@@ -0,0 +1,146 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex import subconverter
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
+from ftw.pdfgenerator.html2latex.memoize import ConversionCache
+from ftw.pdfgenerator.html2latex.memoize import make_key
+from ftw.pdfgenerator.html2latex.program import PatternProgram
+from ftw.testing import MockTestCase
+from mock import call
+from unittest import TestCase
+
+
+MODE_REPLACE = interfaces.HTML2LATEX_MODE_REPLACE
+
+LINK = '<a href="http://www.4teamwork.ch/">4teamwork</a>'
+
+
+class TestConversionCache(TestCase):
+
+    def test_least_recently_used_entries_are_removed(self):
+        cache = ConversionCache(2)
+        cache.set('a', 'A', [])
+        cache.set('b', 'B', [])
+        self.assertEqual(cache.get('a'), ('A', ()))
+
+        cache.set('c', 'C', [])
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), ('A', ()))
+        self.assertEqual(cache.get('c'), ('C', ()))
+
+    def test_stats(self):
+        cache = ConversionCache(10)
+        cache.set('a', 'A', [])
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+
+        self.assertEqual(cache.get_stats(),
+                         {'size': 10, 'entries': 1, 'hits': 2, 'misses': 1})
+
+
+class TestMakeKey(TestCase):
+
+    def setUp(self):
+        self.program = PatternProgram([(MODE_REPLACE, 'a', 'b')])
+
+    def test_unicode_and_utf8_have_the_same_key(self):
+        self.assertEqual(make_key(u'\xe4', True, self.program),
+                         make_key('\xc3\xa4', True, self.program))
+
+    def test_arguments_are_part_of_the_key(self):
+        key = make_key('foo', True, self.program)
+        self.assertNotEqual(key, make_key('bar', True, self.program))
+        self.assertNotEqual(key, make_key('foo', False, self.program))
+        self.assertNotEqual(key, make_key('foo', True, self.program,
+                                          plain=True))
+        self.assertNotEqual(key, make_key(
+                'foo', True, PatternProgram([(MODE_REPLACE, 'a', 'c')])))
+        self.assertNotEqual(key, make_key(
+                'foo', True, self.program,
+                custom_patterns=[[MODE_REPLACE, 'x', 'y']]))
+
+    def test_unhashable_patterns_are_not_cached(self):
+        self.assertEqual(make_key('foo', True, self.program,
+                                  custom_patterns=[(MODE_REPLACE, {}, 'y')]),
+                         None)
+
+
+class TestMemoizedConversion(MockTestCase):
+
+    def setUp(self):
+        super(TestMemoizedConversion, self).setUp()
+        self.layout = self.mock()
+        self.converter = HTML2LatexConverter(
+            context=self.mock(), request=object(), layout=self.layout)
+        self.converter.convert_cache = ConversionCache(100)
+
+    def test_cache_is_disabled_by_default(self):
+        converter = HTML2LatexConverter(
+            context=object(), request=object(), layout=object())
+        self.assertEqual(converter.convert_cache, None)
+
+    def test_cache_size_is_configurable(self):
+        config = self.mock()
+        config.convert_cache_size = 50
+        config.html_parser = None
+        self.mock_utility(config, interfaces.IConfig)
+
+        converter = HTML2LatexConverter(
+            context=object(), request=object(), layout=object())
+        self.assertEqual(converter.convert_cache.size, 50)
+
+    def test_conversions_are_cached(self):
+        latex = self.converter.convert('<b>foo</b>')
+        self.assertEqual(self.converter.convert('<b>foo</b>'), latex)
+        self.assertEqual(self.converter.convert_cache.get_stats()['hits'], 1)
+
+    def test_layout_calls_are_replayed(self):
+        latex = self.converter.convert(LINK)
+        calls = self.layout.method_calls
+        self.assertIn(call.use_package('hyperref'), calls)
+        self.layout.reset_mock()
+
+        self.assertEqual(self.converter.convert(LINK), latex)
+        self.assertEqual(self.layout.method_calls, calls)
+
+    def test_layout_is_restored_after_converting(self):
+        self.converter.convert(LINK)
+        self.assertIs(self.converter.layout, self.layout)
+
+    def test_nested_conversions_are_cached(self):
+        html = '<table><tr><td>%s</td><td>%s</td></tr></table>' % (
+            LINK, LINK)
+        self.converter.convert(html)
+
+        # The cells are converted by nested runners.
+        stats = self.converter.convert_cache.get_stats()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertEqual(self.layout.use_package.call_args_list.count(
+                call('hyperref')), 2)
+
+    def test_custom_patterns_are_respected(self):
+        self.assertEqual(self.converter.convert('foo'), 'foo')
+        self.assertEqual(
+            self.converter.convert(
+                'foo', custom_patterns=[(MODE_REPLACE, 'foo', 'bar')]),
+            'bar')
+
+    def test_convert_plain_is_cached(self):
+        self.assertEqual(self.converter.convert_plain('a & b'), 'a \\& b')
+        self.assertEqual(self.converter.convert_plain('a & b'), 'a \\& b')
+        self.assertEqual(self.converter.convert_cache.get_stats()['hits'], 1)
+
+    def test_conversions_using_the_layout_otherwise_are_not_cached(self):
+        class BuilderConverter(subconverter.SubConverter):
+            pattern = r'<img />'
+
+            def __call__(self):
+                self.get_layout().get_builder()
+                self.replace_and_lock('IMAGE')
+
+        self.converter.register_subconverters([BuilderConverter])
+        self.assertEqual(self.converter.convert('<img />'), 'IMAGE')
+        self.assertEqual(self.converter.convert('<img />'), 'IMAGE')
+        self.assertEqual(self.layout.get_builder.call_count, 2)
+        self.assertEqual(self.converter.convert_cache.get_stats()['entries'],
+                         0)
@@ -0,0 +1,102 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.benchmark.corpus import get_corpus
+from ftw.pdfgenerator.benchmark.runner import StubContext
+from ftw.pdfgenerator.benchmark.runner import StubLayout
+from ftw.pdfgenerator.html2latex import parser
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
+from ftw.testing import MockTestCase
+from unittest import TestCase
+from unittest import skipUnless
+
+
+class TestGetParser(MockTestCase):
+
+    def test_available_parsers(self):
+        names = parser.get_available_parsers()
+        self.assertIn('beautifulsoup', names)
+        self.assertEqual(parser.LXML_AVAILABLE, 'lxml' in names)
+
+    def test_beautifulsoup_is_default(self):
+        self.assertEqual('beautifulsoup', parser.get_parser().name)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError) as cm:
+            parser.get_parser('foo')
+
+        self.assertEqual('The HTML parser "foo" is not available.',
+                         str(cm.exception))
+
+    def test_parser_is_configurable(self):
+        config = self.mock()
+        config.convert_cache_size = None
+        config.html_parser = 'beautifulsoup'
+        self.mock_utility(config, interfaces.IConfig)
+
+        converter = HTML2LatexConverter(
+            context=object(), request=object(), layout=object())
+        self.assertEqual('beautifulsoup', converter.html_parser.name)
+
+
+class ParserTests(object):
+    """Tests run with each parser backend.
+    """
+
+    parser_name = None
+
+    def setUp(self):
+        super(ParserTests, self).setUp()
+        self.parser = parser.get_parser(self.parser_name)
+
+    def test_parse_cleans_up_html(self):
+        dom = self.parser.parse(
+            '<table class="x"><tr><td>a &amp; b<br>c</td>'
+            '<td>\xc3\xa4 &auml;</td></tr></table>')
+
+        cells = dom.getElementsByTagName('td')
+        self.assertEqual(['table'], [node.tagName for node
+                                     in dom.getElementsByTagName('table')])
+        self.assertEqual('x', dom.getElementsByTagName('table')[0]
+                         .getAttribute('class'))
+        self.assertEqual(u'a &amp; b<br/>c',
+                         u''.join(node.toxml() for node
+                                  in cells[0].childNodes))
+        self.assertEqual(u'\xe4 \xe4', cells[1].firstChild.data)
+
+    def test_parse_fragment(self):
+        nodes = self.parser.parse_fragment('foo <ul><li>bar</li></ul>')
+        self.assertEqual(u'foo <ul><li>bar</li></ul>',
+                         u''.join(node.toxml() for node in nodes))
+
+    def test_parse_fragment_cleans_up_broken_html(self):
+        nodes = self.parser.parse_fragment('<ul><li>foo<br></li></ul>')
+        self.assertEqual(['ul'], [node.tagName for node in nodes])
+        self.assertEqual(u'foo', nodes[0].getElementsByTagName('li')[0]
+                         .firstChild.data)
+
+
+class TestBeautifulSoupParser(ParserTests, TestCase):
+
+    parser_name = 'beautifulsoup'
+
+
+@skipUnless(parser.LXML_AVAILABLE, 'lxml is not installed')
+class TestLxmlParser(ParserTests, TestCase):
+
+    parser_name = 'lxml'
+
+
+@skipUnless(parser.LXML_AVAILABLE, 'lxml is not installed')
+class TestParsersConvertEqually(TestCase):
+
+    def convert(self, html, parser_name):
+        converter = HTML2LatexConverter(
+            context=StubContext(), request=None, layout=StubLayout())
+        converter.html_parser = parser.get_parser(parser_name)
+        return converter.convert(html)
+
+    def test_benchmark_corpora_are_converted_equally(self):
+        for name, html in get_corpus(['table', 'lists']).items():
+            self.assertEqual(self.convert(html, 'beautifulsoup'),
+                             self.convert(html, 'lxml'),
+                             'The parsers convert the %s corpus differently.'
+                             % name)
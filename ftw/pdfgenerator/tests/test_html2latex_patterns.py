@@ -114,6 +114,11 @@ class TestBasicPatterns(TestCase):
         self.assertEqual(self.convert('foo &quot;<b>bar</b>&quot; baz'),
                          'foo "`\\textbf{bar}"\' baz')
 
+    def test_quoted_urls(self):
+        self.assertEqual(
+            self.convert('See "http://www.x.ch" and "mailto:a@b.ch"'),
+            'See "`http://www.x.ch"\' and "`mailto:a@b.ch"\'')
+
     def test_quotation_marks3(self):
         self.assertEqual(self.convert('foo <b>&quot;bar&quot;</b> baz'),
                          'foo \\textbf{"`bar"\'} baz')
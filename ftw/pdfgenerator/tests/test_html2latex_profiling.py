@@ -0,0 +1,88 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
+from ftw.pdfgenerator.html2latex.profiling import ConversionProfile
+from ftw.pdfgenerator.html2latex.subconverters import listing
+from ftw.testing import MockTestCase
+from unittest import TestCase
+
+
+MODE_REPLACE = interfaces.HTML2LATEX_MODE_REPLACE
+MODE_REGEXP = interfaces.HTML2LATEX_MODE_REGEXP
+
+LIST_CONVERTER = 'ftw.pdfgenerator.html2latex.subconverters.listing.' \
+    'ListConverter'
+
+
+class TestConversionProfile(TestCase):
+
+    def test_runs_are_aggregated(self):
+        profile = ConversionProfile()
+        profile.record(MODE_REPLACE, 'a', 'b', 0.5, 2, 10, 10)
+        profile.record(MODE_REPLACE, 'a', 'b', 0.25, 1, 5, 5)
+
+        self.assertEqual(profile.get_report(),
+                         {'a': {'pattern': 'a',
+                                'kind': 'replace',
+                                'time': 0.75,
+                                'calls': 2,
+                                'matches': 3,
+                                'bytes_in': 15,
+                                'bytes_out': 15}})
+
+    def test_subconverters_are_labeled_with_their_class(self):
+        profile = ConversionProfile()
+        profile.record(interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION,
+                       listing.ListConverter.pattern, listing.ListConverter,
+                       0.1, 1, 10, 5)
+
+        self.assertEqual(profile.get_report()[LIST_CONVERTER]['kind'],
+                         'subconverter')
+
+    def test_rows_are_sorted_by_time(self):
+        profile = ConversionProfile()
+        profile.record(MODE_REPLACE, 'fast', '', 0.1, 0, 0, 0)
+        profile.record(MODE_REPLACE, 'slow', '', 0.3, 0, 0, 0)
+
+        self.assertEqual([row['pattern'] for row in profile.get_rows()],
+                         ['slow', 'fast'])
+
+
+class TestProfiledConversion(MockTestCase):
+
+    def setUp(self):
+        super(TestProfiledConversion, self).setUp()
+        self.converter = HTML2LatexConverter(
+            context=self.mock(), request=object(), layout=self.mock())
+
+    def test_profiling_is_disabled_by_default(self):
+        self.assertEqual(self.converter.profile, None)
+
+    def test_patterns_are_profiled(self):
+        profile = self.converter.start_profiling()
+        self.assertEqual(
+            self.converter.convert(
+                'foo foo', custom_patterns=[(MODE_REGEXP, 'fo+', 'bar')]),
+            'bar bar')
+
+        entry = profile.get_report()['fo+']
+        self.assertEqual(entry['kind'], 'regexp')
+        self.assertEqual(entry['calls'], 1)
+        self.assertEqual(entry['matches'], 2)
+        self.assertEqual(entry['bytes_in'], 7)
+        self.assertEqual(entry['bytes_out'], 7)
+
+    def test_replacements_count_matches(self):
+        self.converter.patterns = [(MODE_REPLACE, '-', '+')]
+        profile = self.converter.start_profiling()
+        self.assertEqual(self.converter.convert('a-a-a'), 'a+a+a')
+
+        self.assertEqual(profile.get_report()['-']['matches'], 2)
+
+    def test_nested_runners_are_aggregated(self):
+        profile = self.converter.start_profiling()
+        self.converter.convert('<ul><li><i>a</i></li><li>b</li></ul>')
+
+        report = profile.get_report()
+        self.assertEqual(report[LIST_CONVERTER]['matches'], 1)
+        # The top level runner and the runners of both list items.
+        self.assertEqual(report[r'^\s*(.*?)\s*$']['calls'], 3)
@@ -0,0 +1,309 @@
+from ftw.pdfgenerator import interfaces
+from ftw.pdfgenerator.html2latex import converter
+from ftw.pdfgenerator.html2latex import subconverter
+from ftw.pdfgenerator.html2latex.patterns import DEFAULT_PATTERNS
+from ftw.pdfgenerator.html2latex.program import MODE_REPLACE_MANY
+from ftw.pdfgenerator.html2latex.program import PatternProgram
+from ftw.pdfgenerator.html2latex.program import compile_expression
+from ftw.pdfgenerator.html2latex.program import get_shared_program
+from ftw.pdfgenerator.html2latex.program import is_plain_text
+from ftw.pdfgenerator.html2latex.program import literals_overlap
+from ftw.pdfgenerator.html2latex.program import merge_replacements
+from ftw.pdfgenerator.html2latex.program import required_literals
+from ftw.pdfgenerator.html2latex.subconverters import listing
+from unittest import TestCase
+import re
+
+
+MODE_REPLACE = interfaces.HTML2LATEX_MODE_REPLACE
+MODE_REGEXP = interfaces.HTML2LATEX_MODE_REGEXP
+MODE_REGEXP_FUNCTION = interfaces.HTML2LATEX_MODE_REGEXP_FUNCTION
+REPEAT_MODIFIER = interfaces.HTML2LATEX_REPEAT_MODIFIER
+DEFAULT_PLACEHOLDER = interfaces.HTML2LATEX_CUSTOM_PATTERN_PLACEHOLDER
+
+
+class TestPatternProgram(TestCase):
+
+    def test_compiles_patterns_to_steps(self):
+        program = PatternProgram([
+                (MODE_REPLACE, '{', '\\{'),
+                DEFAULT_PLACEHOLDER,
+                (MODE_REPLACE, '{', '\\{'),
+                (MODE_REGEXP, r'<b>(.*?)</b>', r'\1'),
+                (MODE_REGEXP, r'\s\s', ' ', (REPEAT_MODIFIER,))])
+
+        self.assertEqual(
+            [(MODE_REPLACE, '{', '\\{', False),
+             (MODE_REPLACE, '{', '\\{', False),
+             (MODE_REGEXP, r'<b>(.*?)</b>', r'\1', False),
+             (MODE_REGEXP, r'\s\s', ' ', True)],
+            [(mode, getattr(search, 'pattern', search), replace, repeat)
+             for mode, search, replace, repeat in program.steps])
+
+        self.assertEqual(re.DOTALL, program.steps[2][1].flags & re.DOTALL)
+
+    def test_merges_literal_replacements(self):
+        program = PatternProgram([
+                (MODE_REPLACE, '{', '\\{'),
+                (MODE_REPLACE, '}', '\\}'),
+                (MODE_REGEXP, r'\s\s', ' ', (REPEAT_MODIFIER,)),
+                (MODE_REPLACE, '%', '\\%')])
+
+        self.assertEqual([MODE_REPLACE_MANY, MODE_REGEXP, MODE_REPLACE],
+                         [step[0] for step in program.steps])
+
+    def test_expressions_are_shared(self):
+        self.assertIs(compile_expression(r'<p>(.*?)</p>'),
+                      compile_expression(r'<p>(.*?)</p>'))
+
+    def test_compiled_from(self):
+        pattern = (MODE_REPLACE, '{', '\\{')
+        program = PatternProgram([pattern])
+
+        self.assertTrue(program.compiled_from([pattern]))
+        self.assertFalse(program.compiled_from([(MODE_REPLACE, '{', '\\{')]))
+        self.assertFalse(program.compiled_from([pattern, pattern]))
+
+
+class TestMergeReplacements(TestCase):
+
+    def apply(self, steps, text):
+        for mode, search, replace, _repeat in steps:
+            if mode == MODE_REPLACE_MANY:
+                text = search.sub(replace, text)
+            else:
+                text = text.replace(search, replace)
+        return text
+
+    def test_literals_overlap(self):
+        self.assertTrue(literals_overlap('&amp;', 'amp'))
+        self.assertTrue(literals_overlap('amp', '&amp;'))
+        self.assertTrue(literals_overlap('&', '&lt;'))
+        self.assertTrue(literals_overlap('e.g.', 'g. z'))
+        self.assertTrue(literals_overlap('g. z', 'e.g.'))
+        self.assertFalse(literals_overlap('&auml;', '&ouml;'))
+        self.assertFalse(literals_overlap('\\"a', '&auml;'))
+
+    def test_independent_replacements_are_merged(self):
+        steps = merge_replacements([('&auml;', '\\"a'),
+                                    ('&ouml;', '\\"o'),
+                                    ('%', '\\%')])
+        self.assertEqual([MODE_REPLACE_MANY], [step[0] for step in steps])
+        self.assertEqual('\\"a\\"o 5\\%',
+                         self.apply(steps, '&auml;&ouml; 5%'))
+
+    def test_replacement_producing_a_later_search_term_is_not_merged(self):
+        steps = merge_replacements([('&amp;', '&'),
+                                    ('&lt;', '<')])
+        self.assertEqual([MODE_REPLACE, MODE_REPLACE],
+                         [step[0] for step in steps])
+        self.assertEqual('<', self.apply(steps, '&amp;lt;'))
+
+    def test_overlapping_search_terms_are_not_merged(self):
+        steps = merge_replacements([('e.g.', 'e.\\,g.'),
+                                    ('g. z', 'X')])
+        self.assertEqual(2, len(steps))
+
+    def test_removals_joining_search_terms_are_not_merged(self):
+        steps = merge_replacements([('|', ''), ('ab', 'X'), ('c', 'Y')])
+        self.assertEqual([MODE_REPLACE, MODE_REPLACE_MANY],
+                         [step[0] for step in steps])
+        self.assertEqual('XY', self.apply(steps, 'a|bc'))
+
+    def test_default_replacements_keep_the_results(self):
+        replacements = [(pattern[1], pattern[2])
+                        for pattern in DEFAULT_PATTERNS
+                        if pattern not in converter.PLACEHOLDERS and
+                        pattern[0] == MODE_REPLACE]
+        steps = merge_replacements(replacements)
+        self.assertLess(len(steps), len(replacements) / 2)
+
+        text = ' '.join(search + search[::-1] + replace
+                        for search, replace in replacements)
+        text += '&amp;lt; &amp;amp; e. g. z. B. &&gt;'
+
+        expected = text
+        for search, replace in replacements:
+            expected = expected.replace(search, replace)
+
+        self.assertEqual(expected, self.apply(steps, text))
+
+
+class TestProgramSharing(TestCase):
+
+    def setUp(self):
+        super(TestProgramSharing, self).setUp()
+        self.converter = converter.HTML2LatexConverter(
+            object(), object(), object())
+
+    def test_program_is_only_compiled_once(self):
+        self.assertIs(self.converter.get_program(),
+                      self.converter.get_program())
+
+    def test_program_is_recompiled_when_patterns_change(self):
+        program = self.converter.get_program()
+        self.converter.register_patterns([(MODE_REPLACE, 'foo', 'bar')])
+        self.assertIsNot(program, self.converter.get_program())
+        self.assertEqual('bar', self.converter.convert('foo'))
+
+    def test_nested_runners_share_the_program(self):
+        programs = []
+
+        class Nested(subconverter.SubConverter):
+            pattern = r'<span>(.*?)</span>'
+
+            def __call__(self):
+                programs.append(self.converter.get_program())
+                self.replace_and_lock(
+                    self.converter.convert(self.match.group(1)))
+
+        self.converter.register_subconverters([Nested])
+        self.assertEqual(
+            'a \\& b', self.converter.convert('<span>a &amp; b</span>'))
+        self.assertEqual([self.converter.get_program()], programs)
+
+    def test_custom_patterns_do_not_change_the_converter(self):
+        patterns = list(self.converter.patterns)
+        program = self.converter.get_program()
+
+        self.assertEqual('bar', self.converter.convert(
+                'foo', custom_patterns=[(MODE_REPLACE, 'foo', 'bar')]))
+        self.assertEqual(patterns, self.converter.patterns)
+        self.assertIs(program, self.converter.get_program())
+
+
+    def test_equal_patterns_share_the_program(self):
+        patterns = [(MODE_REPLACE, 'foo', 'bar'),
+                    [MODE_REGEXP, r'<b>(.*?)</b>', r'\1']]
+        self.assertIs(get_shared_program(patterns),
+                      get_shared_program([tuple(pattern)
+                                          for pattern in patterns]))
+
+    def test_registered_patterns_share_the_derived_program(self):
+        other = converter.HTML2LatexConverter(object(), object(), object())
+        for conv in (self.converter, other):
+            conv.register_patterns([(MODE_REPLACE, 'foo', 'bar')])
+
+        self.assertIs(self.converter.get_program(), other.get_program())
+        self.assertEqual('bar', other.convert('foo'))
+
+
+class TestPlainText(TestCase):
+
+    def setUp(self):
+        super(TestPlainText, self).setUp()
+        self.converter = converter.HTML2LatexConverter(
+            object(), object(), object())
+
+    def test_is_plain_text(self):
+        self.assertTrue(is_plain_text('Foo bar, baz (42)!'))
+        self.assertTrue(is_plain_text(''))
+        self.assertFalse(is_plain_text('Foo & bar'))
+        self.assertFalse(is_plain_text('Foo\nbar'))
+        self.assertFalse(is_plain_text('<b>Foo</b>'))
+
+    def test_plain_text_steps(self):
+        program = PatternProgram([
+                (MODE_REGEXP, r'<b>(.*?)</b>', r'\1'),
+                (MODE_REPLACE, 'World', 'Moon'),
+                (MODE_REGEXP, r'&amp;', '&'),
+                (MODE_REGEXP, r'\s\s', ' ')])
+        self.assertEqual((1, 3), program.get_plain_text_steps())
+
+    def test_plain_text_is_converted_by_the_plain_text_steps(self):
+        self.converter.register_patterns([(MODE_REPLACE, 'World', 'Moon'),
+                                          (MODE_REGEXP, r'  +', ' ')])
+        self.assertEqual('Hello Moon', self.converter.convert('Hello   World'))
+
+    def test_plain_text_steps_producing_markup(self):
+        # Once a step produced text which is not plain, all following steps
+        # are run.
+        self.converter.register_patterns([(MODE_REPLACE, 'foo', '<b>&</b>')])
+        self.assertEqual('\\textbf{\\&}', self.converter.convert('foo'))
+
+
+class TestRequiredLiterals(TestCase):
+
+    def test_literals_of_the_expression(self):
+        self.assertEqual(('class="glossar">', '</h5>', '<h5'),
+                         required_literals(r'<h5.*?class="glossar">(.*?)</h5>'))
+
+    def test_groups_are_part_of_the_sequence(self):
+        self.assertEqual(('<span class="footnote">', ),
+                         required_literals(r'<span (class="(footnote)")>'))
+
+    def test_alternatives_and_repetitions_are_not_required(self):
+        self.assertEqual(('http', '://'),
+                         required_literals(r'http[s]?://(a|b)+'))
+        self.assertEqual((), required_literals(r'(foo|bar)'))
+
+    def test_case_insensitive_expressions_have_no_literals(self):
+        self.assertEqual((), required_literals(r'(?i)<table'))
+
+    def test_longest_literals_are_used(self):
+        self.assertEqual(('dddd', 'ccc', 'bb'),
+                         required_literals(r'a.bb.ccc.dddd'))
+
+
+class TestLiteralPrefilter(TestCase):
+
+    def setUp(self):
+        super(TestLiteralPrefilter, self).setUp()
+        self.converter = converter.HTML2LatexConverter(
+            object(), object(), object())
+
+    def get_stats(self, pattern):
+        for stats in self.converter.get_program().get_skip_stats():
+            if stats['pattern'] == pattern:
+                return stats
+        return None
+
+    def test_steps_are_skipped_without_literals(self):
+        program = PatternProgram([(MODE_REGEXP, r'<b>(.*?)</b>', r'\1')])
+        self.assertFalse(program.may_match(0, 'foo </b>'))
+        self.assertTrue(program.may_match(0, '<b>foo</b>'))
+        self.assertEqual([{'pattern': r'<b>(.*?)</b>',
+                           'mode': MODE_REGEXP,
+                           'literals': (('</b>', ), ('<b>', )),
+                           'checked': 2,
+                           'skipped': 1}],
+                         program.get_skip_stats())
+
+    def test_replacements_are_not_checked(self):
+        program = PatternProgram([(MODE_REPLACE, 'foo', 'bar')])
+        self.assertTrue(program.may_match(0, 'baz'))
+        self.assertEqual([], program.get_skip_stats())
+
+    def test_skipped_subconverters_are_not_called(self):
+        # The program of the default patterns is shared with other
+        # converters, which count too.
+        before = self.get_stats(r'<table(.*?)>(.*?)</table>')
+        self.assertEqual('foo: bar', self.converter.convert('foo: bar'))
+
+        stats = self.get_stats(r'<table(.*?)>(.*?)</table>')
+        self.assertEqual(1, stats['checked'] - before['checked'])
+        self.assertEqual(1, stats['skipped'] - before['skipped'])
+
+    def test_trigger_literals_of_subconverters(self):
+        before = self.get_stats(listing.ListConverter.pattern)
+        self.assertEqual((('<ul', '<ol', '<dl'), ), before['literals'])
+
+        # The item is converted by a nested runner, which skips the list
+        # converter.
+        self.converter.convert('<ol><li>foo: bar</li></ol>')
+        stats = self.get_stats(listing.ListConverter.pattern)
+        self.assertEqual(2, stats['checked'] - before['checked'])
+        self.assertEqual(1, stats['skipped'] - before['skipped'])
+
+    def test_custom_subconverter_with_trigger_literals(self):
+        class Foo(subconverter.SubConverter):
+            pattern = r'[a-z]+'
+            trigger_literals = ('foo', 'bar')
+
+            def __call__(self):
+                self.replace_and_lock('X')
+
+        self.converter.register_subconverters([Foo])
+        self.assertEqual('BAZ', self.converter.convert('BAZ'))
+        self.assertEqual('X X', self.converter.convert('bar baz'))
+        self.assertEqual(1, self.get_stats(r'[a-z]+')['skipped'])
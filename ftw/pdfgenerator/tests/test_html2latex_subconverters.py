@@ -2,6 +2,7 @@ from ftw.pdfgenerator.html2latex.converter import HTML2LatexConverter
 from ftw.pdfgenerator.html2latex.subconverter import SubConverter
 from ftw.pdfgenerator.interfaces import ISubConverter
 from ftw.testing import MockTestCase
+from xml.dom import minidom
 from zope.interface.verify import verifyClass
 import re
 
@@ -36,6 +37,34 @@ class TestBaseSubConverter(MockTestCase):
         obj = SubConverter(object(), match, html)
         self.assertEqual(obj.get_html(), 'three')
 
+    def test_serialize_nodes_registers_elements(self):
+        runner = self.mock()
+        runner.parsed_nodes = {}
+        dom = minidom.parseString('<p><b>f\xc3\xbc</b> bar</p>')
+        nodes = dom.documentElement.childNodes
+
+        obj = SubConverter(runner, None, '')
+        self.assertEqual(u'<b>f\xfc</b> bar', obj.serialize_nodes(nodes))
+        self.assertEqual({'<b>f\xc3\xbc</b>': nodes[0]}, runner.parsed_nodes)
+
+    def test_get_parsed_node(self):
+        html = 'one <b>three</b> five'
+        match = re.search('<b>.*</b>', html)
+        node = object()
+        runner = self.mock()
+
+        runner.parsed_nodes = {'<b>three</b>': node}
+        self.assertEqual(node, SubConverter(runner, match, html)
+                         .get_parsed_node())
+
+        runner.parsed_nodes = {'<b>four</b>': node}
+        self.assertEqual(None, SubConverter(runner, match, html)
+                         .get_parsed_node())
+
+        # Runners without parsed nodes.
+        self.assertEqual(None, SubConverter(object(), match, html)
+                         .get_parsed_node())
+
     def test_replace_and_lock_passed_to_converter(self):
         html = 'one three five'
         match = re.search('t[\w]*', html)
@@ -3,7 +3,9 @@ from ftw.pdfgenerator.html2latex.subconverters import table
 from ftw.pdfgenerator.testing import ZCML_WITH_SITE_LAYER
 from ftw.testing import MockTestCase
 from mock import call
+from mock import patch
 from unittest import TestCase
+from xml.dom import minidom
 
 
 class TestTableConverter(MockTestCase):
@@ -536,6 +538,16 @@ class TestTableConverter(MockTestCase):
 
         self.assertMultiLineEqual(self.convert(html), latex)
 
+    def test_list_in_cell_is_not_parsed_again(self):
+        html = r'<table><tr><td><ul><li>foo</li></ul></td></tr></table>'
+
+        with patch('xml.dom.minidom.parseString',
+                   wraps=minidom.parseString) as parse:
+            latex = self.convert(html)
+
+        self.assertIn('\\item foo', latex)
+        self.assertEqual(1, parse.call_count)
+
     def test_convert_other_html(self):
         # HTML around the Table should be converted as well
 
@@ -1151,6 +1163,54 @@ class TestTableConverter(MockTestCase):
 
         self.assertMultiLineEqual(self.convert(html), latex)
 
+    def test_border_of_neighbours_with_rowspan(self):
+        html = '\n'.join((
+                r'<table class="no-page-break">',
+                r' <colgroup>',
+                r'  <col width="25%" />'
+                r'  <col width="25%" />'
+                r'  <col width="50%" />'
+                r' </colgroup>',
+                r' <tbody>',
+                r'  <tr>',
+                r'   <td rowspan="2">1/2 A</td>',
+                r'   <td rowspan="3">1/3 B</td>',
+                r'   <td>1C</td>',
+                r'  </tr>',
+                r'  <tr>',
+                r'   <td>2C</td>',
+                r'  </tr>',
+                r'  <tr>',
+                r'   <td>3A</td>',
+                r'   <td>3C</td>',
+                r'  </tr>',
+                r' </tbody>',
+                r'</table>'))
+
+        latex = '\n'.join((
+                r'\makeatletter\@ifundefined{tablewidth}{\newlength\tablewidth}\makeatother',
+                r'\setlength\tablewidth\linewidth',
+                r'\addtolength\tablewidth{-6\tabcolsep}',
+                r'\renewcommand{\arraystretch}{1.4}',
+                r'\begin{tabular}{p{0.25\tablewidth}p{0.25\tablewidth}' + \
+                    r'p{0.5\tablewidth}}',
+
+                r'\multirow{2}{0.25\tablewidth}{1/2 A} & ' + \
+                    r'\multirow{3}{0.25\tablewidth}{1/3 B} & ' + \
+                    r'\multicolumn{1}{p{0.5\tablewidth}}{1C} \\',
+
+                r' &  & \multicolumn{1}{p{0.5\tablewidth}}{2C} \\',
+
+                r'\multicolumn{1}{p{0.25\tablewidth}}{3A} &  & ' + \
+                    r'\multicolumn{1}{p{0.5\tablewidth}}{3C} \\',
+
+                r'\end{tabular}',
+                r'\smallbreak',
+                r''
+                ))
+
+        self.assertMultiLineEqual(self.convert(html), latex)
+
     def test_listing_css_class(self):
         html = '\n'.join((
                 r'<table class="no-page-break listing">',
@@ -1779,3 +1839,16 @@ class TestParseHTMLStyleAttribute(TestCase):
                 'width : 10 ; height : 5 ;'),
                          {'width': '10',
                           'height': '5'})
+
+
+class TestLookupIndex(TestCase):
+
+    def test_cached_index_is_used(self):
+        items = ['a', 'b', 'a']
+        self.assertEqual(2, table.lookup_index(items, items[2], 2))
+
+    def test_outdated_index_is_looked_up(self):
+        items = [object(), object()]
+        self.assertEqual(1, table.lookup_index(items, items[1], None))
+        self.assertEqual(1, table.lookup_index(items, items[1], 0))
+        self.assertEqual(0, table.lookup_index(items, items[0], 5))
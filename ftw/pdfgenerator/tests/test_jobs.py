@@ -0,0 +1,186 @@
+# pylint: disable=W0212
+# W0212: Access to a protected member of a client class
+
+from concurrent.futures import Future
+from ftw.pdfgenerator.assembler import PDFAssembler
+from ftw.pdfgenerator.builder import Builder
+from ftw.pdfgenerator.executor import completed_future
+from ftw.pdfgenerator.interfaces import IBuildJobRegistry
+from ftw.pdfgenerator.jobs import BuildJobQueue
+from ftw.pdfgenerator.jobs import FilesystemJobStore
+from ftw.pdfgenerator.testing import PDFGENERATOR_ZCML_LAYER
+from ftw.pdfgenerator.testing import PREDEFINED_BUILD_DIRECTORY_LAYER
+from ftw.testing import MockTestCase
+from mock import patch
+from unittest import TestCase
+from zope.component import getUtility
+from zope.interface.verify import verifyClass
+import os
+import shutil
+import tempfile
+import time
+
+
+class TestFilesystemJobStore(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp('test-jobs')
+        self.store = FilesystemJobStore(os.path.join(self.tempdir, 'jobs'),
+                                        max_age=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_create_and_get(self):
+        job_id = self.store.create(output='pdf', user='hugo')
+        status = self.store.get(job_id)
+
+        self.assertEqual(job_id, status['id'])
+        self.assertEqual('queued', status['state'])
+        self.assertEqual('pdf', status['output'])
+        self.assertEqual('hugo', status['user'])
+
+    def test_get_unknown_or_invalid_job(self):
+        self.assertEqual(None, self.store.get('a' * 32))
+        self.assertEqual(None, self.store.get('../../etc'))
+        self.assertEqual(None, self.store.get(None))
+
+    def test_update(self):
+        job_id = self.store.create()
+        self.store.update(job_id, state='running', stage='pdflatex',
+                          current=1, total=2)
+
+        status = self.store.get(job_id)
+        self.assertEqual(('running', 'pdflatex', 1, 2),
+                         (status['state'], status['stage'],
+                          status['current'], status['total']))
+
+    def test_result(self):
+        job_id = self.store.create()
+        self.assertEqual(None, self.store.get_result_path(job_id))
+
+        self.store.set_result(job_id, 'the pdf')
+        self.assertEqual('finished', self.store.get(job_id)['state'])
+        with open(self.store.get_result_path(job_id)) as file_:
+            self.assertEqual('the pdf', file_.read())
+
+    def test_expired_jobs_are_removed(self):
+        old_job = self.store.create()
+        self.store.update(old_job, created=time.time() - 120)
+        new_job = self.store.create()
+
+        self.assertEqual(None, self.store.get(old_job))
+        self.store.expire()
+        self.assertEqual([new_job], os.listdir(self.store.directory))
+
+
+class TestBuildJobQueue(MockTestCase):
+
+    layer = PDFGENERATOR_ZCML_LAYER
+
+    def setUp(self):
+        super(TestBuildJobQueue, self).setUp()
+        self.tempdir = tempfile.mkdtemp('test-jobs')
+        self.queue = BuildJobQueue(FilesystemJobStore(self.tempdir))
+
+    def tearDown(self):
+        super(TestBuildJobQueue, self).tearDown()
+        shutil.rmtree(self.tempdir)
+
+    def test_implements_interface(self):
+        verifyClass(IBuildJobRegistry, BuildJobQueue)
+
+    def test_utility_is_registered(self):
+        self.assertTrue(isinstance(getUtility(IBuildJobRegistry),
+                                   BuildJobQueue))
+
+    def test_submit_builds_zip_in_background(self):
+        assembler = self.mock()
+        assembler.build_zip_async.return_value = completed_future('the zip')
+
+        job_id = self.queue.submit(assembler, 'zip')
+        self.assertEqual('finished', self.queue.get_job(job_id)['state'])
+        self.assertEqual('zip', self.queue.get_job(job_id)['output'])
+
+    def test_failed_builds_are_reported(self):
+        future = Future()
+        assembler = self.mock()
+        assembler.build_pdf_async.return_value = future
+
+        job_id = self.queue.submit(assembler, 'pdf')
+        future.set_exception(ValueError('Build failed'))
+
+        job = self.queue.get_job(job_id)
+        self.assertEqual(('failed', 'Build failed'),
+                         (job['state'], job['error']))
+        self.assertEqual(None, self.queue.get_result_path(job_id))
+
+    def test_submit_reports_the_convert_stage_while_rendering(self):
+        progress = []
+
+        def build_pdf_async(**kwargs):
+            job = self.queue.get_job(os.listdir(self.tempdir)[0])
+            progress.append((job['state'], job['stage']))
+            return Future()
+
+        assembler = self.mock()
+        assembler.build_pdf_async.side_effect = build_pdf_async
+
+        job_id = self.queue.submit(assembler, 'pdf')
+        job = self.queue.get_job(job_id)
+        self.assertEqual([('running', 'convert')], progress)
+        self.assertEqual(('queued', 'queued'), (job['state'], job['stage']))
+
+    def test_register_future(self):
+        future = Future()
+        job_id = self.queue.register(future, output='pdf')
+        self.assertEqual('queued', self.queue.get_job(job_id)['state'])
+
+        future.set_result('the pdf')
+        self.assertEqual('finished', self.queue.get_job(job_id)['state'])
+
+
+class TestBuildJobQueueWithAssembler(MockTestCase):
+
+    layer = PREDEFINED_BUILD_DIRECTORY_LAYER
+
+    def setUp(self):
+        super(TestBuildJobQueueWithAssembler, self).setUp()
+        self.tempdir = tempfile.mkdtemp('test-jobs')
+        self.queue = BuildJobQueue(FilesystemJobStore(self.tempdir))
+
+    def tearDown(self):
+        super(TestBuildJobQueueWithAssembler, self).tearDown()
+        shutil.rmtree(self.tempdir)
+
+    def test_submit_reports_progress_of_the_build(self):
+        layout = self.mock()
+        layout.render_latex_for.return_value = 'content latex'
+        layout.render_latex.return_value = 'full latex'
+        assembler = PDFAssembler(object(), object())
+        progress = []
+
+        def execute(cmd):
+            job_id, = os.listdir(self.tempdir)
+            job = self.queue.get_job(job_id)
+            progress.append((job['state'], job['stage'], job['current']))
+
+            with open(cmd.split()[-1][:-len('.tex')] + '.pdf', 'w') as pdf:
+                pdf.write('the pdf')
+            return 0, '', ''
+
+        with patch.object(Builder, '_execute') as mocked_execute:
+            mocked_execute.side_effect = execute
+            job_id = self.queue.submit(assembler, 'pdf', filename='foo',
+                                       user_id='hugo', layout=layout)
+            for _i in range(100):
+                if self.queue.get_job(job_id)['state'] == 'finished':
+                    break
+                time.sleep(0.05)
+
+        job = self.queue.get_job(job_id)
+        self.assertEqual(('finished', 'hugo', 'foo'),
+                         (job['state'], job['user'], job['filename']))
+        self.assertEqual(('running', 'pdflatex', 1), progress[0])
+        with open(self.queue.get_result_path(job_id)) as file_:
+            self.assertEqual('the pdf', file_.read())
@@ -0,0 +1,95 @@
+from ftw.pdfgenerator.exceptions import BuildLimitExceeded
+from ftw.pdfgenerator.exceptions import PDFBuildFailed
+from ftw.pdfgenerator.limits import ResourceLimits
+from unittest import TestCase
+import subprocess
+import sys
+import time
+
+
+class TestResourceLimits(TestCase):
+
+    def start(self, limits, code):
+        return subprocess.Popen([sys.executable, '-c', code],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                **limits.get_popen_arguments())
+
+    def test_disabled_by_default(self):
+        limits = ResourceLimits()
+        self.assertFalse(limits.enabled)
+        self.assertEqual({}, limits.get_popen_arguments())
+
+    def test_communicate_without_limits(self):
+        limits = ResourceLimits()
+        proc = self.start(limits, 'import sys; '
+                          'sys.stdout.write(sys.stdin.read()); '
+                          'sys.exit(3)')
+        self.assertEqual((3, 'foo', ''), limits.communicate(proc, 'foo'))
+
+    def test_communicate_within_limits(self):
+        limits = ResourceLimits(timeout=30, cpu_time=30)
+        self.assertTrue(limits.enabled)
+        proc = self.start(limits, 'print "done"')
+        self.assertEqual((0, 'done\n', ''), limits.communicate(proc))
+
+    def test_process_is_killed_after_timeout(self):
+        limits = ResourceLimits(timeout=0.2)
+        proc = self.start(limits, 'import time; time.sleep(10)')
+
+        start = time.time()
+        with self.assertRaises(BuildLimitExceeded) as cm:
+            limits.communicate(proc)
+
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual('The TeX process was killed after 0.2 seconds.',
+                         str(cm.exception))
+        self.assertTrue(isinstance(cm.exception, PDFBuildFailed))
+
+    def test_process_group_is_killed_after_timeout(self):
+        limits = ResourceLimits(timeout=0.2)
+        proc = self.start(limits, (
+                'import subprocess, sys; '
+                'child = subprocess.Popen([sys.executable, "-c", '
+                '"import time; time.sleep(10)"]); '
+                'print child.pid; sys.stdout.flush(); '
+                'child.wait()'))
+
+        # communicate only returns when the child closed the inherited
+        # stdout too, which requires killing the whole process group.
+        start = time.time()
+        with self.assertRaises(BuildLimitExceeded):
+            limits.communicate(proc)
+        self.assertLess(time.time() - start, 5)
+
+    def test_process_exceeding_cpu_limit(self):
+        limits = ResourceLimits(cpu_time=1)
+        proc = self.start(limits, 'while True: pass')
+
+        with self.assertRaises(BuildLimitExceeded) as cm:
+            limits.communicate(proc)
+
+        self.assertEqual(
+            'The TeX process exceeded the CPU time limit of 1 seconds.',
+            str(cm.exception))
+
+    def test_process_exceeding_memory_limit(self):
+        limits = ResourceLimits(memory=256 * 1024 * 1024)
+        proc = self.start(limits, 'data = "x" * (512 * 1024 * 1024)')
+
+        with self.assertRaises(BuildLimitExceeded) as cm:
+            limits.communicate(proc)
+
+        self.assertEqual(
+            'The TeX process exceeded the memory limit of 268435456 bytes.',
+            str(cm.exception))
+
+    def test_process_failing_within_memory_limit(self):
+        limits = ResourceLimits(memory=256 * 1024 * 1024)
+        proc = self.start(limits, 'import sys; '
+                          'sys.stdout.write("! Undefined control sequence."); '
+                          'sys.exit(1)')
+
+        self.assertEqual((1, '! Undefined control sequence.', ''),
+                         limits.communicate(proc))
@@ -0,0 +1,273 @@
+# pylint: disable=W0212
+# W0212: Access to a protected member of a client class
+
+from ftw.pdfgenerator.builder import Builder
+from ftw.pdfgenerator.formatcache import FormatCache
+from ftw.pdfgenerator.interfaces import IBuilder, IBuilderFactory
+from ftw.pdfgenerator.pool import BuilderPool, PooledBuilder, WarmProcess
+from ftw.pdfgenerator.testing import PREDEFINED_BUILD_DIRECTORY_LAYER
+from mock import Mock
+from mock import patch
+from unittest import TestCase
+from zope.interface.verify import verifyClass, verifyObject
+import os
+import sys
+import tempfile
+
+
+class EchoProcess(WarmProcess):
+    """Echoes the job read from stdin instead of running pdflatex.
+    """
+
+    def _get_arguments(self):
+        return [sys.executable, '-c',
+                'import sys; sys.stdout.write("job: " + sys.stdin.read())']
+
+
+class SleepingProcess(WarmProcess):
+
+    def _get_arguments(self):
+        return [sys.executable, '-c', 'import time; time.sleep(60)']
+
+
+class TestWarmProcess(TestCase):
+
+    layer = PREDEFINED_BUILD_DIRECTORY_LAYER
+
+    def setUp(self):
+        self.builddir = self.layer.builddir
+
+    def test_accepts_only_the_same_command_with_a_document(self):
+        process = EchoProcess('pdflatex --interaction=nonstopmode',
+                              self.builddir)
+        self.addCleanup(process.kill)
+
+        self.assertTrue(process.accepts(
+                'pdflatex --interaction=nonstopmode /tmp/export.tex'))
+        self.assertFalse(process.accepts(
+                'pdflatex --interaction=nonstopmode -fmt=foo export.tex'))
+        self.assertFalse(process.accepts('makeindex -g -s umlaut.ist export'))
+
+    def test_run_passes_document_relative_to_build_directory(self):
+        process = EchoProcess('pdflatex --interaction=nonstopmode',
+                              self.builddir)
+        latex_path = os.path.join(self.builddir, 'export.tex')
+
+        self.assertEqual(
+            (0, 'job: \\input export.tex\n', ''),
+            process.run('pdflatex --interaction=nonstopmode %s' % latex_path))
+
+    def test_run_enables_draft_mode_in_job(self):
+        process = EchoProcess('pdflatex --interaction=nonstopmode',
+                              self.builddir)
+        self.assertTrue(process.accepts(
+                'pdflatex --interaction=nonstopmode -draftmode export.tex'))
+
+        self.assertEqual(
+            (0, 'job: \\pdfdraftmode=1 \\input export.tex\n', ''),
+            process.run(
+                'pdflatex --interaction=nonstopmode -draftmode export.tex'))
+
+    def test_arguments_wait_for_job_in_errorstop_mode(self):
+        process = SleepingProcess('pdflatex --interaction=nonstopmode -fmt=f',
+                                  self.builddir)
+        self.addCleanup(process.kill)
+        arguments = WarmProcess._get_arguments(process)
+
+        self.assertEqual(['pdflatex', '-fmt=f'], arguments[:2])
+        self.assertIn(r'\read16', arguments[2])
+        self.assertIn(r'\nonstopmode', arguments[2])
+
+    def test_health_check(self):
+        process = SleepingProcess('pdflatex', self.builddir)
+        self.assertTrue(process.is_healthy())
+        self.assertTrue(process.is_healthy(max_age=60))
+
+        process.created -= 120
+        self.assertFalse(process.is_healthy(max_age=60))
+
+        process.kill()
+        self.assertFalse(process.is_healthy())
+
+
+class TestBuilderPool(TestCase):
+
+    layer = PREDEFINED_BUILD_DIRECTORY_LAYER
+
+    def setUp(self):
+        self.directories = []
+        self.layer.config.get_build_directory.side_effect = \
+            self.get_build_directory
+
+    def tearDown(self):
+        self.layer.config.get_build_directory.side_effect = None
+
+    def get_build_directory(self):
+        path = tempfile.mkdtemp('test-builder-pool')
+        self.directories.append(path)
+        return path
+
+    def create_pool(self, **kwargs):
+        pool = BuilderPool(**kwargs)
+        pool.process_class = EchoProcess
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_pool_is_a_builder_factory(self):
+        verifyClass(IBuilderFactory, BuilderPool)
+
+    def test_pool_returns_pooled_builders(self):
+        pool = self.create_pool(size=1)
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+
+        self.assertTrue(isinstance(builder, PooledBuilder))
+        self.assertTrue(isinstance(builder, Builder))
+        verifyObject(IBuilder, builder)
+
+    def test_pool_keeps_warm_processes_with_own_build_directories(self):
+        pool = self.create_pool(size=2)
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+
+        self.assertEqual(2, len(pool._processes))
+        directories = [processes[0].cwd for processes in pool._processes]
+        self.assertNotIn(builder.build_directory, directories)
+        self.assertEqual(3, len(set(directories + [builder.build_directory])))
+
+    def test_unhealthy_processes_are_recycled(self):
+        pool = self.create_pool(size=1, max_age=60)
+        pool()._cleanup_build()
+
+        stale = pool._processes[0][0]
+        stale.created -= 120
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+
+        self.assertNotEqual(stale.cwd, builder.build_directory)
+        self.assertNotIn([stale], pool._processes)
+        self.assertFalse(os.path.exists(stale.cwd))
+
+    def test_shutdown_removes_idle_processes(self):
+        pool = self.create_pool(size=2)
+        pool()._cleanup_build()
+        processes = [process for group in pool._processes
+                     for process in group]
+
+        pool.shutdown()
+        self.assertEqual([], pool._processes)
+        for process in processes:
+            self.assertFalse(process.is_healthy())
+            self.assertFalse(os.path.exists(process.cwd))
+
+    def test_pdflatex_passes_run_in_warm_processes(self):
+        pool = self.create_pool(size=0)
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+        latex_path = os.path.join(builder.build_directory, 'export.tex')
+        cmd = 'pdflatex --interaction=nonstopmode -draftmode %s' % latex_path
+        job = 'job: \\pdfdraftmode=1 \\input export.tex\n'
+
+        first_processes = builder._processes
+        self.assertEqual((0, job, ''), builder._execute(cmd))
+
+        # the process for the next pass is started while running a pass
+        self.assertEqual(1, len(builder._processes))
+        self.assertNotIn(builder._processes[0], first_processes)
+        self.assertTrue(builder._processes[0].accepts(cmd))
+
+        # other commands do not consume the warm process
+        second_processes = builder._processes[:]
+        self.assertEqual((0, '', ''), builder._execute('true'))
+        self.assertEqual(second_processes, builder._processes)
+
+        self.assertEqual((0, job, ''), builder._execute(cmd))
+
+    def test_final_pass_does_not_start_a_process(self):
+        pool = self.create_pool(size=0)
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+        latex_path = os.path.join(builder.build_directory, 'export.tex')
+
+        # no further pass is expected after a pass not in draft mode
+        self.assertEqual((0, 'job: \\input export.tex\n', ''),
+                         builder._execute('pdflatex --interaction=nonstopmode'
+                                          ' %s' % latex_path))
+        self.assertEqual([], builder._processes)
+
+    def create_format(self, key):
+        path = os.path.join(self.get_build_directory(), key + '.fmt')
+        with open(path, 'w') as file_:
+            file_.write(key)
+        return path
+
+    def get_commands(self, processes):
+        return [process.command for process in processes]
+
+    def test_processes_are_started_with_the_used_formats(self):
+        pool = self.create_pool(size=1, max_formats=2)
+        pool()._cleanup_build()
+        idle_directory = pool._processes[0][0].cwd
+
+        pool.use_format('a', self.create_format('a'))
+        pool.use_format('b', self.create_format('b'))
+        self.assertEqual(
+            ['pdflatex --interaction=nonstopmode -fmt=a',
+             'pdflatex --interaction=nonstopmode -fmt=b'],
+            self.get_commands(pool._processes[0]))
+        # the idle build directory is kept
+        self.assertEqual(idle_directory, pool._processes[0][0].cwd)
+
+        builder = pool()
+        self.addCleanup(builder.cleanup)
+        with open(os.path.join(builder.build_directory, 'b.fmt')) as file_:
+            self.assertEqual('b', file_.read())
+
+        # the pass is run by the process with the format, the process with
+        # the other format is killed
+        other, accepting = builder._processes
+        cmd = 'pdflatex --interaction=nonstopmode -fmt=b export.tex'
+        self.assertEqual((0, 'job: \\input export.tex\n', ''),
+                         builder._execute(cmd))
+        self.assertFalse(other.is_healthy())
+        self.assertEqual([], builder._processes)
+
+    def test_least_recently_used_formats_are_replaced(self):
+        pool = self.create_pool(size=1, max_formats=2)
+        pool.use_format('a', self.create_format('a'))
+        pool.use_format('b', self.create_format('b'))
+        pool()._cleanup_build()
+
+        pool.use_format('a', self.create_format('a'))
+        pool.use_format('c', self.create_format('c'))
+        self.assertEqual(
+            ['pdflatex --interaction=nonstopmode -fmt=a',
+             'pdflatex --interaction=nonstopmode -fmt=c'],
+            self.get_commands(pool._processes[0]))
+
+    def test_evicted_formats_are_not_used(self):
+        pool = self.create_pool(size=1)
+        path = self.create_format('a')
+        pool.use_format('a', path)
+
+        # the format was evicted from the format cache
+        os.remove(path)
+        pool()._cleanup_build()
+        self.assertEqual({}, dict(pool._formats))
+        self.assertEqual(['pdflatex --interaction=nonstopmode'],
+                         self.get_commands(pool._processes[0]))
+
+    def test_builder_reports_the_used_format_to_the_pool(self):
+        cache = FormatCache(self.get_build_directory(), 1024)
+        cache.store('key', self.create_format('key'))
+
+        builder = self.create_pool(size=0)()
+        self.addCleanup(builder.cleanup)
+        builder._format_cache = cache
+        builder.pool = Mock()
+
+        with patch.object(Builder, '_prepare_format', return_value='key'):
+            self.assertEqual('key', builder._prepare_format('latex'))
+
+        builder.pool.use_format.assert_called_with(
+            'key', os.path.join(cache.directory, 'key.fmt'))
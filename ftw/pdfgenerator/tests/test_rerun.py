@@ -0,0 +1,87 @@
+from ftw.pdfgenerator.rerun import FIRST_PASS, RerunChecker
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+
+class TestRerunChecker(TestCase):
+
+    def setUp(self):
+        self.builddir = tempfile.mkdtemp('test-rerun')
+        self.checker = RerunChecker(self.builddir)
+
+    def tearDown(self):
+        shutil.rmtree(self.builddir)
+
+    def write(self, filename, data):
+        with open(os.path.join(self.builddir, filename), 'w+') as file_:
+            file_.write(data)
+
+    def test_first_pass_is_always_required(self):
+        self.assertEqual(FIRST_PASS, self.checker.rerun_required())
+        self.assertEqual({}, self.checker.aux_digests)
+
+    def test_no_rerun_when_nothing_changed(self):
+        self.write('export.aux', '\\relax')
+        self.checker.rerun_required()
+        self.assertEqual(None, self.checker.rerun_required())
+
+    def test_rerun_when_aux_files_changed(self):
+        self.checker.rerun_required()
+        self.write('export.aux', '\\relax')
+        self.write('chapter.aux', '\\relax')
+        self.assertEqual('chapter.aux, export.aux changed',
+                         self.checker.rerun_required())
+
+        self.write('chapter.aux', '\\newlabel{foo}{{1}{1}}')
+        self.assertEqual('chapter.aux changed', self.checker.rerun_required())
+
+    def test_reset_starts_new_series(self):
+        self.checker.rerun_required()
+        self.checker.reset()
+        self.assertEqual(FIRST_PASS, self.checker.rerun_required())
+
+    def test_rerun_when_requested_on_stdout(self):
+        self.checker.rerun_required()
+        self.assertEqual(
+            'rerun requested on stdout',
+            self.checker.rerun_required('Rerun to get it better'))
+
+    def test_rerun_for_warnings_in_log(self):
+        warnings = (
+            ('LaTeX Warning: Label(s) may have changed. Rerun to get '
+             'cross-references right.',
+             'labels may have changed'),
+            ('LaTeX Warning: Citation(s) may have changed.',
+             'citations may have changed'),
+            ('Package longtable Warning: Table widths have changed. '
+             'Rerun LaTeX.',
+             'longtable widths have changed'),
+            ("Package rerunfilecheck Warning: File `export.out' has changed.",
+             'file export.out has changed'),
+            ('Package natbib Warning: Citation(s) may have changed. Rerun.',
+             'package natbib requested a rerun'),
+            )
+
+        self.checker.rerun_required()
+        for line, reason in warnings:
+            self.write('export.log', 'Some output\n%s\nmore output\n' % line)
+            self.assertEqual(reason, self.checker.rerun_required())
+
+    def test_log_lines_wrapped_by_tex_are_joined(self):
+        line = ('Package longtable Warning: Table widths have changed. '
+                'Rerun LaTeX.')
+        self.write('export.log', 'Some output\n%s\n%s\n' % (
+                ('x' * 60) + line[:19], line[19:]))
+
+        self.checker.rerun_required()
+        self.assertEqual('longtable widths have changed',
+                         self.checker.rerun_required())
+
+    def test_no_rerun_for_unrelated_warnings(self):
+        self.write('export.log',
+                   'LaTeX Warning: There were undefined references.\n'
+                   'Overfull \\hbox (1.2pt too wide) in paragraph\n')
+        self.checker.rerun_required()
+        self.assertEqual(None, self.checker.rerun_required())
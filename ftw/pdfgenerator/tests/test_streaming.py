@@ -0,0 +1,52 @@
+from ftw.pdfgenerator.streaming import BuildStreamIterator
+from StringIO import StringIO
+from unittest import TestCase
+from zope.interface.verify import verifyObject
+from ZPublisher.Iterators import IStreamIterator
+import os
+import tempfile
+
+
+class TestBuildStreamIterator(TestCase):
+
+    def test_implements_stream_iterator(self):
+        stream = BuildStreamIterator(StringIO('data'))
+        self.assertTrue(IStreamIterator.providedBy(stream))
+        verifyObject(IStreamIterator, stream)
+
+    def test_streams_in_chunks(self):
+        stream = BuildStreamIterator(StringIO('abcdefg'), streamsize=3)
+        self.assertEqual(7, len(stream))
+        self.assertEqual(['abc', 'def', 'g'], list(stream))
+
+    def test_cleanup_when_consumed(self):
+        cleanups = []
+        stream = BuildStreamIterator(StringIO('data'),
+                                     cleanup=lambda: cleanups.append(True))
+        self.assertEqual('data', stream.next())
+        self.assertEqual([], cleanups)
+
+        with self.assertRaises(StopIteration):
+            stream.next()
+        self.assertEqual([True], cleanups)
+
+        stream.close()
+        self.assertEqual([True], cleanups)
+
+    def test_cleanup_when_closed(self):
+        cleanups = []
+        stream = BuildStreamIterator(StringIO('data'),
+                                     cleanup=lambda: cleanups.append(True))
+        stream.close()
+        self.assertEqual([True], cleanups)
+
+    def test_from_path(self):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(fd, 'the pdf')
+        os.close(fd)
+
+        stream = BuildStreamIterator.from_path(path)
+        self.assertEqual(7, len(stream))
+        self.assertEqual('the pdf', stream.read())
+        stream.close()
@@ -34,33 +34,35 @@ def baseclasses(cls, bases=None):
     return bases
 
 
-def decode_htmlentities(string):
-    """
-    Decodes html entities and xml entities.
-    """
+# e.g. Matches named "&auml;", numeric "&#13;" and hexadecimal "&#xE4;" entities
+ENTITY_EXPRESSION = re.compile(
+    r'\\?&\\?(#?)(\d{1,5}|\w{1,8}|x[\w\d]{1,5});')
 
-    # e.g. Matches named "&auml;", numeric "&#13;" and hexadecimal "&#xE4;" entities
-    entity_re = re.compile("\\\?&\\\?(#?)(\d{1,5}|\w{1,8}|x[\w\d]{1,5});")
+# The characters of the named entities.
+ENTITY_CHARACTERS = dict((name, unichr(cp)) for name, cp in n2cp.items())
 
-    def substitute_entity(match):
-        ent = match.group(2)
 
-        if match.group(1) == "#":
-            if ent.startswith('x'):
-                ent = int('0%s' % ent, 16)  # hex to decimal
+def decode_htmlentity(match):
+    """
+    Decodes the entity matched by `ENTITY_EXPRESSION`. Unknown named
+    entities are returned unchanged.
+    """
+    ent = match.group(2)
 
-            return unichr(int(ent))
+    if match.group(1) == "#":
+        if ent.startswith('x'):
+            ent = int('0%s' % ent, 16)  # hex to decimal
 
-        else:
-            cp = n2cp.get(ent)
+        return unichr(int(ent))
 
-            if cp:
-                return unichr(cp)
+    return ENTITY_CHARACTERS.get(ent, match.group())
 
-            else:
-                return match.group()
 
-    return entity_re.subn(substitute_entity, string)[0]
+def decode_htmlentities(string):
+    """
+    Decodes html entities and xml entities.
+    """
+    return ENTITY_EXPRESSION.sub(decode_htmlentity, string)
 
 
 def encode_htmlentities(string, encoding='utf-8'):
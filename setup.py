@@ -4,6 +4,7 @@ import os
 version = '1.6.12.dev0'
 
 tests_require = [
+    'lxml',
     'mock',
     'ftw.testing',
     'ftw.testbrowser',
@@ -63,10 +64,12 @@ setup(name='ftw.pdfgenerator',
 
         'Mako',
         'BeautifulSoup!=4.0b',
+        'futures',
         # -*- Extra requirements: -*-
         ],
       tests_require=tests_require,
-      extras_require=dict(tests=tests_require),
+      extras_require=dict(tests=tests_require,
+                          lxml=['lxml']),
 
       entry_points="""
       # -*- Entry points: -*-